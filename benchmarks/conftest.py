@@ -0,0 +1,112 @@
+"""Fixtures of the benchmarks: synthetic paste trees and fake X tools.
+
+The fake ``rofi``, ``xsel`` and ``xdotool`` of the ``fakes`` folder are put
+first on the PATH. They record what they receive in $FAKE_X_STATE and answer
+deterministically, so the benchmarks need no X server. FAKE_XDOTOOL_DELAY
+adds the latency of a real ``xdotool getactivewindow``, in seconds.
+
+The sizes of the generated trees can be chosen with the
+ROFIPASTE_BENCHMARK_SIZES environment variable, e.g. ``100,1000``.
+"""
+
+import os
+
+import pytest
+
+from tests.isolation import isolate
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fakes_folder = os.path.join(root, 'benchmarks', 'fakes')
+
+sizes = [
+    int(size) for size in os.environ.get('ROFIPASTE_BENCHMARK_SIZES',
+                                         '100,1000,10000,100000').split(',')
+]
+
+extensions = ['py', 'sh', 'md', 'txt', 'html', 'c', '']
+
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        metafunc.parametrize('size', sizes)
+
+
+def write_entry(path, i):
+    if i % 20 == 0:
+        content = f'#!/bin/sh\necho entry {i}\n'
+    else:
+        content = f'entry {i}\n' + 'some text to paste\n' * (i % 7)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def make_tree(folder, entries, depth=0, per_folder=50):
+    """Create a paste tree of entries files.
+
+    With depth 0, all the entries are in folder. Otherwise they are spread in
+    folders of per_folder entries, nested depth levels deep.
+    """
+    os.makedirs(folder)
+    for i in range(entries):
+        name = f'entry_{i}'
+        extension = extensions[i % len(extensions)]
+        if extension:
+            name += '.' + extension
+
+        if depth:
+            leaf = i // per_folder
+            parts = [f'folder_{leaf % (8 ** (level + 1)) // 8 ** level}'
+                     for level in range(depth)]
+            subfolder = os.path.join(folder, *parts, f'leaf_{leaf}')
+            os.makedirs(subfolder, exist_ok=True)
+            write_entry(os.path.join(subfolder, name), i)
+        else:
+            write_entry(os.path.join(folder, name), i)
+    return folder
+
+
+@pytest.fixture(scope='session')
+def paste_trees(tmp_path_factory):
+    """Return a function creating a paste tree once per session."""
+    trees = {}
+
+    def paste_tree(entries, depth=0):
+        key = (entries, depth)
+        if key not in trees:
+            folder = tmp_path_factory.mktemp('pastes') / f'{entries}_{depth}'
+            trees[key] = make_tree(str(folder), entries, depth)
+        return trees[key]
+
+    return paste_tree
+
+
+@pytest.fixture
+def fake_x(tmp_path, monkeypatch):
+    """Put the fake X tools on the PATH, return their state folder."""
+    state = tmp_path / 'fake_x'
+    state.mkdir()
+    monkeypatch.setenv('PATH', f'{fakes_folder}:{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_X_STATE', str(state))
+    monkeypatch.delenv('DISPLAY', raising=False)
+    return state
+
+
+@pytest.fixture
+def isolated(tmp_path, monkeypatch, fake_x):
+    """Keep the caches, the usage store and the config in tmp_path."""
+    from rofipaste import clipboard
+    isolate(monkeypatch, tmp_path)
+    monkeypatch.setattr(clipboard, 'backend_name', 'xsel')
+    monkeypatch.setattr(clipboard, '_backend', None)
+    return fake_x
+
+
+@pytest.fixture
+def env(tmp_path, fake_x):
+    """Environment of a rofipaste process isolated in tmp_path."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root
+    for variable in ('XDG_CONFIG_HOME', 'XDG_DATA_HOME', 'XDG_CACHE_HOME',
+                     'XDG_STATE_HOME', 'XDG_RUNTIME_DIR'):
+        env[variable] = str(tmp_path / variable.lower())
+    return env
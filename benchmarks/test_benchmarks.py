@@ -0,0 +1,140 @@
+"""Benchmarks of `rofipaste`, run with ``make benchmark``.
+
+The results are saved in .benchmarks/ and ``make benchmark-compare`` fails
+when the mean time of a benchmark regresses compared to the last saved run.
+"""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from rofipaste import cli, rofipaste  # noqa: E402
+
+
+def test_read_folder_content(benchmark, isolated, paste_trees, size):
+    folder = paste_trees(size)
+    # The first menu builds the folder index
+    rofipaste.read_folder_content(folder)
+    content = benchmark(rofipaste.read_folder_content, folder)
+    assert content.count('\n') == size + 1
+
+
+def test_read_folder_content_cold(benchmark, isolated, paste_trees, size):
+    from rofipaste import index
+    folder = paste_trees(size)
+
+    def cold():
+        index._indexes.clear()
+        for name in os.listdir(index.cache_folder):
+            os.unlink(os.path.join(index.cache_folder, name))
+        return rofipaste.read_folder_content(folder)
+
+    rofipaste.read_folder_content(folder)
+    benchmark(cold)
+
+
+def test_first_rows_cold(benchmark, isolated, paste_trees, size):
+    from rofipaste import index
+    folder = paste_trees(size)
+
+    def first_rows():
+        index._indexes.clear()
+        for name in os.listdir(index.cache_folder):
+            os.unlink(os.path.join(index.cache_folder, name))
+        # What rofi shows first, before the folder is fully scanned
+        rows = rofipaste.iter_folder_content(folder)
+        return [next(rows) for _ in range(rofipaste.async_pre_read)]
+
+    rofipaste.read_folder_content(folder)
+    benchmark(first_rows)
+
+
+def test_read_folder_content_packed(benchmark, isolated, paste_trees, size):
+    from rofipaste import index, pack
+    folder = paste_trees(size)
+    pack.build(folder, rofipaste.paste_icon_dict)
+
+    def cold():
+        index._indexes.clear()
+        pack.current = index.bundle = None
+        pack.load(folder, rofipaste.paste_icon_dict)
+        return rofipaste.read_folder_content(folder)
+
+    content = benchmark(cold)
+    assert content.count('\n') == size + 1
+
+
+def test_read_tree_content(benchmark, isolated, paste_trees, size):
+    folder = paste_trees(size, depth=3)
+    rofipaste.read_tree_content(folder)
+    content = benchmark(rofipaste.read_tree_content, folder)
+    assert content.count('\n') == size + 1
+
+
+def test_search_entries(benchmark, isolated, paste_trees, size):
+    folder = paste_trees(size, depth=3)
+    # The first search indexes every entry
+    rofipaste.search_entries(folder, ['entry'])
+    results = benchmark(rofipaste.search_entries, folder, ['entry', '7'])
+    assert results
+
+
+@pytest.mark.parametrize('lines', [1, 1000, 100000])
+def test_file_interpreter_static(benchmark, isolated, tmp_path, lines):
+    entry = tmp_path / 'entry.txt'
+    entry.write_text('some text to paste\n' * lines)
+    benchmark(rofipaste.read_entry_data, str(entry))
+
+
+def test_file_interpreter_exec(benchmark, isolated, tmp_path):
+    entry = tmp_path / 'entry'
+    entry.write_text('#!/bin/sh\necho executed\n')
+    assert benchmark(rofipaste.fileInterpreter, str(entry)) == 'executed'
+
+
+def test_file_interpreter_plugin(benchmark, isolated, tmp_path):
+    from rofipaste import plugins
+    entry = tmp_path / 'entry.rpy'
+    entry.write_text('def render():\n    return "rendered"\n')
+
+    def cold():
+        # Like a new process: the code comes from the cache folder
+        plugins._modules.clear()
+        return rofipaste.fileInterpreter(str(entry))
+
+    assert benchmark(cold) == 'rendered'
+
+
+@pytest.mark.parametrize('length', [1000, 1000000])
+def test_copy_paste_characters(benchmark, isolated, length):
+    characters = 'x' * length
+    isolated.joinpath('clipboard').write_text('previous')
+    benchmark(rofipaste.copy_paste_characters, characters, '42')
+    assert isolated.joinpath('clipboard').read_text() == 'previous'
+
+
+def test_type_characters(benchmark, isolated):
+    characters = 'some text to type\n' * 100
+    benchmark(rofipaste.type_characters, characters, '42')
+
+
+def test_cli_main(benchmark, isolated, paste_trees, size):
+    folder = paste_trees(size)
+    assert cli.main(['-f', folder, '--sort', 'none']) == 0
+    benchmark(cli.main, ['-f', folder, '--sort', 'none'])
+    assert isolated.joinpath('typed').read_text()
+
+
+def test_cli_process(benchmark, env, paste_trees):
+    folder = paste_trees(1000)
+    args = [
+        sys.executable, '-c',
+        'import sys; from rofipaste.cli import main; sys.exit(main())', '-f',
+        folder
+    ]
+    subprocess.run(args, env=env, check=True)
+    benchmark(subprocess.run, args, env=env, check=True)
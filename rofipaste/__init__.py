@@ -6,9 +6,18 @@ __version__ = '0.1.8'
 
 
 def get_clipboard_content() -> str:
-    from subprocess import run
+    from rofipaste.clipboard import get_backend
 
-    stdout: str = run(args=['xsel', '-o', '-b'],
-                      capture_output=True,
-                      encoding='utf-8').stdout
-    return stdout
+    return get_backend().get('CLIPBOARD')
+
+
+# The Python API (see rofipaste.api), imported on first use
+api_names = ('get', 'get_many', 'get_batch', 'list_entries', 'EntryNotFound')
+
+
+def __getattr__(name: str):
+    if name in api_names:
+        from rofipaste import api
+
+        return getattr(api, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
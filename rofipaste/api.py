@@ -0,0 +1,206 @@
+"""Python API: read the paste entries without rofi.
+
+The entries are named by their path relative to the paste folder, with or
+without their extension, like in the flat menu: ``sub/letter.md`` or
+``sub/letter``. The same functions back ``rofipaste get`` and
+``rofipaste list``, and are available from the package::
+
+    import rofipaste
+    rofipaste.get('signature')
+"""
+from __future__ import annotations
+
+import os
+from rofipaste import config, index, pack, rofipaste
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+
+
+class EntryNotFound(LookupError):
+    """EntryNotFound.
+
+    No entry of the paste folder has the given name
+    """
+
+
+def get_folder(folder: Optional[str] = None) -> str:
+    """get_folder.
+
+    Return the paste folder: the given one, or the one of the config file.
+    Its bundle is loaded if it was packed
+
+    :param folder: Folder given like the --files option
+    :type folder: Optional[str]
+    :rtype: str
+    """
+
+    folder_path = config.get_paste_folder(folder)
+    if pack.enabled:
+        pack.load(folder_path, rofipaste.paste_icon_dict)
+    return folder_path
+
+
+def resolve(name: str, folder: Optional[str] = None) -> str:
+    """resolve.
+
+    Return the path of an entry
+
+    :param name: Entry's path relative to the paste folder, the extension
+        can be left out
+    :type name: str
+    :param folder: Paste folder, defaults to the one of the config file
+    :type folder: Optional[str]
+    :raises EntryNotFound: if there is no such entry
+    :rtype: str
+    """
+
+    return find_entry(name, get_folder(folder))
+
+
+def find_entry(name: str, folder_path: str) -> str:
+    """find_entry.
+
+    Return the path of an entry of a paste folder, looked up in the index of
+    its folder
+
+    :param name: Entry's path relative to the paste folder
+    :type name: str
+    :param folder_path: Path of the paste folder
+    :type folder_path: str
+    :raises EntryNotFound: if there is no such entry
+    :rtype: str
+    """
+
+    relative = os.path.normpath(name)
+    if os.path.isabs(relative) or relative.split(os.sep)[0] in ('..', '.'):
+        raise EntryNotFound(name)
+
+    dirname, basename = os.path.split(relative)
+    entries_folder = os.path.join(folder_path, dirname)
+    try:
+        entries = index.get_folder_index(
+            entries_folder, rofipaste.paste_icon_dict).get_entries()
+    except OSError:
+        raise EntryNotFound(name) from None
+
+    files = [entry for entry in entries if not entry.is_dir]
+    for entry in files:
+        if entry.filename == basename:
+            return os.path.join(entries_folder, entry.filename)
+    # Without its extension
+    for entry in files:
+        if entry.filename.split('.')[0] == basename:
+            return os.path.join(entries_folder, entry.filename)
+    raise EntryNotFound(name)
+
+
+def get(name: str,
+        folder: Optional[str] = None,
+        use_cache: bool = True) -> str:
+    """get.
+
+    Return the text of an entry: its content, or its output if it is
+    executable
+
+    :param name: Entry's path relative to the paste folder, the extension
+        can be left out
+    :type name: str
+    :param folder: Paste folder, defaults to the one of the config file
+    :type folder: Optional[str]
+    :param use_cache: Reuse the cached output of an executable entry
+    :type use_cache: bool
+    :raises EntryNotFound: if there is no such entry
+    :raises TimeoutExpired: if an executable entry runs for too long
+    :rtype: str
+    """
+
+    return get_many([name], folder, use_cache)[0]
+
+
+def get_many(names: List[str],
+             folder: Optional[str] = None,
+             use_cache: bool = True) -> List[str]:
+    """get_many.
+
+    Return the texts of several entries, the executable ones running
+    concurrently
+
+    :param names: Entries' paths relative to the paste folder
+    :type names: List[str]
+    :param folder: Paste folder, defaults to the one of the config file
+    :type folder: Optional[str]
+    :param use_cache: Reuse the cached outputs of the executable entries
+    :type use_cache: bool
+    :raises EntryNotFound: if one of the entries does not exist
+    :raises TimeoutExpired: if an executable entry runs for too long
+    :rtype: List[str]
+    """
+
+    folder_path = get_folder(folder)
+    paths = [find_entry(name, folder_path) for name in names]
+    return [
+        data if isinstance(data, str) else str(data, 'utf-8', 'replace')
+        for data in rofipaste.read_entries_data(paths, use_cache)
+    ]
+
+
+def get_batch(names: List[str],
+              folder: Optional[str] = None,
+              use_cache: bool = True) -> List[Dict[str, str]]:
+    """get_batch.
+
+    Return the texts of many entries, the executable ones running
+    concurrently. Unlike get_many, an entry which fails does not stop the
+    others
+
+    :param names: Entries' paths relative to the paste folder
+    :type names: List[str]
+    :param folder: Paste folder, defaults to the one of the config file
+    :type folder: Optional[str]
+    :param use_cache: Reuse the cached outputs of the executable entries
+    :type use_cache: bool
+    :rtype: List[Dict[str, str]]
+    :return: For each name, {'text': ...} or {'error': ...}
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from subprocess import TimeoutExpired
+
+    folder_path = get_folder(folder)
+
+    def read(name: str) -> Dict[str, str]:
+        try:
+            data = rofipaste.read_entry_data(find_entry(name, folder_path),
+                                             use_cache)
+        except EntryNotFound:
+            return {'error': 'not found'}
+        except TimeoutExpired as error:
+            return {'error': f'timed out after {error.timeout:g} seconds'}
+        except (OSError, rofipaste.plugins.PluginError) as error:
+            return {'error': str(error)}
+        assert data is not None
+        if isinstance(data, str):
+            return {'text': data}
+        return {'text': str(data, 'utf-8', 'replace')}
+
+    with ThreadPoolExecutor(max_workers=min(len(names), 16) or 1) as executor:
+        return list(executor.map(read, names))
+
+
+def list_entries(folder: Optional[str] = None) -> List[str]:
+    """list_entries.
+
+    Return the names of all the entries, with their extension, sorted
+
+    :param folder: Paste folder, defaults to the one of the config file
+    :type folder: Optional[str]
+    :rtype: List[str]
+    """
+
+    folder_path = get_folder(folder)
+    if not os.path.isdir(folder_path):
+        return []
+    return sorted(prefix + entry.filename
+                  for prefix, entry in rofipaste.walk_tree(folder_path))
@@ -1,116 +1,497 @@
 """Console script for rofipaste."""
+from __future__ import annotations
+
 import sys
 import os
-from xdg import BaseDirectory
-import click
-import click_config_file
-from pathlib import Path
-from rofipaste import rofipaste, __version__
+from itertools import chain, islice
+from rofipaste import rofipaste, config, recent, __version__
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Command line options, given to click when it is needed (help, errors, ...)
+# and parsed without it on the common path
+options: List[Tuple[Tuple[str, ...], Dict[str, Any]]] = [
+    (('--version', ),
+     dict(default=False, help='Print the current version', is_flag=True)),
+    (('--edit-config', ),
+     dict(default=False,
+          help='Open your default terminal editor to edit your config file',
+          is_flag=True)),
+    (('--edit-entry', ),
+     dict(default=False,
+          help='Open your default terminal editor to edit one of your paste '
+          'entry (or create a new one)',
+          is_flag=True)),
+    (('-p', '--insert-with-clipboard'),
+     dict(default=False,
+          help='Do not type the characters directly, but copy it to the '
+          'clipboard, insert it from there and then restore the clipboard\'s '
+          'original value',
+          is_flag=True)),
+    (('-c', '--copy-only'),
+     dict(default=False,
+          help='Only copy the characters to the clipboard but do not insert '
+          'it',
+          is_flag=True)),
+    (('-f', '--files'),
+     dict(default='pastes_folder', help='Read pastes from this directory')),
+    (('-r', '--prompt'),
+     dict(default='Rofipaste ❤ ', help='Set rofipaste\'s  prompt')),
+    (('--rofi-args', ),
+     dict(default='', help='A string of arguments to give to rofi')),
+    (('-e', '--editor'),
+     dict(default='', help='path to your favorite editor')),
+    (('--daemon', ),
+     dict(default=False,
+          help='Stay in the background and open the menu when '
+          'rofipaste-client is called',
+          is_flag=True)),
+    (('--prefetch', ),
+     dict(default=False,
+          help='Start running the executable entries marked with the '
+          'prefetch option while the menu is open',
+          is_flag=True)),
+    (('--clipboard-backend', ),
+     dict(default='auto',
+          help='How to access the clipboard: xlib (needs python-xlib), xsel '
+          'or auto')),
+    (('--flat', ),
+     dict(default=False,
+          help='List the entries of all the subfolders in a single menu',
+          is_flag=True)),
+    (('--multi-select', ),
+     dict(default=False,
+          help='Select several entries with Shift+Enter and paste them all '
+          'at once (not with --script-mode)',
+          is_flag=True)),
+    (('--separator', ),
+     dict(default='\\n',
+          help='Inserted between the entries pasted at once, \\n and \\t '
+          'stand for a new line and a tab')),
+    (('--script-mode', ),
+     dict(default=False,
+          help='Browse the folders inside a single rofi window, using rofi\'s '
+          'script mode (needs rofi 1.7 or later)',
+          is_flag=True)),
+    (('--type-delay', ),
+     dict(default=12,
+          type=int,
+          help='Delay between two typed characters, in milliseconds')),
+    (('--clipboard-threshold', ),
+     dict(default=4096,
+          type=int,
+          help='Insert the texts longer than this number of characters '
+          'through the clipboard instead of typing them (0 to always type)')),
+    (('--exec-timeout', ),
+     dict(default=30.0,
+          type=float,
+          help='Kill the executable entries running for longer than this '
+          'number of seconds')),
+    (('--trace', ),
+     dict(default=False,
+          help='Record the time spent in each stage of the run, see '
+          'rofipaste stats',
+          is_flag=True)),
+    (('--sort', ),
+     dict(default='frecency',
+          help='Order of the entries: frecency (the most often and recently '
+          'used first) or none (by name)')),
+]
+
+
+def option_name(declarations: Tuple[str, ...]) -> str:
+    return declarations[-1].lstrip('-').replace('-', '_')
 
-config_file_name: str = rofipaste.config_file_name
 
-default_config = """##################################
-##     Default config file      ##
-## Uncomment the lines you want ##
-##################################
+def createIfNotExist(path):
+    """
+    Create a directory if it doesn't exists
+    """
+    os.makedirs(path, exist_ok=True)
 
-## Use your clipboard to copy paste things instead of just typing it (recommanded on Wayland and for non qwerty keyboards)
-# insert_with_clipboard=True                # Default: False
 
-## Just copy the 'paste' content
-# copy_only=True                            # Default: False
+def convert_value(attrs: Dict[str, Any], value: Any) -> Any:
+    """
+    Convert a value of the config file like click converts the option, raise
+    ValueError if it is not valid
+    """
+    if attrs.get('is_flag', False):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            text = value.strip().lower()
+            if text in ('1', 'true', 't', 'yes', 'y', 'on'):
+                return True
+            if text in ('0', 'false', 'f', 'no', 'n', 'off'):
+                return False
+        raise ValueError(value)
+
+    if value is None or isinstance(value, (list, dict)):
+        raise ValueError(value)
+    converter = attrs.get('type', str)
+    if isinstance(value, bool) and converter is not str:
+        raise ValueError(value)
+    return converter(value)
+
+
+def parse_arguments(argv: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Parse the command line without click. Return None for anything this
+    simple parser does not understand, so that click handles it
+    """
+    known = {
+        declaration:
+        (option_name(declarations), attrs.get('is_flag', False), attrs)
+        for declarations, attrs in options for declaration in declarations
+    }
+
+    arguments: Dict[str, Any] = {}
+    i = 0
+    while i < len(argv):
+        argument, value = argv[i], None
+        if argument.startswith('--') and '=' in argument:
+            argument, value = argument.split('=', 1)
+        if argument not in known:
+            return None
+
+        name, is_flag, attrs = known[argument]
+        if is_flag:
+            if value is not None:
+                return None
+            arguments[name] = True
+        else:
+            if value is None:
+                i += 1
+                if i == len(argv):
+                    return None
+                value = argv[i]
+            try:
+                arguments[name] = attrs.get('type', str)(value)
+            except ValueError:
+                return None
+        i += 1
 
-## Use a different folder than the default one for storing your pastes
-# files="/home/<my username>/my pastes"    # Default: /home/<my username>/.local/share/rofipaste/pastes_folder
+    return arguments
 
-## Use a different prompt in rofi
-# prompt="This is my custom prompt"         # Default: "Rofipaste ❤ "
 
-## Give rofi some arguments
-# rofi_args=""                              # Default: ""
+def get_command():
+    """
+    Build the click command, only imported for the help, the --config option
+    and the command line errors
+    """
+    import click
+    import click_config_file
+
+    command = run
+    for declarations, attrs in reversed(options):
+        command = click.option(*declarations, **attrs)(command)
+    command = click_config_file.configuration_option(
+        config_file_name=config.config_file_name,
+        provider=config.config_provider)(command)
+    return click.command(name='rofipaste',
+                         epilog='Other commands: ' +
+                         ', '.join(f'rofipaste {name}'
+                                   for name in subcommands))(command)
+
+
+def main(argv: Optional[List[str]] = None,
+         standalone_mode: bool = True) -> int:
+    """
+    Entry point of rofipaste
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in subcommands:
+        return subcommands[argv[0]]().main(args=argv[1:],
+                                           prog_name=f'rofipaste {argv[0]}',
+                                           standalone_mode=standalone_mode)
+
+    trace = rofipaste.trace
+    trace.begin()
+    try:
+        with trace.stage('arguments'):
+            arguments = parse_arguments(argv)
+        if arguments is None:
+            return get_command().main(args=argv,
+                                      prog_name='rofipaste',
+                                      standalone_mode=standalone_mode)
+
+        with trace.stage('config'):
+            params = {
+                option_name(declarations): attrs['default']
+                for declarations, attrs in options
+            }
+            attributes = {
+                option_name(declarations): attrs
+                for declarations, attrs in options
+            }
+            try:
+                params.update({
+                    name: convert_value(attributes[name], value)
+                    for name, value in config.read_config(
+                        config.config_file_name).items() if name in params
+                })
+            except ValueError:
+                # click reports the invalid value
+                return get_command().main(args=argv,
+                                          prog_name='rofipaste',
+                                          standalone_mode=standalone_mode)
+            params.update(arguments)
+        return run(**params)
+    finally:
+        trace.end(argv)
+
+
+def get_stats_command():
+    """
+    Build the click command of ``rofipaste stats``
+    """
+    import click
+
+    @click.command(name='stats')
+    @click.option('-n',
+                  '--last',
+                  default=1000,
+                  help='Number of recent runs to summarize')
+    def stats(last: int) -> int:
+        """
+        Print the time spent in each stage of the recent traced runs (see
+        the --trace option)
+        """
+        runs = rofipaste.trace.read(last)
+        if runs:
+            click.echo(rofipaste.trace.report(runs))
+        else:
+            click.echo(f'No traced runs in {rofipaste.trace.trace_file}, '
+                       'enable tracing with --trace or ROFIPASTE_TRACE=1')
+        return 0
 
-## Use your favorite editor
-# editor="subl"                             # This is for sublime text
-# editor="vscode"                           # Visual Studio Code
-# editor="termite -e 'nvim $FILE'"          # nvim with termite
-"""
+    return stats
 
 
-def createIfNotExist(path):
+def get_pack_command():
     """
-    Create a directory if it doesn't exists
+    Build the click command of ``rofipaste pack``
+    """
+    import click
+
+    @click.command(name='pack')
+    @click.option('-f',
+                  '--files',
+                  default=None,
+                  help='Paste folder to pack, defaults to the one of the '
+                  'config file')
+    @click.option('--remove',
+                  default=False,
+                  is_flag=True,
+                  help='Remove the bundle: the pastes are read from their '
+                  'files again')
+    def pack(files: Optional[str], remove: bool) -> int:
+        """
+        Pack the paste folder into a single file, which rofipaste then reads
+        instead of the many files of the folder. The bundle is updated when
+        the folders change
+        """
+        filesPath = config.get_paste_folder(files)
+        bundle_file = rofipaste.pack.get_bundle_file(filesPath)
+
+        if remove:
+            if os.path.exists(bundle_file):
+                os.unlink(bundle_file)
+            click.echo(f'Removed the bundle of {filesPath}')
+            return 0
+
+        if not os.path.isdir(filesPath):
+            raise click.ClickException(f'{filesPath} is not a folder')
+        entries, size = rofipaste.pack.build(filesPath,
+                                             rofipaste.paste_icon_dict)
+        click.echo(f'Packed {entries} entries of {filesPath} '
+                   f'({size / 1024:.0f} KiB) into {bundle_file}')
+        return 0
+
+    return pack
+
+
+def get_get_command():
+    """
+    Build the click command of ``rofipaste get``
+    """
+    import click
+
+    @click.command(name='get')
+    @click.option('-f',
+                  '--files',
+                  default=None,
+                  help='Paste folder, defaults to the one of the config file')
+    @click.option('--no-cache',
+                  default=False,
+                  is_flag=True,
+                  help='Run the executable entries again instead of using '
+                  'their cached output')
+    @click.option('-0',
+                  '--null',
+                  default=False,
+                  is_flag=True,
+                  help='Separate the entries with a NUL character instead '
+                  'of a new line')
+    @click.option('--batch',
+                  default=False,
+                  is_flag=True,
+                  help='Read the names from the standard input, one per '
+                  'line, and write one JSON object per name')
+    @click.argument('names', nargs=-1)
+    def get(files: Optional[str], no_cache: bool, null: bool, batch: bool,
+            names: Tuple[str, ...]) -> int:
+        """
+        Print the text of entries, the output of the executable ones, without
+        opening rofi. NAMES are paths relative to the paste folder, the
+        extension can be left out
+        """
+        from subprocess import TimeoutExpired
+        from rofipaste import api
+
+        if batch:
+            import json
+
+            names = (*names, *(line.rstrip('\n') for line in sys.stdin
+                               if line.strip()))
+            for name, result in zip(names,
+                                    api.get_batch(list(names), files,
+                                                  not no_cache)):
+                click.echo(json.dumps({'name': name, **result},
+                                      ensure_ascii=False))
+            return 0
+
+        try:
+            texts = api.get_many(list(names), files, not no_cache)
+        except api.EntryNotFound as error:
+            raise click.ClickException(f'No entry named {error}')
+        except TimeoutExpired as error:
+            raise click.ClickException(
+                f'{os.path.basename(error.cmd[-1])} did not finish within '
+                f'{error.timeout:g} seconds')
+        except rofipaste.plugins.PluginError as error:
+            raise click.ClickException(str(error))
+        for text in texts:
+            click.echo(text, nl=not null)
+            if null:
+                click.echo('\0', nl=False)
+        return 0
+
+    return get
+
+
+def get_list_command():
+    """
+    Build the click command of ``rofipaste list``
+    """
+    import click
+
+    @click.command(name='list')
+    @click.option('-f',
+                  '--files',
+                  default=None,
+                  help='Paste folder, defaults to the one of the config file')
+    def list_(files: Optional[str]) -> int:
+        """
+        Print the names of all the entries, which rofipaste get accepts
+        """
+        from rofipaste import api
+
+        for name in api.list_entries(files):
+            click.echo(name)
+        return 0
+
+    return list_
+
+
+def get_capture_command():
     """
-    Path(path).mkdir(parents=True, exist_ok=True)
-
-
-@click.command()
-@click.option('--version',
-              default=False,
-              help='Print the current version',
-              is_flag=True)
-@click.option(
-    '--edit-config',
-    default=False,
-    help='Open your default terminal editor to edit your config file',
-    is_flag=True)
-@click.option(
-    '--edit-entry',
-    default=False,
-    help=
-    'Open your default terminal editor to edit one of your paste entry (or create a new one)',
-    is_flag=True)
-@click.option(
-    '-p',
-    '--insert-with-clipboard',
-    default=False,
-    help=
-    'Do not type the characters directly, but copy it to the clipboard, insert it from '
-    'there and then restore the clipboard\'s original value',
-    is_flag=True)
-@click.option(
-    '-c',
-    '--copy-only',
-    default=False,
-    help='Only copy the characters to the clipboard but do not insert it',
-    is_flag=True)
-@click.option('-f',
-              '--files',
-              default='pastes_folder',
-              help='Read pastes from this directory')
-@click.option('-r',
-              '--prompt',
-              default='Rofipaste ❤ ',
-              help='Set rofipaste\'s  prompt')
-@click.option('--rofi-args',
-              default='',
-              help='A string of arguments to give to rofi')
-@click.option('-e',
-              '--editor',
-              default='',
-              help='path to your favorite editor')
-@click_config_file.configuration_option(config_file_name=config_file_name)
-def main(version: bool, edit_config: bool, edit_entry: bool,
-         insert_with_clipboard: bool, copy_only: bool, files: str, prompt: str,
-         rofi_args: str, editor: str) -> int:
+    Build the click command of ``rofipaste capture``
+    """
+    import click
+
+    @click.command(name='capture')
+    @click.option('--interval',
+                  default=rofipaste.history.poll_interval,
+                  show_default=True,
+                  help='Delay between two reads of the clipboard, in seconds')
+    @click.option('--max-size',
+                  default=rofipaste.history.max_size,
+                  show_default=True,
+                  help='Total size of the stored contents, in bytes: the '
+                  'oldest ones are removed above it')
+    @click.option('--clipboard-backend',
+                  type=click.Choice(['auto', 'xlib', 'xsel']),
+                  default='auto',
+                  help='How to access the clipboard: xlib (needs '
+                  'python-xlib), xsel or auto')
+    def capture(interval: float, max_size: int,
+                clipboard_backend: str) -> int:
+        """
+        Record the contents copied to the clipboard until interrupted. They
+        are listed in the "Clipboard history" folder of the menu
+        """
+        import rofipaste as package
+
+        rofipaste.clipboard.backend_name = clipboard_backend
+        rofipaste.history.max_size = max_size
+        try:
+            rofipaste.history.capture(package.get_clipboard_content,
+                                      interval)
+        except OSError as error:
+            raise click.ClickException(
+                f'Cannot read the clipboard: {error}') from error
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    return capture
+
+
+# Set once the daemon is started: its triggers never start it again
+serving: bool = False
+
+# Subcommands, given as the first argument
+subcommands: Dict[str, Callable[[], Any]] = {
+    'stats': get_stats_command,
+    'pack': get_pack_command,
+    'get': get_get_command,
+    'list': get_list_command,
+    'capture': get_capture_command,
+}
+
+
+def run(version: bool, edit_config: bool, edit_entry: bool,
+        insert_with_clipboard: bool, copy_only: bool, files: str, prompt: str,
+        rofi_args: str, editor: str, daemon: bool, prefetch: bool,
+        clipboard_backend: str, flat: bool, multi_select: bool,
+        separator: str, script_mode: bool, type_delay: int,
+        clipboard_threshold: int, exec_timeout: float, trace: bool,
+        sort: str) -> int:
     """
     RofiPaste is a tool allowing you to copy / paste pieces of codes or other useful texts
     """
 
-    filesPath: str = os.path.join(BaseDirectory.xdg_data_home, 'rofipaste',
-                                  files)
+    filesPath: str = config.get_files_path(files)
+    config_file_name = config.config_file_name
 
     config_dirname = os.path.dirname(config_file_name)
     if not os.path.isdir(config_dirname):
         os.makedirs(config_dirname)
     if not os.path.isfile(config_file_name):
         with open(config_file_name, 'w') as config_file:
-            config_file.write(default_config)
+            config_file.write(config.default_config)
 
     if edit_config:
         rofipaste.edit_file(config_file_name, editor, xdg_open=True)
         return 0
 
     if edit_entry:
+        import click
         filename = click.prompt('Please enter the filename',
                                 default="new_entry")
 
@@ -128,9 +509,30 @@ def main(version: bool, edit_config: bool, edit_entry: bool,
         return 0
 
     if version:
-        click.echo(f"Current version: {__version__}")
+        print(f"Current version: {__version__}")
         return 0
 
+    rofipaste.clipboard.backend_name = clipboard_backend
+    rofipaste.keyboard.type_delay = type_delay
+    rofipaste.keyboard.clipboard_threshold = clipboard_threshold
+    rofipaste.runner.default_timeout = exec_timeout
+    # Reset on each run: the daemon runs every trigger in the same process
+    rofipaste.trace.enabled = trace or rofipaste.trace.enabled_by_environment
+    rofipaste.usage.enabled = sort == 'frecency'
+
+    # A trigger of the daemon runs the menu, even with daemon=True in the
+    # config file
+    global serving
+    if daemon and not serving:
+        serving = True
+        from rofipaste import daemon as rofipaste_daemon
+        from rofipaste.watcher import Watcher
+        createIfNotExist(filesPath)
+        rofipaste.clipboard.persistent = True
+        rofipaste.pack.enabled = False
+        Watcher(filesPath, rofipaste.paste_icon_dict).start()
+        return rofipaste_daemon.serve(handle_trigger)
+
     Action = rofipaste.Action
     action = {
         True: Action.TYPE,
@@ -138,72 +540,330 @@ def main(version: bool, edit_config: bool, edit_entry: bool,
         copy_only: Action.COPY_ONLY,
     }[True]
 
-    active_window = rofipaste.get_active_window()
-    if filesPath[-1] == "/":
-        #Removing / at the end to avoid base_folder different from current_folder when going back to top folder
-        filesPath = filesPath[:-1]
+    # xdotool runs while the paste folder is read, the menu waits for it
+    wait_active_window = rofipaste.start_active_window()
     createIfNotExist(filesPath)
     base_folder = filesPath
     current_folder = base_folder
+    history_folder = rofipaste.history.history_folder
+    if rofipaste.pack.enabled:
+        with rofipaste.trace.stage('pack'):
+            rofipaste.pack.load(base_folder, rofipaste.paste_icon_dict)
+
+    if script_mode:
+        return run_script_mode(base_folder, action, wait_active_window(),
+                               prompt, rofi_args, editor, prefetch, flat)
+
+    try:
+        while True:
+            if prefetch and current_folder != history_folder:
+                # Started first, to run while the menu is built
+                with rofipaste.trace.stage('prefetch'):
+                    rofipaste.prefetch_folder(current_folder)
+            # The rows are written to rofi while the folder is scanned, rofi
+            # returns the indexes of the picked rows in the table
+            table: List[rofipaste.Row] = []
+            texts = rofipaste.tabulate(
+                rofipaste.iter_menu_rows(current_folder, base_folder, flat),
+                table)
+            with rofipaste.trace.stage('scan'):
+                # Ready before rofi opens, which must wait for xdotool
+                first_rows = list(islice(texts, rofipaste.async_pre_read))
+
+            active_window = wait_active_window()
+            rofi_parameters = ['-format', 'i s', *rofi_args.split(" ")]
+            if multi_select:
+                rofi_parameters.insert(0, '-multi-select')
+            returncode, stdout = rofipaste.open_main_rofi_window(
+                rofi_parameters, chain(first_rows, texts), prompt)
+
+            if returncode == 1:
+                return 0
 
-    while True:
-        folder_content = rofipaste.read_folder_content(current_folder)
+            if 10 <= returncode <= 19:
+                return handle_entry('', returncode, action, active_window,
+                                    editor)
+
+            picked, typed = get_picked_rows(stdout, table)
+            if typed[:1] == rofipaste.command_prefix:
+                command = rofipaste.parse_command(typed)
+                if command[0] == 'search':
+                    return run_search(base_folder, command[1:], action,
+                                      active_window, prompt, rofi_args,
+                                      editor)
+                rofipaste.commandInterpreter(typed, editor)
+                return 0
 
-        if current_folder != base_folder:
-            folder_content = f'{rofipaste.undo_icon} ..\n' + folder_content
+            separator = separator.replace('\\n', '\n').replace('\\t', '\t')
+            clips = [
+                row.path for row in picked
+                if row.kind == rofipaste.RowKind.CLIP
+            ]
+            if clips:
+                return handle_clips(clips, returncode, action, active_window,
+                                    separator)
+            if len(picked) > 1:
+                # Several entries selected with -multi-select
+                return handle_entries(
+                    [
+                        row.path for row in picked
+                        if row.kind == rofipaste.RowKind.ENTRY
+                    ], returncode, action, active_window, separator)
+            if not picked:
+                return -1
+
+            row = picked[0]
+            if row.kind in (rofipaste.RowKind.FOLDER,
+                            rofipaste.RowKind.PARENT,
+                            rofipaste.RowKind.HISTORY):
+                current_folder = row.path
+
+            elif row.kind == rofipaste.RowKind.CONFIG:
+                rofipaste.edit_file(config_file_name, editor, xdg_open=True)
+                return 0
 
-        returncode, stdout = rofipaste.open_main_rofi_window(
-            rofi_args.split(" "), folder_content, prompt)
+            else:
+                return handle_entry(row.path, returncode, action,
+                                    active_window, editor)
 
-        if returncode == 1:
-            return 0
+        return 0
+    finally:
+        # Drop the outputs of the prefetched entries which were not picked
+        rofipaste.prefetch.discard()
 
-        if (stdout[0] == rofipaste.command_prefix):
-            rofipaste.commandInterpreter(stdout.rstrip('\n'), editor)
-            return 0
 
-        splitted = stdout.rstrip('\n').split(' ')
-        icon, path = splitted[0], os.path.join(
-            current_folder, ' '.join(splitted[1:]).replace(' (exec)', ''))
+def get_picked_rows(
+        stdout: str,
+        table: List[rofipaste.Row]) -> Tuple[List[rofipaste.Row], str]:
+    """
+    Return the rows picked in rofi, printed as "<index> <text>" lines, and
+    the text typed instead when no row matched it (index -1)
+    """
+    picked = []
+    typed = ''
+    for line in stdout.rstrip('\n').split('\n'):
+        position, _, text = line.partition(' ')
+        try:
+            index = int(position)
+        except ValueError:
+            continue
+        if 0 <= index < len(table):
+            picked.append(table[index])
+        else:
+            typed = text
+    return picked, typed
+
 
-        if icon == rofipaste.folder_icon:
-            current_folder = path
+def get_action(returncode: int,
+               action: rofipaste.Action) -> Optional[rofipaste.Action]:
+    """
+    Return the action of a rofi return code, None if it pastes nothing
+    """
+    Action = rofipaste.Action
+    return {
+        0: action,
+        # Alt+r runs the entry again instead of using its cached output
+        24: action,
+        20: Action.COPY_ONLY,
+        21: Action.TYPE,
+        22: Action.INSERT_WITH_CLIPBOARD,
+    }.get(returncode)
+
+
+def handle_entry(path: str, returncode: int, action: rofipaste.Action,
+                 active_window: str, editor: str) -> int:
+    """
+    Paste (or edit) the entry picked with the given rofi return code
+    """
+    if 10 <= returncode <= 19:
+        # Alt+1 to Alt+0 paste the recent entries, whatever entry is selected
+        return handle_recent(returncode - 10, action, active_window)
 
-        elif icon == rofipaste.undo_icon:
-            current_folder = os.path.dirname(current_folder)
+    if returncode == 23:
+        #Alt+e opens edit mode
+        rofipaste.edit_file(path, editor)
+        return 0
 
-        elif icon == rofipaste.edit_config_icon:
-            rofipaste.edit_file(config_file_name, editor, xdg_open=True)
-            return 0
+    picked_action = get_action(returncode, action)
+    if picked_action is None:
+        return 0
 
-        elif icon in rofipaste.paste_icon_dict.values():
-            path = path.rstrip()
+    return paste(path, picked_action, active_window,
+                 use_cache=returncode != 24)
 
-            path += '.' + {y: x
-                           for x, y in rofipaste.paste_icon_dict.items()}[icon]
 
-            if path[-1] == '.':
-                path = path[:-1]
+def handle_entries(paths: List[str], returncode: int,
+                   action: rofipaste.Action, active_window: str,
+                   separator: str) -> int:
+    """
+    Paste the entries picked together with the given rofi return code
+    """
+    from subprocess import TimeoutExpired
 
-            if 10 <= returncode <= 19:
-                # TODO: create shortcuts with 0-9 keys
-                #default_handle_recent_character(returncode - 9,  active_window)
-                return 0
-            else:
-                data = rofipaste.fileInterpreter(path)
-                if returncode == 0:
-                    rofipaste.default_handle(data, action, active_window)
-                elif returncode == 20:
-                    rofipaste.copy_characters_to_clipboard(data)
-                elif returncode == 21:
-                    rofipaste.type_characters(data, active_window)
-                elif returncode == 22:
-                    rofipaste.copy_paste_characters(data, active_window)
-                elif returncode == 23:
-                    #Alt+e opens edit mode
-                    rofipaste.edit_file(path, editor)
-                return 0
-        else:
-            return -1
+    picked_action = get_action(returncode, action)
+    if picked_action is None or not paths:
+        return 0
+
+    try:
+        rofipaste.paste_entries(paths,
+                                picked_action,
+                                active_window,
+                                separator,
+                                use_cache=returncode != 24)
+    except OSError:
+        return 0
+    except TimeoutExpired as error:
+        rofipaste.show_message(
+            f'ERROR: {os.path.basename(error.cmd[-1])} did not finish within '
+            f'{error.timeout:g} seconds')
+        return 1
+    except rofipaste.plugins.PluginError as error:
+        rofipaste.show_message(f'ERROR: {error}')
+        return 1
+    for path in paths:
+        rofipaste.usage.record_in_background(path)
+        recent.push(path)
+    return 0
+
+
+def handle_clips(paths: List[str], returncode: int, action: rofipaste.Action,
+                 active_window: str, separator: str) -> int:
+    """
+    Paste the contents of the clipboard history picked with the given rofi
+    return code
+    """
+    picked_action = get_action(returncode, action)
+    if picked_action is None:
+        return 0
+
+    try:
+        rofipaste.paste_clips(paths, picked_action, active_window, separator)
+    except OSError:
+        pass
+    return 0
+
+
+def handle_recent(position: int, action: rofipaste.Action,
+                  active_window: str) -> int:
+    """
+    Paste the position-th most recently pasted entry
+    """
+    item = recent.get(position)
+    if item is None:
+        return 0
 
+    path, data = item
+    if data is not None:
+        rofipaste.default_handle(data, action, active_window)
+        rofipaste.usage.record_in_background(path)
+        recent.push(path)
+        return 0
+    return paste(path, action, active_window)
+
+
+def paste(path: str,
+          action: rofipaste.Action,
+          active_window: str,
+          use_cache: bool = True) -> int:
+    """
+    Paste an entry and record its use
+    """
+    from subprocess import TimeoutExpired
+
+    try:
+        rofipaste.paste_entry(path, action, active_window, use_cache)
+    except OSError:
+        return 0
+    except TimeoutExpired as error:
+        rofipaste.show_message(
+            f'ERROR: {os.path.basename(path)} did not finish within '
+            f'{error.timeout:g} seconds')
+        return 1
+    except rofipaste.plugins.PluginError as error:
+        rofipaste.show_message(f'ERROR: {error}')
+        return 1
+    rofipaste.usage.record_in_background(path)
+    recent.push(path)
     return 0
+
+
+def run_search(base_folder: str, terms: List[str], action: rofipaste.Action,
+               active_window: str, prompt: str, rofi_args: str,
+               editor: str) -> int:
+    """
+    List the entries containing all the searched terms, and paste (or edit)
+    the picked one
+    """
+    terms = [term for term in terms if term]
+    if not terms:
+        rofipaste.commandInterpreter('help', editor)
+        return 0
+
+    results = rofipaste.search_entries(base_folder, terms)
+    if not results:
+        rofipaste.show_message(f'No entry contains {" ".join(terms)}')
+        return 0
+
+    # The rows are picked by index, their text holds the snippets
+    returncode, stdout = rofipaste.open_main_rofi_window(
+        ['-format', 'i', *rofi_args.split(" ")],
+        rofipaste.read_search_content(results), prompt)
+    if returncode == 1:
+        return 0
+    if 10 <= returncode <= 19:
+        return handle_entry('', returncode, action, active_window, editor)
+
+    try:
+        path = results[int(stdout)][0]
+    except (ValueError, IndexError):
+        return 0
+    return handle_entry(path, returncode, action, active_window, editor)
+
+
+def run_script_mode(base_folder: str, action: rofipaste.Action,
+                    active_window: str, prompt: str, rofi_args: str,
+                    editor: str, prefetch: bool, flat: bool) -> int:
+    """
+    Browse the pastes in a single rofi window, using rofi's script mode
+    """
+    from rofipaste import script_mode
+
+    try:
+        if prefetch:
+            with rofipaste.trace.stage('prefetch'):
+                rofipaste.prefetch_folder(base_folder)
+
+        with rofipaste.trace.stage('rofi'):
+            picked = script_mode.open_menu(rofi_args.split(" "), prompt,
+                                           base_folder, flat)
+        if picked is None:
+            return 0
+
+        if picked['kind'] == 'command':
+            command = rofipaste.parse_command(str(picked['command']))
+            if command[0] == 'search':
+                return run_search(base_folder, command[1:], action,
+                                  active_window, prompt, rofi_args, editor)
+            rofipaste.commandInterpreter(str(picked['command']), editor)
+        elif picked['kind'] == 'config':
+            rofipaste.edit_file(config.config_file_name,
+                                editor,
+                                xdg_open=True)
+        elif picked['kind'] == 'entry':
+            return handle_entry(str(picked['path']), int(picked['returncode']),
+                                action, active_window, editor)
+        elif picked['kind'] == 'clip':
+            return handle_clips([str(picked['path'])],
+                                int(picked['returncode']), action,
+                                active_window, '')
+        return 0
+    finally:
+        rofipaste.prefetch.discard()
+
+
+def handle_trigger(argv):
+    """
+    Run rofipaste inside the daemon for a client's arguments. The daemon
+    option of the arguments and of the config file is ignored there
+    """
+    return main(argv, standalone_mode=False)
@@ -0,0 +1,458 @@
+"""Clipboard backends.
+
+The xlib backend owns the X selections in-process with python-xlib, the xsel
+backend runs xsel and is used when python-xlib or the X server is not
+available.
+"""
+from __future__ import annotations
+
+import os
+import select
+import threading
+import time
+from subprocess import run, Popen, PIPE
+from rofipaste import trace
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, Union
+
+# 'auto', 'xlib' or 'xsel'
+backend_name: str = 'auto'
+# Set in long-running processes (the daemon), which can keep owning the
+# selections after a copy instead of handing them to xsel
+persistent: bool = False
+# Maximum time to wait for the target window to read the pasted selection
+paste_timeout: float = 2.0
+# Size of the chunks of a big paste written to xsel
+stream_chunk_size: int = 64 * 1024
+
+xsel_flags: Dict[str, str] = {'CLIPBOARD': '-b', 'PRIMARY': '-p'}
+
+
+def paste_command(active_window: str) -> List[str]:
+    return [
+        'xdotool',
+        'windowfocus',
+        '--sync',
+        active_window,
+        'key',
+        '--clearmodifiers',
+        'Shift+Insert',
+    ]
+
+
+def encode(characters: Union[str, memoryview]) -> bytes:
+    if isinstance(characters, str):
+        return characters.encode('utf-8')
+    return bytes(characters)
+
+
+class XselWriter:
+    """XselWriter.
+
+    An ``xsel -i`` process, which sets a selection to the UTF-8 bytes written
+    to it once closed
+    """
+
+    def __init__(self, selection: str = 'CLIPBOARD') -> None:
+        self.start = time.monotonic()
+        self.process = Popen(['xsel', '-i', xsel_flags[selection]],
+                             stdin=PIPE)
+        self.broken = False
+
+    def write(self, data: Union[bytes, memoryview]) -> None:
+        assert self.process.stdin is not None
+        if self.broken:
+            return
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            # xsel exited, its error is already on stderr
+            self.broken = True
+
+    def close(self) -> None:
+        assert self.process.stdin is not None
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+        trace.add('xsel', time.monotonic() - self.start)
+
+
+class XselBackend:
+    """XselBackend.
+
+    Clipboard operations through xsel processes
+    """
+
+    name: str = 'xsel'
+
+    def get(self, selection: str = 'CLIPBOARD') -> str:
+        """get.
+
+        Return the content of a selection
+
+        :param selection: 'CLIPBOARD' or 'PRIMARY'
+        :type selection: str
+        :rtype: str
+        """
+
+        with trace.stage('xsel'):
+            # A selection set by another program may not be UTF-8
+            return run(args=['xsel', '-o', xsel_flags[selection]],
+                       capture_output=True).stdout.decode('utf-8', 'replace')
+
+    def set(self,
+            characters: Union[str, memoryview],
+            selection: str = 'CLIPBOARD') -> None:
+        """set.
+
+        Set the content of a selection. A memoryview (the UTF-8 content of a
+        big entry) is written to xsel chunk by chunk, without being copied
+
+        :param characters: Characters to copy
+        :type characters: Union[str, memoryview]
+        :param selection: 'CLIPBOARD' or 'PRIMARY'
+        :type selection: str
+        :rtype: None
+        """
+
+        if isinstance(characters, str):
+            with trace.stage('xsel'):
+                run(args=['xsel', '-i', xsel_flags[selection]],
+                    input=characters,
+                    encoding='utf-8')
+            return
+
+        writer = self.writer(selection)
+        try:
+            for i in range(0, len(characters), stream_chunk_size):
+                writer.write(characters[i:i + stream_chunk_size])
+        finally:
+            writer.close()
+
+    def writer(self, selection: str = 'CLIPBOARD') -> XselWriter:
+        """writer.
+
+        Return a writer setting the content of a selection as it is written
+
+        :param selection: 'CLIPBOARD' or 'PRIMARY'
+        :type selection: str
+        :rtype: XselWriter
+        """
+
+        return XselWriter(selection)
+
+    def paste(self, characters: Union[str, memoryview],
+              active_window: str) -> None:
+        """paste.
+
+        Insert characters by copying it and pasting it to the active window,
+        then restore the selections
+
+        :param characters: Characters to paste
+        :type characters: Union[str, memoryview]
+        :param active_window: ID of the active window
+        :type active_window: str
+        :rtype: None
+        """
+
+        old_clipboard_content = self.get('CLIPBOARD')
+        old_primary_content = self.get('PRIMARY')
+
+        self.set(characters, 'CLIPBOARD')
+        self.set(characters, 'PRIMARY')
+
+        # xsel cannot tell when the selection was read, so give the target
+        # window some time
+        with trace.stage('xdotool'):
+            run([*paste_command(active_window), 'sleep', '0.05'])
+
+        self.set(old_clipboard_content, 'CLIPBOARD')
+        self.set(old_primary_content, 'PRIMARY')
+
+
+class SelectionOwner:
+    """SelectionOwner.
+
+    Own X selections with a hidden window and serve their content to the
+    other clients
+    """
+
+    def __init__(self) -> None:
+        from Xlib import X, Xatom, display
+
+        self.X = X
+        self.display = display.Display()
+        self.window = self.display.screen().root.create_window(
+            0, 0, 1, 1, 0, X.CopyFromParent)
+        self.atoms: Dict[str, int] = {
+            name: self.display.intern_atom(name)
+            for name in ('CLIPBOARD', 'TARGETS', 'UTF8_STRING', 'TEXT', 'INCR',
+                         'ROFIPASTE_SELECTION')
+        }
+        self.atoms['PRIMARY'] = Xatom.PRIMARY
+        self.atoms['STRING'] = Xatom.STRING
+        self.atoms['ATOM'] = Xatom.ATOM
+        self.text_targets = {
+            self.atoms['UTF8_STRING'], self.atoms['STRING'],
+            self.atoms['TEXT']
+        }
+        # Requests bigger than this need the INCR protocol
+        self.max_size: int = (self.display.display.info.max_request_length *
+                              4 - 1024)
+        self.contents: Dict[int, bytes] = {}
+        self.served: int = 0
+        self.lock = threading.RLock()
+
+    def own(self, selection: str, data: bytes) -> bool:
+        """own.
+
+        Become the owner of a selection
+
+        :param selection: 'CLIPBOARD' or 'PRIMARY'
+        :type selection: str
+        :param data: Content of the selection, in UTF-8
+        :type data: bytes
+        :rtype: bool
+        :return: False if the ownership was not granted
+        """
+
+        atom = self.atoms[selection]
+        with self.lock:
+            self.contents[atom] = data
+            self.window.set_selection_owner(atom, self.X.CurrentTime)
+            owner = self.display.get_selection_owner(atom)
+            if getattr(owner, 'id', owner) != self.window.id:
+                self.contents.pop(atom, None)
+                return False
+        return True
+
+    def release(self, selection: str) -> None:
+        from Xlib.protocol.request import SetSelectionOwner
+
+        atom = self.atoms[selection]
+        with self.lock:
+            if self.contents.pop(atom, None) is not None:
+                SetSelectionOwner(display=self.display.display,
+                                  window=self.X.NONE,
+                                  selection=atom,
+                                  time=self.X.CurrentTime)
+                self.display.flush()
+
+    def _serve(self, event) -> None:
+        from Xlib.protocol.event import SelectionNotify
+
+        X = self.X
+        data = self.contents.get(event.selection)
+        # Obsolete clients give no property
+        prop = event.property or event.target
+
+        if data is None:
+            prop = X.NONE
+        elif event.target == self.atoms['TARGETS']:
+            event.requestor.change_property(
+                prop, self.atoms['ATOM'], 32,
+                [self.atoms['TARGETS'], *self.text_targets])
+        elif event.target in self.text_targets:
+            event.requestor.change_property(prop, event.target, 8, data)
+            self.served += 1
+        else:
+            prop = X.NONE
+
+        event.requestor.send_event(SelectionNotify(time=event.time,
+                                                   requestor=event.requestor,
+                                                   selection=event.selection,
+                                                   target=event.target,
+                                                   property=prop),
+                                   event_mask=0)
+        self.display.flush()
+
+    def handle_event(self, event) -> None:
+        if event.type == self.X.SelectionRequest:
+            self._serve(event)
+        elif event.type == self.X.SelectionClear:
+            self.contents.pop(event.atom, None)
+
+    def process_events(self, timeout: float) -> None:
+        """process_events.
+
+        Serve the pending requests, waiting at most timeout seconds for them
+
+        :param timeout: Time to wait for an event, in seconds
+        :type timeout: float
+        :rtype: None
+        """
+
+        with self.lock:
+            pending = self.display.pending_events()
+        if not pending:
+            select.select([self.display], [], [], timeout)
+
+        with self.lock:
+            while self.display.pending_events():
+                self.handle_event(self.display.next_event())
+
+    def convert(self, selection: str, timeout: float = 1.0) -> Optional[str]:
+        """convert.
+
+        Read the content of a selection owned by another client
+
+        :param selection: 'CLIPBOARD' or 'PRIMARY'
+        :type selection: str
+        :param timeout: Time to wait for the owner to answer, in seconds
+        :type timeout: float
+        :rtype: Optional[str]
+        :return: The content, or None if it needs the INCR protocol
+        """
+
+        atom = self.atoms[selection]
+        prop = self.atoms['ROFIPASTE_SELECTION']
+
+        with self.lock:
+            if atom in self.contents:
+                return self.contents[atom].decode('utf-8')
+            if self.display.get_selection_owner(atom) == self.X.NONE:
+                return ''
+
+            self.window.convert_selection(atom, self.atoms['UTF8_STRING'],
+                                          prop, self.X.CurrentTime)
+            self.display.flush()
+
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return ''
+                if not self.display.pending_events():
+                    select.select([self.display], [], [], remaining)
+                    continue
+                event = self.display.next_event()
+                if (event.type == self.X.SelectionNotify
+                        and event.selection == atom):
+                    break
+                self.handle_event(event)
+
+            if event.property == self.X.NONE:
+                return ''
+            value = self.window.get_full_property(prop,
+                                                  self.X.AnyPropertyType)
+            self.window.delete_property(prop)
+            self.display.flush()
+
+        if value is None:
+            return ''
+        if value.property_type == self.atoms['INCR']:
+            return None
+        return bytes(value.value).decode('utf-8', 'replace')
+
+
+class XlibBackend(XselBackend):
+    """XlibBackend.
+
+    Clipboard operations done in-process with python-xlib. The selections are
+    only restored after the target window has read the pasted one
+    """
+
+    name: str = 'xlib'
+
+    def __init__(self) -> None:
+        self.owner = SelectionOwner()
+        self.serving: Optional[threading.Thread] = None
+
+    def get(self, selection: str = 'CLIPBOARD') -> str:
+        content = self.owner.convert(selection)
+        if content is None:
+            return super().get(selection)
+        return content
+
+    def set(self,
+            characters: Union[str, memoryview],
+            selection: str = 'CLIPBOARD') -> None:
+        if not persistent or len(characters) > self.owner.max_size:
+            # The selection must outlive this process, or needs the INCR
+            # protocol: leave it to xsel
+            super().set(characters, selection)
+            return
+
+        data = encode(characters)
+        if (len(data) > self.owner.max_size
+                or not self.owner.own(selection, data)):
+            super().set(characters, selection)
+            return
+        if self.serving is None:
+            self.serving = threading.Thread(target=self._serve_forever,
+                                            daemon=True)
+            self.serving.start()
+
+    def _serve_forever(self) -> None:
+        while True:
+            self.owner.process_events(1.0)
+
+    def paste(self, characters: Union[str, memoryview],
+              active_window: str) -> None:
+        if len(characters) > self.owner.max_size:
+            super().paste(characters, active_window)
+            return
+        data = encode(characters)
+        if len(data) > self.owner.max_size:
+            super().paste(characters, active_window)
+            return
+
+        old_clipboard_content = self.get('CLIPBOARD')
+        old_primary_content = self.get('PRIMARY')
+
+        if not (self.owner.own('CLIPBOARD', data)
+                and self.owner.own('PRIMARY', data)):
+            super().paste(characters, active_window)
+            return
+
+        served = self.owner.served
+        with trace.stage('xdotool'):
+            xdotool = Popen(paste_command(active_window))
+
+            # Serve the selection until the target window has read it,
+            # instead of hoping it did after a fixed delay
+            deadline: Optional[float] = None
+            while self.owner.served == served:
+                if deadline is None and xdotool.poll() is not None:
+                    deadline = time.monotonic() + paste_timeout
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+                self.owner.process_events(0.01)
+            xdotool.wait()
+
+        for selection, content in (('CLIPBOARD', old_clipboard_content),
+                                   ('PRIMARY', old_primary_content)):
+            if content:
+                self.set(content, selection)
+            else:
+                self.owner.release(selection)
+
+
+_backend: Optional[XselBackend] = None
+
+
+def get_backend() -> XselBackend:
+    """get_backend.
+
+    Return the clipboard backend, the xlib one when python-xlib and the X
+    server are available
+
+    :rtype: XselBackend
+    """
+
+    global _backend
+    if _backend is None:
+        if backend_name != 'xsel' and os.environ.get('DISPLAY'):
+            try:
+                _backend = XlibBackend()
+            except Exception:
+                # python-xlib is not installed or the display is unreachable
+                if backend_name == 'xlib':
+                    raise
+        if _backend is None:
+            _backend = XselBackend()
+    return _backend
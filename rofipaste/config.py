@@ -0,0 +1,211 @@
+"""Configuration file and XDG directories of rofipaste.
+
+This module is on the path of every menu opening: it only depends on the
+standard library and falls back to click_config_file for the config files it
+cannot parse itself.
+"""
+from __future__ import annotations
+
+import os
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Optional, Tuple
+
+
+def xdg_home(variable: str, default: str) -> str:
+    """xdg_home.
+
+    Return an XDG base directory, like pyxdg's BaseDirectory does
+
+    :param variable: Name of the environment variable
+    :type variable: str
+    :param default: Default path, relative to the home directory
+    :type default: str
+    :rtype: str
+    """
+
+    return os.environ.get(variable) or os.path.join(
+        os.path.expanduser('~'), default)
+
+
+xdg_config_home: str = xdg_home('XDG_CONFIG_HOME', '.config')
+xdg_data_home: str = xdg_home('XDG_DATA_HOME', os.path.join('.local', 'share'))
+xdg_cache_home: str = xdg_home('XDG_CACHE_HOME', '.cache')
+xdg_state_home: str = xdg_home('XDG_STATE_HOME',
+                               os.path.join('.local', 'state'))
+
+config_file_name: str = os.path.join(xdg_config_home, 'rofipaste/config')
+
+default_config = """##################################
+##     Default config file      ##
+## Uncomment the lines you want ##
+##################################
+
+## Use your clipboard to copy paste things instead of just typing it (recommanded on Wayland and for non qwerty keyboards)
+# insert_with_clipboard=True                # Default: False
+
+## Just copy the 'paste' content
+# copy_only=True                            # Default: False
+
+## Use a different folder than the default one for storing your pastes
+# files="/home/<my username>/my pastes"    # Default: /home/<my username>/.local/share/rofipaste/pastes_folder
+
+## Use a different prompt in rofi
+# prompt="This is my custom prompt"         # Default: "Rofipaste ❤ "
+
+## Give rofi some arguments
+# rofi_args=""                              # Default: ""
+
+## Use your favorite editor
+# editor="subl"                             # This is for sublime text
+# editor="vscode"                           # Visual Studio Code
+# editor="termite -e 'nvim $FILE'"          # nvim with termite
+
+## Delay between two typed characters, in milliseconds
+# type_delay=12                             # Default: 12
+
+## Insert the pastes longer than this number of characters through the clipboard instead of typing them (0 to always type)
+# clipboard_threshold=4096                  # Default: 4096
+
+## Select several pastes with Shift+Enter and insert them all at once, with a separator between them
+# multi_select=True                         # Default: False
+# separator="\\n\\n"                          # Default: "\\n"
+
+## Stop the dynamic pastes running for longer than this, in seconds
+# exec_timeout=60                           # Default: 30
+
+## Record the time spent in each stage of a run, see rofipaste stats
+# trace=True                                # Default: False
+
+## List the entries by name instead of the most used first
+# sort="none"                               # Default: "frecency"
+"""
+
+
+def parse_value(value: str) -> Any:
+    """parse_value.
+
+    Parse a value of the config file, raise ValueError if it needs the full
+    configobj parser
+
+    :param value: The value, inline comment included
+    :type value: str
+    :rtype: Any
+    """
+
+    if value[:1] in ('"', "'"):
+        end = value.find(value[0], 1)
+        rest = value[end + 1:].strip()
+        if end < 0 or '\\' in value[:end] or (rest and rest[0] != '#'):
+            raise ValueError(value)
+        return value[1:end]
+
+    value = value.split('#')[0].strip()
+    if value in ('True', 'False'):
+        return value == 'True'
+    if value == 'None':
+        return None
+    if value.lstrip('-').isdigit():
+        return int(value)
+    raise ValueError(value)
+
+
+def parse_config(text: str) -> Dict[str, Any]:
+    """parse_config.
+
+    Parse the flat ``key=value`` config files written by rofipaste
+
+    :param text: Content of the config file
+    :type text: str
+    :rtype: Dict[str, Any]
+    """
+
+    values: Dict[str, Any] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        key, separator, value = line.partition('=')
+        key = key.strip()
+        if not separator or not key.isidentifier():
+            raise ValueError(line)
+        values[key] = parse_value(value.strip())
+    return values
+
+
+_configs: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+
+def read_config(path: str) -> Dict[str, Any]:
+    """read_config.
+
+    Read a config file, the parsed values are kept in memory until the file
+    changes
+
+    :param path: Path of the config file
+    :type path: str
+    :rtype: Dict[str, Any]
+    """
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+
+    cached = _configs.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as config_file:
+            text = config_file.read()
+        try:
+            values = parse_config(text)
+        except ValueError:
+            from click_config_file import configobj_provider
+            values = dict(configobj_provider()(path, 'rofipaste'))
+        cached = (mtime, values)
+        _configs[path] = cached
+
+    return dict(cached[1])
+
+
+def config_provider(file_path: str, cmd_name: str) -> Dict[str, Any]:
+    """config_provider.
+
+    click_config_file provider using the cached minimal parser
+    """
+
+    return read_config(file_path)
+
+
+def get_files_path(files: str) -> str:
+    """get_files_path.
+
+    Return the path of the paste folder given with --files
+
+    :param files: Folder, relative to the data directory of rofipaste
+    :type files: str
+    :rtype: str
+    """
+
+    files_path = os.path.join(xdg_data_home, 'rofipaste', files)
+    if files_path[-1] == "/":
+        # Removing / at the end to avoid base_folder different from
+        # current_folder when going back to top folder
+        files_path = files_path[:-1]
+    return files_path
+
+
+def get_paste_folder(files: Optional[str] = None) -> str:
+    """get_paste_folder.
+
+    Return the path of the paste folder: the given one, or the one of the
+    config file
+
+    :param files: Folder given like the --files option
+    :type files: Optional[str]
+    :rtype: str
+    """
+
+    if files is None:
+        files = read_config(config_file_name).get('files', 'pastes_folder')
+    return get_files_path(files)
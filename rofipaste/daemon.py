@@ -0,0 +1,181 @@
+"""Long-running rofipaste process and its thin client.
+
+This module is imported by the client on every hotkey press, so it must only
+depend on the standard library.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import socket
+import threading
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, List, Optional
+
+# Options which need the caller's terminal or do not open the menu, they are
+# always handled by a local rofipaste process
+local_options = {
+    '--help', '--version', '--edit-config', '--edit-entry', '--daemon'
+}
+# The subcommands of rofipaste.cli (not imported here), which print to the
+# caller's terminal or run until interrupted
+local_commands = {'stats', 'pack', 'get', 'list', 'capture'}
+
+
+def get_socket_path() -> str:
+    """get_socket_path.
+
+    Return the path of the daemon's socket, in $XDG_RUNTIME_DIR when it is
+    available
+
+    :rtype: str
+    """
+
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir or not os.path.isdir(runtime_dir):
+        runtime_dir = os.path.join('/tmp', f'rofipaste-{os.getuid()}')
+        os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+    return os.path.join(runtime_dir, 'rofipaste.sock')
+
+
+def _send(connection: socket.socket, message: dict) -> None:
+    connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _receive(connection: socket.socket) -> Optional[dict]:
+    with connection.makefile('rb') as stream:
+        line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+def serve(handler: Callable[[List[str]], int]) -> int:
+    """serve.
+
+    Listen on the daemon's socket and run the handler for each trigger.
+    Only one trigger is handled at a time, the others are refused so that two
+    menus never open together
+
+    :param handler: Function running rofipaste with the client's arguments
+    :type handler: Callable[[List[str]], int]
+    :rtype: int
+    """
+
+    path = get_socket_path()
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            probe.close()
+            print(f'rofipaste daemon already listening on {path}',
+                  file=sys.stderr)
+            return 1
+
+    busy = threading.Lock()
+
+    def handle(connection: socket.socket) -> None:
+        with connection:
+            try:
+                request = _receive(connection)
+            except (OSError, ValueError):
+                return
+            if request is None:
+                return
+
+            if not busy.acquire(blocking=False):
+                _send(connection, {'status': 'busy'})
+                return
+            try:
+                returncode = handler(request.get('argv', []))
+                response = {'status': 'ok', 'returncode': returncode or 0}
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e)}
+            finally:
+                busy.release()
+
+            try:
+                _send(connection, response)
+            except OSError:
+                pass
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            threading.Thread(target=handle, args=(connection, ),
+                             daemon=True).start()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def trigger(argv: List[str]) -> Optional[int]:
+    """trigger.
+
+    Ask the daemon to open the menu
+
+    :param argv: Command line arguments of the client
+    :type argv: List[str]
+    :rtype: Optional[int]
+    :return: The return code, or None if no daemon is running
+    """
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(get_socket_path())
+        except OSError:
+            return None
+        _send(client, {'argv': argv})
+        response = _receive(client)
+
+    if response is None:
+        print('rofipaste daemon closed the connection', file=sys.stderr)
+        return 1
+    if response['status'] == 'busy':
+        print('rofipaste is already open', file=sys.stderr)
+        return 1
+    if response['status'] == 'error':
+        print(f'rofipaste daemon: {response["message"]}', file=sys.stderr)
+        return 1
+    return response['returncode']
+
+
+def client_main() -> int:
+    """client_main.
+
+    Entry point of the thin client: forward the arguments to the daemon and
+    fall back to a regular rofipaste run when no daemon is listening
+
+    :rtype: int
+    """
+
+    argv = sys.argv[1:]
+    if not (argv and argv[0] in local_commands
+            or local_options.intersection(argv)):
+        returncode = trigger(argv)
+        if returncode is not None:
+            return returncode
+
+    from rofipaste.cli import main
+    return main()
@@ -0,0 +1,126 @@
+"""Cache of the output of the executable entries."""
+from __future__ import annotations
+
+import os
+import time
+from hashlib import sha1
+from rofipaste import config
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import List, Optional
+
+cache_folder: str = os.path.join(config.xdg_cache_home, 'rofipaste', 'exec')
+# Total size of the cached outputs, the least recently used ones are evicted
+# above it
+max_size: int = 16 * 1024 * 1024
+
+
+def get_key(path: str, args: List[str]) -> str:
+    """get_key.
+
+    Return the cache key of an execution of an entry: its path, its mtime and
+    the command line used to run it
+
+    :param path: Entry's path
+    :type path: str
+    :param args: Command line running the entry
+    :type args: List[str]
+    :rtype: str
+    """
+
+    stat = os.stat(path)
+    key = '\0'.join([path, str(stat.st_mtime_ns), str(stat.st_size), *args])
+    return sha1(key.encode('utf-8')).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """get.
+
+    Return the cached output, or None if it is missing or expired
+
+    :param key: Cache key
+    :type key: str
+    :rtype: Optional[str]
+    """
+
+    path = os.path.join(cache_folder, key)
+    try:
+        # In binary, to keep the line endings of the output
+        with open(path, 'rb') as cached:
+            expires = float(cached.readline())
+            if expires < time.time():
+                os.unlink(path)
+                return None
+            output = cached.read().decode('utf-8')
+        # The access time may not be updated (noatime), mark the use in the
+        # mtime for the LRU eviction
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+
+    return output
+
+
+def put(key: str, output: str, ttl: float) -> None:
+    """put.
+
+    Store an output for ttl seconds, and evict the least recently used
+    outputs if the cache is too big
+
+    :param key: Cache key
+    :type key: str
+    :param output: Output of the entry
+    :type output: str
+    :param ttl: Time to live, in seconds
+    :type ttl: float
+    :rtype: None
+    """
+
+    path = os.path.join(cache_folder, key)
+    try:
+        # The outputs can be secrets, like tokens
+        os.makedirs(cache_folder, mode=0o700, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                          0o600), 'wb') as cached:
+            cached.write(f'{time.time() + ttl}\n'.encode())
+            cached.write(output.encode('utf-8'))
+        os.replace(tmp_path, path)
+        evict()
+    except OSError:
+        pass
+
+
+def evict() -> None:
+    """evict.
+
+    Remove the least recently used outputs until the cache fits in max_size.
+    Expired outputs are removed when they are read
+
+    :rtype: None
+    """
+
+    entries = []
+    total_size = 0
+    with os.scandir(cache_folder) as it:
+        for entry in it:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+    if total_size <= max_size:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total_size -= size
@@ -0,0 +1,213 @@
+"""Clipboard history, shown as a virtual folder of the menu.
+
+``rofipaste capture`` polls the clipboard and stores each new content in
+history_folder, in a file named after the hash of the content: copying the
+same text again only updates the mtime of its file, which orders the history.
+Like the cache of the executable entries, the folder is capped in bytes: the
+oldest contents are removed once it grows over max_size.
+
+The menu only reads the beginning of each content for its preview, and a
+picked content is pasted as it is: it is never run, whatever it looks like.
+"""
+from __future__ import annotations
+
+import os
+import time
+from hashlib import sha1
+from rofipaste import config
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, Iterator, List, Optional, Tuple
+
+history_folder: str = os.path.join(config.xdg_state_home, 'rofipaste',
+                                   'clipboard')
+# Total size of the stored contents, the oldest ones are removed above it
+max_size: int = 4 * 1024 * 1024
+# Delay between two reads of the clipboard, in seconds
+poll_interval: float = 0.5
+# Bytes of a content read for its menu row, and length of the row's preview
+preview_size: int = 512
+preview_characters: int = 80
+
+
+def get_key(data: bytes) -> str:
+    return sha1(data).hexdigest()
+
+
+def push(content: str) -> Optional[str]:
+    """push.
+
+    Make a content the most recent one of the history, and remove the oldest
+    ones if the history is too big
+
+    :param content: Content of the clipboard
+    :type content: str
+    :rtype: Optional[str]
+    :return: Path of the stored content, or None if it was not stored (empty
+        or bigger than max_size)
+    """
+
+    data = content.encode('utf-8')
+    if not data.strip() or len(data) > max_size:
+        return None
+
+    path = os.path.join(history_folder, get_key(data))
+    try:
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        os.makedirs(history_folder, mode=0o700, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                          0o600), 'wb') as stored:
+            stored.write(data)
+        os.replace(tmp_path, path)
+        evict()
+    except OSError:
+        return None
+    return path
+
+
+def get_items() -> List[Tuple[int, int, str]]:
+    """get_items.
+
+    Return the mtime, size and path of the stored contents, the most recent
+    first. The contents themselves are not read
+
+    :rtype: List[Tuple[int, int, str]]
+    """
+
+    items = []
+    try:
+        with os.scandir(history_folder) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                items.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    except OSError:
+        return []
+    items.sort(reverse=True)
+    return items
+
+
+def evict() -> None:
+    """evict.
+
+    Remove the oldest contents until the history fits in max_size
+
+    :rtype: None
+    """
+
+    total_size = 0
+    for _, size, path in get_items():
+        total_size += size
+        if total_size > max_size:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def has_items() -> bool:
+    """has_items.
+
+    Tell whether the history holds any content, without listing it
+
+    :rtype: bool
+    """
+
+    try:
+        with os.scandir(history_folder) as it:
+            return any(not entry.name.endswith('.tmp') for entry in it)
+    except OSError:
+        return False
+
+
+def get_preview(path: str) -> str:
+    """get_preview.
+
+    Return the beginning of a content on one line, as pango markup
+
+    :param path: Path of the stored content
+    :type path: str
+    :rtype: str
+    """
+
+    from html import escape
+
+    with open(path, 'rb') as stored:
+        head = stored.read(preview_size)
+    preview = ' '.join(head.decode('utf-8', 'ignore').split())
+    if len(preview) > preview_characters:
+        preview = preview[:preview_characters - 1] + '…'
+    return escape(preview, quote=False)
+
+
+def iter_previews() -> Iterator[Tuple[str, str]]:
+    """iter_previews.
+
+    Yield the path and the preview of the stored contents, the most recent
+    first. Only the previews are read, one content at a time
+
+    :rtype: Iterator[Tuple[str, str]]
+    """
+
+    for _, _, path in get_items():
+        try:
+            yield path, get_preview(path)
+        except OSError:
+            # Removed by the capture since it was listed
+            continue
+
+
+def read(path: str) -> str:
+    """read.
+
+    Return a stored content
+
+    :param path: Path of the stored content
+    :type path: str
+    :rtype: str
+    """
+
+    with open(path, 'rb') as stored:
+        return stored.read().decode('utf-8', 'replace')
+
+
+def capture(get_content: Callable[[], str],
+            interval: Optional[float] = None,
+            count: Optional[int] = None) -> None:
+    """capture.
+
+    Store each new content of the clipboard, until interrupted. Only the
+    hash of the last content is kept between two reads
+
+    :param get_content: Return the content of the clipboard
+    :type get_content: Callable[[], str]
+    :param interval: Delay between two reads, defaults to poll_interval
+    :type interval: Optional[float]
+    :param count: Number of reads, unlimited by default
+    :type count: Optional[int]
+    :rtype: None
+    """
+
+    if interval is None:
+        interval = poll_interval
+
+    last_key = None
+    reads = 0
+    while count is None or reads < count:
+        if reads:
+            time.sleep(interval)
+        reads += 1
+
+        content = get_content()
+        key = get_key(content.encode('utf-8'))
+        if key != last_key:
+            last_key = key
+            push(content)
@@ -0,0 +1,418 @@
+"""Persistent metadata index of the paste folders."""
+from __future__ import annotations
+
+import os
+import json
+import threading
+from hashlib import sha1
+from rofipaste import config
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, Generator, Iterator, List, Optional
+    from rofipaste.pack import Bundle
+
+INDEX_VERSION: int = 3
+cache_folder: str = os.path.join(config.xdg_cache_home, 'rofipaste')
+
+# Marker of the options given in a comment at the top of an entry, for
+# instance "# rofipaste: ttl=300"
+entry_options_prefix: str = "rofipaste:"
+# Size of the beginning of the files read for the shebang and the options
+header_size: int = 1024
+# Extension of the plugin entries, run inside rofipaste (see rofipaste.plugins)
+plugin_extension: str = 'rpy'
+
+# Guards the indexes, which a watcher may update from another thread
+lock = threading.RLock()
+# The loaded bundle of the paste folder (see rofipaste.pack), if any
+bundle: Optional[Bundle] = None
+
+
+class Entry:
+    """Entry.
+
+    Metadata of a single item of a paste folder
+    """
+
+    __slots__ = ('filename', 'name', 'extension', 'icon', 'is_exec', 'is_dir',
+                 'size', 'mtime', 'options')
+
+    def __init__(self,
+                 filename: str,
+                 name: str,
+                 extension: str = '',
+                 icon: str = '',
+                 is_exec: bool = False,
+                 is_dir: bool = False,
+                 size: int = 0,
+                 mtime: int = 0,
+                 options: Optional[Dict[str, str]] = None) -> None:
+        self.filename = filename
+        self.name = name
+        self.extension = extension
+        self.icon = icon
+        self.is_exec = is_exec
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.options = options or {}
+
+    def to_list(self) -> list:
+        return [
+            self.filename, self.name, self.extension, self.icon, self.is_exec,
+            self.is_dir, self.size, self.mtime, self.options
+        ]
+
+    @classmethod
+    def from_list(cls, values: list) -> 'Entry':
+        return cls(*values)
+
+
+def get_entry_options(content: str) -> Dict[str, str]:
+    """get_entry_options.
+
+    Read the options given in the comments at the top of an entry, like
+    ``# rofipaste: ttl=300``
+
+    :param content: Entry's content
+    :type content: str
+    :rtype: Dict[str, str]
+    """
+
+    entry_options: Dict[str, str] = {}
+    for line in content.split('\n', 10)[:10]:
+        line = line.lstrip('#/;- \t')
+        if not line.startswith(entry_options_prefix):
+            continue
+        for option in line[len(entry_options_prefix):].split():
+            name, _, value = option.partition('=')
+            entry_options[name] = value
+    return entry_options
+
+
+def read_entry(folder_path: str, filename: str, icons: Dict[str, str],
+               stat: Optional[os.stat_result] = None) -> Entry:
+    """read_entry.
+
+    Build the metadata of a file of the paste folder, only reading its first
+    bytes to find a shebang and the entry's options
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param filename: Name of the file inside the folder
+    :type filename: str
+    :param icons: Extension to icon mapping
+    :type icons: Dict[str, str]
+    :param stat: Already known stat of the file
+    :type stat: Optional[os.stat_result]
+    :rtype: Entry
+    """
+
+    path = os.path.join(folder_path, filename)
+    if stat is None:
+        stat = os.stat(path)
+
+    with open(path, 'rb') as file_:
+        header = file_.read(header_size)
+    is_exec = (header[:2] == b'#!'
+               or filename.endswith('.' + plugin_extension))
+    options = get_entry_options(header.decode('utf-8', 'replace'))
+
+    extension = '.'.join(filename.split('.')[1:])
+    if extension in icons:
+        icon = icons[extension]
+        name = filename.split('.')[0]
+    else:
+        icon = icons['']
+        name = filename
+
+    return Entry(filename, name, extension, icon, is_exec, False,
+                 stat.st_size, stat.st_mtime_ns, options)
+
+
+class FolderIndex:
+    """FolderIndex.
+
+    Entries of one paste folder, persisted in the cache folder and refreshed
+    incrementally against the directory and file mtimes
+    """
+
+    def __init__(self, folder_path: str, icons: Dict[str, str]) -> None:
+        self.folder_path = folder_path
+        self.icons = icons
+        self.mtime: int = -1
+        self.entries: Dict[str, Entry] = {}
+        self.order: List[str] = []
+        # A watched index is kept up to date by events instead of refreshes
+        self.watched: bool = False
+        self.dirty: bool = False
+        self.cache_file = os.path.join(
+            cache_folder,
+            sha1(folder_path.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self) -> None:
+        """load.
+
+        Load the persisted index, if it is usable
+
+        :rtype: None
+        """
+
+        try:
+            with open(self.cache_file, 'r') as cache:
+                data = json.load(cache)
+        except (OSError, ValueError):
+            return
+
+        if (data.get('version') != INDEX_VERSION
+                or data.get('folder') != self.folder_path
+                or data.get('icons') != self.icons):
+            return
+
+        self.mtime = data['mtime']
+        self.order = [values[0] for values in data['entries']]
+        self.entries = {
+            values[0]: Entry.from_list(values)
+            for values in data['entries']
+        }
+
+    def save(self) -> None:
+        """save.
+
+        Atomically write the index to the cache folder
+
+        :rtype: None
+        """
+
+        data = {
+            'version': INDEX_VERSION,
+            'folder': self.folder_path,
+            'icons': self.icons,
+            'mtime': self.mtime,
+            'entries':
+            [self.entries[filename].to_list() for filename in self.order],
+        }
+
+        try:
+            os.makedirs(cache_folder, exist_ok=True)
+            tmp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as cache:
+                json.dump(data, cache, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+
+    def refresh(self) -> bool:
+        """refresh.
+
+        Bring the index up to date, only re-reading the files whose size or
+        mtime changed
+
+        :rtype: bool
+        :return: True if something changed
+        """
+
+        scan = self.scan()
+        while True:
+            try:
+                next(scan)
+            except StopIteration as stop:
+                return stop.value
+
+    def scan(self) -> Generator[Entry, None, bool]:
+        """scan.
+
+        Bring the index up to date like refresh, yielding the entries as they
+        are scanned. The index only changes once the whole folder is scanned
+
+        :rtype: Generator[Entry, None, bool]
+        :return: True if something changed
+        """
+
+        changed = False
+        dir_mtime = os.stat(self.folder_path).st_mtime_ns
+        if dir_mtime != self.mtime:
+            changed = True
+
+        order: List[str] = []
+        entries: Dict[str, Entry] = {}
+
+        with os.scandir(self.folder_path) as it:
+            for dir_entry in it:
+                filename = dir_entry.name
+                old = self.entries.get(filename)
+                try:
+                    if not dir_entry.is_file():
+                        entry = old if old is not None and old.is_dir else \
+                            Entry(filename, filename, is_dir=True)
+                    else:
+                        stat = dir_entry.stat()
+                        if (old is not None and not old.is_dir
+                                and old.size == stat.st_size
+                                and old.mtime == stat.st_mtime_ns):
+                            entry = old
+                        else:
+                            entry = read_entry(self.folder_path, filename,
+                                               self.icons, stat)
+                except OSError:
+                    # The file disappeared while scanning
+                    continue
+
+                if entry is not old:
+                    changed = True
+                order.append(filename)
+                entries[filename] = entry
+                yield entry
+
+        if len(entries) != len(self.entries):
+            changed = True
+
+        with lock:
+            self.mtime = dir_mtime
+            self.order = order
+            self.entries = entries
+        return changed
+
+    def update(self, filename: str) -> None:
+        """update.
+
+        Re-read the metadata of a single item of the folder
+
+        :param filename: Name of the item inside the folder
+        :type filename: str
+        :rtype: None
+        """
+
+        path = os.path.join(self.folder_path, filename)
+        try:
+            stat = os.stat(path)
+            if os.path.isdir(path):
+                entry = Entry(filename, filename, is_dir=True)
+            else:
+                entry = read_entry(self.folder_path, filename, self.icons,
+                                   stat)
+        except OSError:
+            self.remove(filename)
+            return
+
+        if filename not in self.entries:
+            self.order.append(filename)
+        self.entries[filename] = entry
+        self.dirty = True
+
+    def remove(self, filename: str) -> None:
+        """remove.
+
+        Forget an item of the folder
+
+        :param filename: Name of the item inside the folder
+        :type filename: str
+        :rtype: None
+        """
+
+        if self.entries.pop(filename, None) is not None:
+            self.order.remove(filename)
+            self.dirty = True
+
+    def get_entries(self) -> List[Entry]:
+        with lock:
+            return [self.entries[filename] for filename in self.order]
+
+
+_indexes: Dict[str, FolderIndex] = {}
+
+
+def get_folder_index(folder_path: str, icons: Dict[str, str]) -> FolderIndex:
+    """get_folder_index.
+
+    Return the up to date index of a folder, loading it from the bundle or the
+    cache on first use and saving it back when it changed
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param icons: Extension to icon mapping
+    :type icons: Dict[str, str]
+    :rtype: FolderIndex
+    """
+
+    with lock:
+        index = load_folder_index(folder_path, icons)
+
+        if not index.watched and index.refresh():
+            index.dirty = True
+
+        if index.dirty:
+            index.save()
+            index.dirty = False
+
+    return index
+
+
+def load_folder_index(folder_path: str, icons: Dict[str, str]) -> FolderIndex:
+    """load_folder_index.
+
+    Return the index of a folder as it is, loading it from the bundle or the
+    cache on first use
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param icons: Extension to icon mapping
+    :type icons: Dict[str, str]
+    :rtype: FolderIndex
+    """
+
+    with lock:
+        index = _indexes.get(folder_path)
+        if index is None and bundle is not None:
+            index = bundle.folder_index(folder_path)
+            if index is not None:
+                _indexes[folder_path] = index
+        if index is None:
+            index = FolderIndex(folder_path, icons)
+            index.load()
+            _indexes[folder_path] = index
+    return index
+
+
+def iter_folder_entries(folder_path: str,
+                        icons: Dict[str, str]) -> Iterator[Entry]:
+    """iter_folder_entries.
+
+    Yield the entries of a folder, in the order of get_folder_index. When the
+    index needs a refresh, each entry is yielded as soon as it is scanned,
+    before the new files of the folder are all read
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param icons: Extension to icon mapping
+    :type icons: Dict[str, str]
+    :rtype: Iterator[Entry]
+    """
+
+    index = load_folder_index(folder_path, icons)
+    if index.watched:
+        yield from index.get_entries()
+        return
+
+    changed = yield from index.scan()
+    with lock:
+        if changed or index.dirty:
+            index.save()
+            index.dirty = False
+
+
+def invalidate(path: str) -> None:
+    """invalidate.
+
+    Re-read the in-memory metadata of a file which was just modified
+
+    :param path: Path of the modified file
+    :type path: str
+    :rtype: None
+    """
+
+    with lock:
+        index = _indexes.get(os.path.dirname(path))
+        if index is not None:
+            index.update(os.path.basename(path))
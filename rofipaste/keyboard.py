@@ -0,0 +1,126 @@
+"""Typing engine: type text in a window with a single xdotool process."""
+from __future__ import annotations
+
+import os
+import time
+from subprocess import Popen, PIPE
+from rofipaste import config, trace
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional, Union
+
+# Delay between two typed characters, in milliseconds (xdotool's default)
+type_delay: int = 12
+# Texts longer than this are inserted through the clipboard, 0 to always type
+clipboard_threshold: int = 4096
+# Size of the chunks written to xdotool
+chunk_size: int = 512
+stats_file: str = os.path.join(config.xdg_state_home, 'rofipaste',
+                               'typing.log')
+
+
+class TypingSession:
+    """TypingSession.
+
+    A long-running ``xdotool type --file -`` process: the text written to it
+    is typed as it arrives, without starting a process per chunk
+    """
+
+    def __init__(self, active_window: str,
+                 delay: Optional[int] = None) -> None:
+        self.delay = type_delay if delay is None else delay
+        self.characters = 0
+        self.start = time.monotonic()
+        self.process = Popen([
+            'xdotool', 'type', '--window', active_window, '--delay',
+            str(self.delay), '--file', '-'
+        ],
+                             stdin=PIPE)
+
+    def write(self, characters: Union[str, bytes, memoryview]) -> None:
+        """write.
+
+        Type characters, chunk by chunk. Bytes and memoryviews hold UTF-8,
+        and are counted in bytes
+
+        :param characters: Characters to type
+        :type characters: Union[str, bytes, memoryview]
+        :rtype: None
+        """
+
+        assert self.process.stdin is not None
+        for i in range(0, len(characters), chunk_size):
+            chunk = characters[i:i + chunk_size]
+            try:
+                self.process.stdin.write(
+                    chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                # xdotool exited, its error is already on stderr
+                return
+            self.characters += len(chunk)
+
+    def close(self) -> float:
+        """close.
+
+        Wait for the end of the typing and record its speed
+
+        :rtype: float
+        :return: Typed characters per second
+        """
+
+        assert self.process.stdin is not None
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+
+        duration = time.monotonic() - self.start
+        trace.add('xdotool', duration)
+        rate = self.characters / duration if duration > 0 else 0.0
+        record_stats(self.characters, duration, rate, self.delay)
+        return rate
+
+
+def record_stats(characters: int, duration: float, rate: float,
+                 delay: int) -> None:
+    """record_stats.
+
+    Append the speed of a typing to the stats file, to tune the delay and
+    the clipboard threshold of a machine
+
+    :rtype: None
+    """
+
+    try:
+        os.makedirs(os.path.dirname(stats_file), exist_ok=True)
+        with open(stats_file, 'a') as stats:
+            stats.write(f'{time.time():.0f} characters={characters} '
+                        f'seconds={duration:.3f} '
+                        f'characters_per_second={rate:.1f} delay={delay}\n')
+    except OSError:
+        pass
+
+
+def type_text(characters: Union[str, memoryview],
+              active_window: str) -> float:
+    """type_text.
+
+    Type the characters in the active window
+
+    :param characters: Characters to type
+    :type characters: Union[str, memoryview]
+    :param active_window: ID of the active window
+    :type active_window: str
+    :rtype: float
+    :return: Typed characters per second
+    """
+
+    session = TypingSession(active_window)
+    try:
+        session.write(characters)
+    finally:
+        rate = session.close()
+    return rate
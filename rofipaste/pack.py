@@ -0,0 +1,448 @@
+"""Packed paste library: the whole paste tree in a single file.
+
+``rofipaste pack`` writes the metadata and the content of every entry of the
+paste folder into one bundle in the cache folder. When a bundle exists, the
+menus are built from it and the static entries are read from it, with one
+open and one mmap instead of a stat and an open per file: this matters on
+network file systems.
+
+A bundle is checked against the modification times of the folders and of
+their files: the folders which changed are packed again when the bundle is
+loaded, reading only their new and modified files.
+
+Layout of a bundle::
+
+    header: magic, version, offset and length of the table
+    contents of the entries
+    one JSON block per folder: the entries, with their content's location
+    JSON table: the root, the icons and each folder's mtime and block
+"""
+from __future__ import annotations
+
+import os
+import json
+import struct
+from hashlib import sha1
+from rofipaste import index
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import IO, Dict, List, Optional, Tuple
+
+PACK_VERSION: int = 2
+magic: bytes = b'RPK1'
+header = struct.Struct('<4sIQQ')
+packs_folder: str = os.path.join(index.cache_folder, 'packs')
+
+# Disabled in the daemon, whose watcher keeps the indexes up to date
+enabled: bool = True
+# The bundle of the paste folder, when it is packed
+current: Optional[Bundle] = None
+
+
+def get_bundle_file(root: str) -> str:
+    return os.path.join(packs_folder,
+                        sha1(root.encode('utf-8')).hexdigest() + '.pack')
+
+
+class Bundle:
+    """Bundle.
+
+    A memory-mapped bundle. The blocks of the folders are only parsed when
+    the folders are listed
+    """
+
+    def __init__(self, path: str) -> None:
+        import mmap
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        magic_, version, offset, length = header.unpack_from(self.map)
+        if magic_ != magic or version != PACK_VERSION:
+            raise ValueError(f'{path} is not a bundle of this version')
+        table = json.loads(bytes(self.view[offset:offset + length]))
+        self.root: str = table['root']
+        self.icons: Dict[str, str] = table['icons']
+        # Folder's path relative to the root: mtime, block offset and length
+        self.folders: Dict[str, List[int]] = table['folders']
+        self.blocks: Dict[str, Dict[str, list]] = {}
+
+    def close(self) -> None:
+        self.view.release()
+        self.map.close()
+
+    def stale_folders(self) -> List[str]:
+        """stale_folders.
+
+        Return the folders which changed since they were packed, or whose
+        files did
+
+        :rtype: List[str]
+        """
+
+        stale = []
+        for folder, (mtime, _, _) in self.folders.items():
+            folder_path = os.path.join(self.root, folder)
+            try:
+                if (os.stat(folder_path).st_mtime_ns != mtime
+                        or self.files_changed(folder, folder_path)):
+                    stale.append(folder)
+            except OSError:
+                stale.append(folder)
+        return stale
+
+    def files_changed(self, folder: str, folder_path: str) -> bool:
+        """files_changed.
+
+        Tell whether a file of a folder was modified in place since it was
+        packed, which leaves the mtime of the folder unchanged
+
+        :param folder: Folder's path relative to the root
+        :type folder: str
+        :param folder_path: Folder's path
+        :type folder_path: str
+        :raises OSError: if the folder cannot be read
+        :rtype: bool
+        """
+
+        block = self.block(folder) or {}
+        with os.scandir(folder_path) as it:
+            for entry in it:
+                values = block.get(entry.name)
+                # Index 5 is is_dir and 7 the mtime, see index.Entry
+                if (values is not None and not values[5]
+                        and entry.stat().st_mtime_ns != values[7]):
+                    return True
+        return False
+
+    def block(self, folder: str) -> Optional[Dict[str, list]]:
+        """block.
+
+        Return the packed entries of a folder, by filename
+
+        :param folder: Folder's path relative to the root
+        :type folder: str
+        :rtype: Optional[Dict[str, list]]
+        """
+
+        block = self.blocks.get(folder)
+        if block is None:
+            if folder not in self.folders:
+                return None
+            _, offset, length = self.folders[folder]
+            entries = json.loads(bytes(self.view[offset:offset + length]))
+            block = {values[0]: values for values in entries}
+            self.blocks[folder] = block
+        return block
+
+    def relative(self, path: str) -> Optional[str]:
+        if path == self.root:
+            return ''
+        if path.startswith(self.root + os.sep):
+            return path[len(self.root) + 1:]
+        return None
+
+    def folder_index(self, folder_path: str) -> Optional[index.FolderIndex]:
+        """folder_index.
+
+        Return the index of a packed folder, which is never refreshed
+
+        :param folder_path: Folder's path
+        :type folder_path: str
+        :rtype: Optional[index.FolderIndex]
+        """
+
+        folder = self.relative(folder_path)
+        if folder is None:
+            return None
+        block = self.block(folder)
+        if block is None:
+            return None
+
+        folder_index = index.FolderIndex(folder_path, self.icons)
+        folder_index.mtime = self.folders[folder][0]
+        folder_index.order = list(block)
+        folder_index.entries = {
+            filename: index.Entry.from_list(values[:-2])
+            for filename, values in block.items()
+        }
+        # Up to date as long as the bundle is
+        folder_index.watched = True
+        return folder_index
+
+    def content(self, path: str) -> Optional[memoryview]:
+        """content.
+
+        Return the packed content of a file
+
+        :param path: File's path
+        :type path: str
+        :rtype: Optional[memoryview]
+        """
+
+        relative = self.relative(path)
+        if not relative:
+            return None
+        folder, _, filename = relative.rpartition(os.sep)
+        block = self.block(folder)
+        if block is None or filename not in block:
+            return None
+        values = block[filename]
+        if values[5]:
+            # A folder
+            return None
+        offset, length = values[-2:]
+        return self.view[offset:offset + length]
+
+
+def build(root: str,
+          icons: Dict[str, str],
+          previous: Optional[Bundle] = None) -> Tuple[int, int]:
+    """build.
+
+    Pack a paste folder. The folders and files which did not change since the
+    previous bundle are copied from it instead of being read again
+
+    :param root: Paste folder
+    :type root: str
+    :param icons: Extension to icon mapping
+    :type icons: Dict[str, str]
+    :param previous: The previous bundle of the folder
+    :type previous: Optional[Bundle]
+    :rtype: Tuple[int, int]
+    :return: Number of packed entries and size of the bundle
+    """
+
+    bundle_file = get_bundle_file(root)
+    os.makedirs(packs_folder, exist_ok=True)
+    tmp_file = f'{bundle_file}.{os.getpid()}.tmp'
+
+    if previous is not None and previous.icons != icons:
+        previous = None
+    stale = set(previous.stale_folders()) if previous is not None else set()
+
+    entries = 0
+    with open(tmp_file, 'wb') as out:
+        out.write(header.pack(magic, PACK_VERSION, 0, 0))
+        blocks: Dict[str, List[list]] = {}
+        mtimes: Dict[str, int] = {}
+        seen = set()
+        pending = ['']
+
+        while pending:
+            folder = pending.pop()
+            folder_path = os.path.join(root, folder) if folder else root
+            real_path = os.path.realpath(folder_path)
+            if real_path in seen:
+                # A symlink loop
+                continue
+            seen.add(real_path)
+
+            old = None
+            if (previous is not None and folder in previous.folders
+                    and folder not in stale):
+                old = previous.block(folder)
+
+            try:
+                if old is not None:
+                    assert previous is not None
+                    mtimes[folder] = previous.folders[folder][0]
+                    block = [
+                        copy_entry(out, previous, values)
+                        for values in old.values()
+                    ]
+                else:
+                    mtimes[folder] = os.stat(folder_path).st_mtime_ns
+                    block = pack_folder(out, folder_path, icons, previous,
+                                        folder)
+            except OSError:
+                continue
+
+            blocks[folder] = block
+            for values in block:
+                if values[5]:
+                    pending.append(os.path.join(folder, values[0]))
+                else:
+                    entries += 1
+
+        folders = {}
+        for folder, block in blocks.items():
+            data = json.dumps(block, ensure_ascii=False).encode('utf-8')
+            folders[folder] = [mtimes[folder], out.tell(), len(data)]
+            out.write(data)
+
+        table = json.dumps({
+            'root': root,
+            'icons': icons,
+            'folders': folders
+        },
+                           ensure_ascii=False).encode('utf-8')
+        table_offset = out.tell()
+        out.write(table)
+        out.seek(0)
+        out.write(header.pack(magic, PACK_VERSION, table_offset, len(table)))
+        size = table_offset + len(table)
+
+    os.replace(tmp_file, bundle_file)
+    return entries, size
+
+
+def copy_entry(out: IO[bytes], previous: Bundle, values: list) -> list:
+    if values[5]:
+        return values
+    offset, length = values[-2:]
+    new_offset = out.tell()
+    out.write(previous.view[offset:offset + length])
+    return [*values[:-2], new_offset, length]
+
+
+def pack_folder(out: IO[bytes], folder_path: str, icons: Dict[str, str],
+                previous: Optional[Bundle], folder: str) -> List[list]:
+    """pack_folder.
+
+    Write the contents of the files of a folder, and return its block
+
+    :rtype: List[list]
+    """
+
+    folder_index = index.FolderIndex(folder_path, icons)
+    old = previous.block(folder) if previous is not None else None
+    if old is not None:
+        # Only the new and modified files are read again
+        folder_index.order = list(old)
+        folder_index.entries = {
+            filename: index.Entry.from_list(values[:-2])
+            for filename, values in old.items()
+        }
+    folder_index.refresh()
+
+    block = []
+    for entry in folder_index.get_entries():
+        values = entry.to_list()
+        if entry.is_dir:
+            block.append([*values, 0, 0])
+            continue
+
+        old_values = old.get(entry.filename) if old is not None else None
+        if old_values is not None and old_values[:-2] == values:
+            assert previous is not None
+            block.append(copy_entry(out, previous, old_values))
+            continue
+
+        try:
+            with open(os.path.join(folder_path, entry.filename), 'rb') as f:
+                content = f.read()
+        except OSError:
+            continue
+        block.append([*values, out.tell(), len(content)])
+        out.write(content)
+    return block
+
+
+def load(root: str, icons: Dict[str, str]) -> Optional[Bundle]:
+    """load.
+
+    Use the bundle of a paste folder, if it was packed. The folders which
+    changed since are packed again first
+
+    :param root: Paste folder
+    :type root: str
+    :param icons: Extension to icon mapping
+    :type icons: Dict[str, str]
+    :rtype: Optional[Bundle]
+    """
+
+    global current
+
+    if current is not None and current.root == root:
+        return current
+
+    bundle_file = get_bundle_file(root)
+    bundle: Optional[Bundle]
+    try:
+        bundle = Bundle(bundle_file)
+    except OSError:
+        return None
+    except ValueError:
+        # Written by another version: packed again from scratch
+        bundle = None
+
+    if (bundle is None or bundle.root != root or bundle.icons != icons
+            or bundle.stale_folders()):
+        try:
+            build(root, icons, bundle)
+        except OSError:
+            return None
+        finally:
+            if bundle is not None:
+                bundle.close()
+        try:
+            bundle = Bundle(bundle_file)
+        except (OSError, ValueError):
+            return None
+
+    current = bundle
+    index.bundle = bundle
+    return bundle
+
+
+def read(path: str) -> Optional[memoryview]:
+    """read.
+
+    Return the packed content of a file, None if it is not packed
+
+    :param path: File's path
+    :type path: str
+    :rtype: Optional[memoryview]
+    """
+
+    if current is None:
+        return None
+    return current.content(path)
+
+
+def invalidate(path: str) -> None:
+    """invalidate.
+
+    Mark the folder of a file modified in place as changed, so that the file
+    is packed again when the bundle is next loaded. The bundle does not need
+    to be loaded (e.g. with --edit-entry): any packed paste folder containing
+    the file counts
+
+    :param path: Path of the modified file
+    :type path: str
+    :rtype: None
+    """
+
+    if current is not None:
+        if current.relative(path) is None:
+            return
+    elif not is_packed(os.path.dirname(path)):
+        return
+    try:
+        os.utime(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+def is_packed(folder_path: str) -> bool:
+    """is_packed.
+
+    Tell whether a folder is in a packed paste folder: the folder itself or
+    one of its parents has a bundle
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: bool
+    """
+
+    folder_path = os.path.abspath(folder_path)
+    while True:
+        if os.path.exists(get_bundle_file(folder_path)):
+            return True
+        parent = os.path.dirname(folder_path)
+        if parent == folder_path:
+            return False
+        folder_path = parent
@@ -0,0 +1,149 @@
+"""In-process plugin entries.
+
+A plugin entry is a Python file with the ``.rpy`` extension, or an executable
+entry with the ``inprocess`` option (``# rofipaste: inprocess``). Instead of
+running it through its shebang, rofipaste imports it and pastes what its
+``render()`` function returns, which saves the startup of an interpreter.
+
+The modules are kept in memory, for the daemon, and their code objects in the
+cache folder, for the other runs: a plugin is only compiled again when the
+mtime or the size of its file changes. A plugin runs inside rofipaste, so the
+exec timeout does not apply to it.
+"""
+from __future__ import annotations
+
+import os
+import sys
+from hashlib import sha1
+from rofipaste import index, trace
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from types import CodeType, ModuleType
+    from typing import Dict, Tuple
+
+option: str = 'inprocess'
+code_folder: str = os.path.join(index.cache_folder, 'plugins')
+
+# Loaded plugins by path: mtime and size of their file, and module
+_modules: Dict[str, Tuple[int, int, ModuleType]] = {}
+
+
+class PluginError(Exception):
+    """PluginError.
+
+    A plugin entry failed to load or to render
+    """
+
+
+def is_plugin(filename: str, options: Dict[str, str], shebang: bool) -> bool:
+    """is_plugin.
+
+    Tell whether an entry is a plugin. The inprocess option is only read in
+    the executable entries, which the index and the menu mark as such
+
+    :param filename: Entry's file name or path
+    :type filename: str
+    :param options: Entry's options
+    :type options: Dict[str, str]
+    :param shebang: The entry starts with a shebang
+    :type shebang: bool
+    :rtype: bool
+    """
+
+    return (filename.endswith('.' + index.plugin_extension)
+            or (shebang and option in options))
+
+
+def compile_plugin(path: str, content: str, stat: os.stat_result) -> CodeType:
+    """compile_plugin.
+
+    Return the code of a plugin, from the cache folder if it was compiled
+    since its file last changed
+
+    :param path: Plugin's path
+    :type path: str
+    :param content: Plugin's source
+    :type content: str
+    :param stat: Stat of the plugin's file
+    :type stat: os.stat_result
+    :rtype: CodeType
+    """
+
+    import marshal
+
+    code_file = os.path.join(code_folder,
+                             sha1(path.encode('utf-8')).hexdigest())
+    # The code objects depend on the version of Python
+    stamp = f'{sys.hexversion} {stat.st_mtime_ns} {stat.st_size}\n'.encode()
+
+    try:
+        with open(code_file, 'rb') as f:
+            data = f.read()
+        if data.startswith(stamp):
+            return marshal.loads(data[len(stamp):])
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+
+    code = compile(content, path, 'exec')
+    try:
+        os.makedirs(code_folder, exist_ok=True)
+        tmp_file = f'{code_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(stamp + marshal.dumps(code))
+        os.replace(tmp_file, code_file)
+    except OSError:
+        pass
+    return code
+
+
+def load(path: str, content: str) -> ModuleType:
+    """load.
+
+    Return the module of a plugin, executing it again only if its file
+    changed
+
+    :param path: Plugin's path
+    :type path: str
+    :param content: Plugin's source
+    :type content: str
+    :rtype: ModuleType
+    """
+
+    from types import ModuleType
+
+    stat = os.stat(path)
+    loaded = _modules.get(path)
+    if loaded is not None and loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+        return loaded[2]
+
+    module = ModuleType(os.path.basename(path).split('.')[0])
+    module.__file__ = path
+    exec(compile_plugin(path, content, stat), module.__dict__)
+    _modules[path] = (stat.st_mtime_ns, stat.st_size, module)
+    return module
+
+
+def render(path: str, content: str) -> str:
+    """render.
+
+    Return the text of a plugin entry: what its render function returns
+
+    :param path: Plugin's path
+    :type path: str
+    :param content: Plugin's source
+    :type content: str
+    :raises PluginError: if the plugin fails
+    :rtype: str
+    """
+
+    with trace.stage('plugin'):
+        try:
+            result = load(path, content).render()
+        except OSError:
+            raise
+        except Exception as error:
+            raise PluginError(
+                f'{os.path.basename(path)}: {type(error).__name__}: {error}'
+            ) from error
+    return '' if result is None else str(result)
@@ -0,0 +1,169 @@
+"""Speculative execution of the executable entries while the menu is open."""
+from __future__ import annotations
+
+import os
+import threading
+from subprocess import DEVNULL
+from rofipaste import runner
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from typing import Dict, List, Optional, Tuple, Union
+
+max_workers: int = 4
+
+
+def get_key(path: str) -> Optional[Tuple[str, int]]:
+    """get_key.
+
+    Return the path and the mtime of an entry, so that an entry edited since
+    it was prefetched does not get the output of its previous version
+
+    :param path: Entry's path
+    :type path: str
+    :rtype: Optional[Tuple[str, int]]
+    :return: The key, or None if the entry is gone
+    """
+
+    try:
+        return path, os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class Prefetcher:
+    """Prefetcher.
+
+    Run some executable entries in a bounded pool of workers, so that their
+    output is ready if they are picked. The outputs are keyed by the path and
+    the mtime of their entry
+    """
+
+    def __init__(self, workers: int = max_workers) -> None:
+        # Only imported when prefetching is enabled
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures: Dict[Tuple[str, int], Future] = {}
+        self.executions: Dict[Tuple[str, int], runner.Execution] = {}
+        self.lock = threading.Lock()
+        self.discarded = False
+
+    def _execute(self, key: Tuple[str, int],
+                 args: List[str]) -> Optional[Union[str, memoryview]]:
+        with self.lock:
+            if self.discarded:
+                return None
+            execution = runner.Execution(args, stderr=DEVNULL)
+            self.executions[key] = execution
+
+        try:
+            # A timeout is raised again by take: the entry is not run twice
+            output = execution.output()
+        finally:
+            with self.lock:
+                self.executions.pop(key, None)
+        if execution.process.returncode < 0:
+            # Killed by discard
+            return None
+        return output
+
+    def submit(self, path: str, args: List[str]) -> None:
+        """submit.
+
+        Start running an entry
+
+        :param path: Entry's path
+        :type path: str
+        :param args: Command line running the entry
+        :type args: List[str]
+        :rtype: None
+        """
+
+        key = get_key(path)
+        if key is not None and key not in self.futures:
+            self.futures[key] = self.executor.submit(self._execute, key, args)
+
+    def take(self, path: str) -> Optional[Union[str, memoryview]]:
+        """take.
+
+        Return the output of a prefetched entry, waiting for it if it is still
+        running. None if the entry was not prefetched, or was edited since
+
+        :param path: Entry's path
+        :type path: str
+        :raises TimeoutExpired: if the prefetched entry ran for too long
+        :rtype: Optional[Union[str, memoryview]]
+        """
+
+        from concurrent.futures import CancelledError
+
+        key = get_key(path)
+        future = self.futures.pop(key, None) if key is not None else None
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except (CancelledError, OSError):
+            return None
+
+    def discard(self) -> None:
+        """discard.
+
+        Drop the outputs nobody picked, killing the entries still running
+
+        :rtype: None
+        """
+
+        with self.lock:
+            self.discarded = True
+            for future in self.futures.values():
+                future.cancel()
+            for execution in self.executions.values():
+                execution.kill()
+        self.futures.clear()
+        self.executor.shutdown(wait=False)
+
+
+current: Optional[Prefetcher] = None
+
+
+def start(entries: Dict[str, List[str]]) -> None:
+    """start.
+
+    Discard the previous prefetch and prefetch the given entries
+
+    :param entries: Command lines of the entries to run, by path
+    :type entries: Dict[str, List[str]]
+    :rtype: None
+    """
+
+    global current
+    discard()
+    if entries:
+        current = Prefetcher()
+        for path, args in entries.items():
+            current.submit(path, args)
+
+
+def take(path: str) -> Optional[Union[str, memoryview]]:
+    """take.
+
+    Return the prefetched output of an entry, or None if it was not prefetched
+
+    :param path: Entry's path
+    :type path: str
+    :raises TimeoutExpired: if the prefetched entry ran for too long
+    :rtype: Optional[Union[str, memoryview]]
+    """
+
+    if current is None:
+        return None
+    return current.take(path)
+
+
+def discard() -> None:
+    global current
+    if current is not None:
+        current.discard()
+        current = None
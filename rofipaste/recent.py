@@ -0,0 +1,209 @@
+"""Ring of the recently pasted entries, for the Alt+1 to Alt+0 shortcuts.
+
+The ring is a small memory-mapped file with a fixed number of fixed-size
+slots. Each slot holds the path of an entry and, for the static entries that
+fit in it, their content: a recent entry is pasted without reading its file
+again, as long as its size and modification time did not change.
+"""
+from __future__ import annotations
+
+import os
+import struct
+from rofipaste import config, index, plugins
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import List, Optional, Tuple
+
+ring_file: str = os.path.join(config.xdg_state_home, 'rofipaste', 'recent')
+# Number of slots, one per shortcut
+slots: int = 10
+# Size of a slot; the longer contents are read from the file when pasted
+slot_size: int = 8192
+
+magic: bytes = b'RPR1'
+# magic, slots, slot size, number of pushes
+header = struct.Struct('<4sHIQ')
+# flags, mtime in ns, size, path length, content length
+slot_header = struct.Struct('<BqqHI')
+USED = 1
+CONTENT = 2
+
+
+class Ring:
+    """Ring.
+
+    The memory-mapped ring file. Slot ``(head - 1 - n) % slots`` holds the
+    n-th most recent entry
+    """
+
+    def __init__(self, path: str) -> None:
+        import mmap
+
+        size = header.size + slots * slot_size
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size != size:
+            os.ftruncate(self.fd, 0)
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        if header.unpack_from(self.map)[:3] != (magic, slots, slot_size):
+            header.pack_into(self.map, 0, magic, slots, slot_size, 0)
+
+    def close(self) -> None:
+        self.map.close()
+        os.close(self.fd)
+
+    def lock(self, exclusive: bool) -> None:
+        import fcntl
+        fcntl.flock(self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    @property
+    def head(self) -> int:
+        return header.unpack_from(self.map)[3]
+
+    @head.setter
+    def head(self, value: int) -> None:
+        header.pack_into(self.map, 0, magic, slots, slot_size, value)
+
+    def offset(self, position: int) -> int:
+        return header.size + (self.head - 1 - position) % slots * slot_size
+
+    def read(self,
+             position: int) -> Optional[Tuple[str, int, int, Optional[bytes]]]:
+        """read.
+
+        Return the path, modification time, size and content of the
+        position-th most recent entry
+
+        :param position: 0 for the most recent entry
+        :type position: int
+        :rtype: Optional[Tuple[str, int, int, Optional[bytes]]]
+        """
+
+        if position >= min(self.head, slots):
+            return None
+        offset = self.offset(position)
+        flags, mtime, size, path_length, content_length = \
+            slot_header.unpack_from(self.map, offset)
+        if not flags & USED:
+            return None
+        start = offset + slot_header.size
+        path = self.map[start:start + path_length].decode('utf-8')
+        content = None
+        if flags & CONTENT:
+            start += path_length
+            content = self.map[start:start + content_length]
+        return path, mtime, size, content
+
+    def paths(self) -> List[str]:
+        paths = []
+        for position in range(slots):
+            item = self.read(position)
+            if item is None:
+                break
+            paths.append(item[0])
+        return paths
+
+    def push(self, path: str, mtime: int, size: int,
+             content: Optional[bytes]) -> None:
+        """push.
+
+        Make an entry the most recent one. An entry already in the ring is
+        moved to the front instead of being added twice
+
+        :rtype: None
+        """
+
+        data = path.encode('utf-8')
+        if slot_header.size + len(data) > slot_size:
+            return
+        flags = USED
+        if (content is not None and slot_header.size + len(data) +
+                len(content) <= slot_size):
+            flags |= CONTENT
+        else:
+            content = b''
+
+        paths = self.paths()
+        if path in paths:
+            # Shift the more recent entries back by one slot
+            for position in range(paths.index(path), 0, -1):
+                source = self.offset(position - 1)
+                target = self.offset(position)
+                self.map[target:target + slot_size] = \
+                    self.map[source:source + slot_size]
+        else:
+            self.head += 1
+
+        offset = self.offset(0)
+        slot_header.pack_into(self.map, offset, flags, mtime, size, len(data),
+                              len(content))
+        start = offset + slot_header.size
+        self.map[start:start + len(data) + len(content)] = data + content
+
+
+def push(path: str) -> None:
+    """push.
+
+    Record a pasted entry as the most recent one
+
+    :param path: Entry's path
+    :type path: str
+    :rtype: None
+    """
+
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            head = f.read(slot_size)
+        # The output of an executable entry changes, only its path is kept
+        shebang = head[:2] == b'#!'
+        options = index.get_entry_options(head.decode('utf-8', 'replace'))
+        content = None if (shebang or plugins.is_plugin(
+            path, options, shebang)) else head
+        if content is not None and stat.st_size > slot_size:
+            content = None
+
+        ring = Ring(ring_file)
+        try:
+            ring.lock(exclusive=True)
+            ring.push(path, stat.st_mtime_ns, stat.st_size, content)
+        finally:
+            ring.close()
+    except OSError:
+        pass
+
+
+def get(position: int) -> Optional[Tuple[str, Optional[str]]]:
+    """get.
+
+    Return the path of the position-th most recent entry and its content, if
+    it is stored in the ring and still up to date
+
+    :param position: 0 for the most recent entry
+    :type position: int
+    :rtype: Optional[Tuple[str, Optional[str]]]
+    """
+
+    if not os.path.exists(ring_file):
+        return None
+
+    try:
+        ring = Ring(ring_file)
+        try:
+            ring.lock(exclusive=False)
+            item = ring.read(position)
+        finally:
+            ring.close()
+        if item is None:
+            return None
+
+        path, mtime, size, content = item
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    if content is None or (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+        return path, None
+    return path, content.decode('utf-8', 'replace').rstrip()
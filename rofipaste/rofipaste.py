@@ -1,15 +1,24 @@
 """Main module."""
+from __future__ import annotations
 
 import os
-from subprocess import run, CompletedProcess
-from xdg import BaseDirectory
+from subprocess import run, CompletedProcess, Popen, PIPE, DEVNULL
 from enum import Enum, auto
-from typing import List, Tuple, Dict
-import click
+from functools import partial
+from rofipaste import (clipboard, config, exec_cache, history, index,
+                       keyboard, pack, plugins, prefetch, runner, search,
+                       trace, usage)
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import (IO, Any, Callable, Dict, Iterable, Iterator, List,
+                        Optional, Tuple, Union)
 
 folder_icon: str = ""
 undo_icon: str = ""
 edit_config_icon: str = ""
+history_icon: str = ""
+clip_icon: str = ""
 paste_icon_dict: Dict[str, str] = dict(py="",
                                        js="",
                                        java="",
@@ -19,9 +28,24 @@ paste_icon_dict: Dict[str, str] = dict(py="",
                                        cpp="C++",
                                        sh="")
 paste_icon_dict[''] = ''
-config_file_name: str = os.path.join(BaseDirectory.xdg_config_home,
-                                     'rofipaste/config')
+config_file_name: str = config.config_file_name
 command_prefix: str = "/"
+# The custom keybinding N makes rofi exit with the code 9 + N. The default
+# ones, Alt+1 to Alt+0 (codes 10 to 19), paste the recent entries
+rofi_keybindings: List[str] = [
+    '-kb-custom-11', 'Ctrl+c', '-kb-custom-12', 'Ctrl+t', '-kb-custom-13',
+    'Alt+p', "-kb-custom-14", "Alt+e", "-kb-custom-15", "Alt+r"
+]
+# Number of most frecently used executable entries prefetched in a folder
+prefetch_frecent: int = 3
+# Static entries bigger than this, in bytes, are streamed from their file
+stream_threshold: int = 1024 * 1024
+# Rows rofi reads before showing a streamed menu, and delay between two
+# flushes of the rows written to rofi while the menu is built, in seconds
+async_pre_read: int = 25
+flush_interval: float = 0.01
+# Rows of a streamed menu written to rofi at once
+write_chunk: int = 256
 
 
 class Action(Enum):
@@ -30,86 +54,709 @@ class Action(Enum):
     TYPE = auto()
 
 
+class RowKind(Enum):
+    ENTRY = auto()
+    FOLDER = auto()
+    PARENT = auto()
+    CONFIG = auto()
+    # The clipboard history folder and its contents
+    HISTORY = auto()
+    CLIP = auto()
+
+
+class Row:
+    """Row.
+
+    A row of a menu: its text, and what picking it opens. rofi returns the
+    index of the picked row, which is looked up in the table of the menu's
+    rows instead of parsing the text back
+    """
+
+    __slots__ = ('text', 'kind', 'path')
+
+    def __init__(self, text: str, kind: RowKind, path: str = '') -> None:
+        self.text = text
+        self.kind = kind
+        # The entry, the folder or the stored clipboard content, empty for the
+        # configuration item
+        self.path = path
+
+
+def config_row() -> Row:
+    return Row(f"{edit_config_icon} Edit configuration file", RowKind.CONFIG)
+
+
+def parent_row(parent_path: str) -> Row:
+    return Row(f'{undo_icon} ..', RowKind.PARENT, parent_path)
+
+
+def history_row() -> Row:
+    return Row(f'{history_icon} Clipboard history', RowKind.HISTORY,
+               history.history_folder)
+
+
+def iter_menu_rows(folder_path: str, base_folder: str,
+                   flat: bool = False) -> Iterator[Row]:
+    """iter_menu_rows.
+
+    Yield the rows of the menu of a folder: its entries, or those of all the
+    subfolders for the flat menu, or the clipboard history. The top folder
+    lists the clipboard history before the configuration item, when it is
+    not empty
+
+    :param folder_path: Folder's path, or the clipboard history folder
+    :type folder_path: str
+    :param base_folder: Top paste folder
+    :type base_folder: str
+    :param flat: List the entries of all the subfolders
+    :type flat: bool
+    :rtype: Iterator[Row]
+    """
+
+    if folder_path == history.history_folder:
+        yield parent_row(base_folder)
+        yield from iter_history_rows()
+        return
+
+    if folder_path != base_folder:
+        yield parent_row(os.path.dirname(folder_path))
+    if flat:
+        rows = iter_tree_rows(base_folder)
+    else:
+        rows = iter_folder_rows(folder_path)
+    for row in rows:
+        if (row.kind == RowKind.CONFIG and folder_path == base_folder
+                and history.has_items()):
+            yield history_row()
+        yield row
+
+
+def iter_history_rows() -> Iterator[Row]:
+    """iter_history_rows.
+
+    Yield the rows of the clipboard history, the most recent content first.
+    Only the beginning of each content is read, for its preview
+
+    :rtype: Iterator[Row]
+    """
+
+    for path, preview in history.iter_previews():
+        yield Row(f'{clip_icon} {preview}', RowKind.CLIP, path)
+
+
+def tabulate(rows: Iterable[Row], table: List[Row]) -> Iterator[str]:
+    """tabulate.
+
+    Yield the texts of menu rows, adding each row to the table of the menu
+    when it is yielded, so that the index of any row shown by rofi is in the
+    table
+
+    :param rows: The rows
+    :type rows: Iterable[Row]
+    :param table: The rows already shown
+    :type table: List[Row]
+    :rtype: Iterator[str]
+    """
+
+    for row in rows:
+        table.append(row)
+        yield row.text
+
+
 def read_folder_content(folder_path: str) -> str:
     """read_folder_content.
     
-    Read the content of the specified folder and return the found entries
+    Read the content of the specified folder and return the found entries.
+    The metadata of the entries comes from the persistent folder index, so
+    only new or modified files are opened. The most frecently used entries
+    come first
 
     :param folder_path: Folder's path
     :type folder_path: str
     :rtype: str
     """
 
-    file_entries: str = ''
-    exec_entries: str = ''
-    dir_entries: str = ''
+    return ''.join(row + '\n' for row in iter_folder_content(folder_path))
+
+
+def iter_folder_content(folder_path: str) -> Iterator[str]:
+    """iter_folder_content.
+
+    Yield the menu rows of a folder as its entries are scanned, like
+    read_folder_content
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: Iterator[str]
+    """
+
+    return (row.text for row in iter_folder_rows(folder_path))
 
-    for f in os.listdir(folder_path):
-        filename = os.path.join(folder_path, f)
-        if os.path.isfile(filename):
-            with open(filename, 'r') as file_:
-                firstline = file_.readline()
-            extension = '.'.join(f.split('.')[1:])
 
-            try:
-                icon = paste_icon_dict[extension]
-                entry_name = f.split('.')[0]
-            except:
-                icon = paste_icon_dict['']
-                entry_name = f
+def iter_folder_rows(folder_path: str) -> Iterator[Row]:
+    """iter_folder_rows.
 
-            exec_entries += f'{icon} {entry_name}'
+    Yield the menu rows of a folder as its entries are scanned. The
+    subfolders and the configuration item come last, once the folder is
+    scanned
 
-            if firstline[:2] == "#!":
-                exec_entries += ' (exec)'
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: Iterator[Row]
+    """
 
-            exec_entries += '\n'
+    dir_rows: List[Row] = []
+    entries: Iterator[index.Entry] = index.iter_folder_entries(
+        folder_path, paste_icon_dict)
+    if usage.enabled:
+        entries = usage.rank_stream(
+            entries, lambda entry: os.path.join(folder_path, entry.filename),
+            usage.get_scores(folder_path))
+
+    for entry in entries:
+        path = os.path.join(folder_path, entry.filename)
+        if entry.is_dir:
+            dir_rows.append(
+                Row(f'{folder_icon} {entry.filename}', RowKind.FOLDER, path))
         else:
-            dir_entries += f'{folder_icon} {f}\n'
+            yield Row(entry_text(entry), RowKind.ENTRY, path)
+
+    yield from dir_rows
+    yield config_row()
+
+
+def entry_text(entry: index.Entry, prefix: str = '') -> str:
+    """entry_text.
+
+    Return the menu text of a paste entry
+
+    :param entry: The entry
+    :type entry: index.Entry
+    :param prefix: Relative path of the entry's folder, for the flat menu
+    :type prefix: str
+    :rtype: str
+    """
+
+    if entry.is_exec:
+        return f'{entry.icon} {prefix}{entry.name} (exec)'
+    return f'{entry.icon} {prefix}{entry.name}'
+
 
-    return (file_entries + exec_entries + dir_entries +
-            f"{edit_config_icon} Edit configuration file\n")
+def walk_tree(folder_path: str) -> Iterator[Tuple[str, index.Entry]]:
+    """walk_tree.
+
+    Yield the paste entries of a folder and all its subfolders, with the
+    relative path of their folder ('' or ending with '/'). The files of a
+    folder come before its subfolders
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: Iterator[Tuple[str, index.Entry]]
+    """
+
+    stack: List[Tuple[str, str]] = [(folder_path, '')]
+    seen = set()
+
+    while stack:
+        folder, prefix = stack.pop()
+        real_folder = os.path.realpath(folder)
+        if real_folder in seen:
+            # A symbolic link loop
+            continue
+        seen.add(real_folder)
+
+        subfolders: List[Tuple[str, str]] = []
+        for entry in index.iter_folder_entries(folder, paste_icon_dict):
+            if entry.is_dir:
+                subfolders.append((os.path.join(folder, entry.filename),
+                                   f'{prefix}{entry.filename}/'))
+            else:
+                yield prefix, entry
+        stack.extend(reversed(subfolders))
+
+
+def read_tree_content(folder_path: str) -> str:
+    """read_tree_content.
+
+    Return the entries of a folder and all its subfolders in a single menu,
+    each with its relative path. The most frecently used entries come first
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: str
+    """
+
+    return ''.join(row + '\n' for row in iter_tree_content(folder_path))
+
+
+def iter_tree_content(folder_path: str) -> Iterator[str]:
+    """iter_tree_content.
+
+    Yield the rows of the flat menu of a folder as its entries are scanned,
+    like read_tree_content
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: Iterator[str]
+    """
+
+    return (row.text for row in iter_tree_rows(folder_path))
+
+
+def iter_tree_rows(folder_path: str) -> Iterator[Row]:
+    """iter_tree_rows.
+
+    Yield the rows of the flat menu of a folder as its entries are scanned
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: Iterator[Row]
+    """
+
+    tree: Iterator[Tuple[str, index.Entry]] = walk_tree(folder_path)
+    if usage.enabled:
+        tree = usage.rank_stream(
+            tree, lambda item: os.path.join(folder_path, item[0], item[1].
+                                            filename),
+            usage.get_scores(folder_path, recursive=True))
+
+    for prefix, entry in tree:
+        yield Row(entry_text(entry, prefix), RowKind.ENTRY,
+                  os.path.join(folder_path, prefix, entry.filename))
+    yield config_row()
+
+
+def parse_command(cmd: str) -> List[str]:
+    """parse_command.
+
+    Return the name and the arguments of a command typed in the menu
+
+    :param cmd: The command, with or without its prefix
+    :type cmd: str
+    :rtype: List[str]
+    """
+
+    if cmd[0] == command_prefix:
+        return cmd[1:].split(" ")
+    return cmd.split(" ")
 
 
 def commandInterpreter(cmd: str, editor: str) -> None:
+    help_message = "\n".join([
+        "Available commands:",
+        " - /help : Show this menu",
+        " - /config : Open your config file in your default editor",
+        " - /search <terms> : List the entries containing all the terms",
+    ])
     commands = {
         "config":
         lambda *args: edit_file(config_file_name, editor, xdg_open=True),
         "help":
-        lambda *args: show_message(
-            "Available commands:\n - /help : Show this menu\n - /config : Open your config file in your default editor"
-        ),
+        lambda *args: show_message(help_message),
     }
-    if cmd[0] == command_prefix:
-        args = cmd[1:].split(" ")
-    else:
-        args = cmd.split(" ")
-    commands[args[0]](args[1:])
+    args = parse_command(cmd)
+    commands.get(args[0], commands["help"])(args[1:])
+
+
+def search_entries(folder_path: str,
+                   terms: List[str]) -> List[Tuple[str, str, str]]:
+    """search_entries.
+
+    Return the static entries of a folder and its subfolders containing all
+    the terms. The search index is updated first, for the new and modified
+    entries only
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param terms: Searched terms
+    :type terms: List[str]
+    :rtype: List[Tuple[str, str, str]]
+    :return: The path of each entry, its menu text and a snippet of its
+        content as pango markup
+    """
+
+    tree = {
+        f'{folder_path}/{prefix}{entry.filename}': (prefix, entry)
+        for prefix, entry in walk_tree(folder_path)
+    }
+    with trace.stage('search'):
+        search.update(folder_path,
+                      {path: entry
+                       for path, (_, entry) in tree.items()})
+        found = search.find(folder_path, terms)
+
+    return [(path, entry_text(tree[path][1], tree[path][0]), snippet)
+            for path, snippet in found if path in tree]
+
 
+def read_search_content(results: List[Tuple[str, str, str]]) -> str:
+    """read_search_content.
 
-def fileInterpreter(path: str) -> str:
+    Return the menu of the results of a search, one row per entry with its
+    snippet
+
+    :param results: Results of search_entries
+    :type results: List[Tuple[str, str, str]]
+    :rtype: str
+    """
+
+    return ''.join(f'{text}  <small><i>{snippet}</i></small>\n'
+                   for _, text, snippet in results)
+
+
+def get_exec_command(path: str, content: str) -> List[str]:
+    """get_exec_command.
+
+    Return the command line running an executable entry
+
+    :param path: File's path
+    :type path: str
+    :param content: File's content
+    :type content: str
+    :rtype: List[str]
+    """
+
+    return runner.get_command(path, content)
+
+
+def get_exec_ttl(content: str) -> float:
+    try:
+        return float(index.get_entry_options(content).get('ttl', 0))
+    except ValueError:
+        return 0
+
+
+def fileInterpreter(
+    path: str,
+    use_cache: bool = True,
+    open_sink: Optional[Callable[[], Any]] = None
+) -> Optional[Union[str, memoryview]]:
     """fileInterpreter
 
     Interpret the specified file (according to its extension).
+    A plugin entry is rendered inside rofipaste (see rofipaste.plugins).
+    The output of an executable entry with a ``ttl`` option is cached for
+    that many seconds, and the output of a prefetched entry is reused.
+    Otherwise, if open_sink is given, the output is written to the sink it
+    returns as it arrives
 
     :param path: File's path
     :type path: str
-    :rtype: str
+    :param use_cache: Reuse a cached or prefetched output of an executable
+        entry
+    :type use_cache: bool
+    :param open_sink: Return an object with write and close methods
+    :type open_sink: Optional[Callable[[], Any]]
+    :raises TimeoutExpired: if an executable entry runs for too long
+    :raises plugins.PluginError: if a plugin entry fails
+    :rtype: Optional[Union[str, memoryview]]
+    :return: What to paste, or None if it was written to the sink
     """
 
-    with open(path, 'r') as f:
-        content: str = f.read()
+    packed = pack.read(path)
+    if packed is not None:
+        # Like a file opened in text mode
+        content: str = str(packed, 'utf-8')
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+    else:
+        with open(path, 'r') as f:
+            content = f.read()
+
+    if plugins.is_plugin(path, index.get_entry_options(content),
+                         content[:2] == '#!'):
+        return plugins.render(path, content).rstrip()
 
     if content[:2] == "#!":
-        shebang: str = content.split('\n')[0]
-        output: str = run([shebang[2:], path],
-                          capture_output=True,
-                          encoding='utf-8').stdout
-        return output.rstrip()
+        args: List[str] = get_exec_command(path, content)
+        ttl = get_exec_ttl(content)
+        key = exec_cache.get_key(path, args) if ttl > 0 else None
+
+        output: Optional[Union[str, memoryview]] = None
+        if use_cache:
+            if key is not None:
+                output = exec_cache.get(key)
+                if output is not None:
+                    return output
+            output = prefetch.take(path)
+
+        if output is None:
+            if open_sink is not None and key is None:
+                sink = open_sink()
+                try:
+                    runner.execute(args, sink)
+                finally:
+                    sink.close()
+                return None
+            output = runner.execute(args)
+
+        # The big outputs are not worth caching
+        if key is not None and isinstance(output, str):
+            exec_cache.put(key, output, ttl)
+        return output
 
     return content.rstrip()
 
 
+def map_entry(path: str) -> Optional[memoryview]:
+    """map_entry.
+
+    Return a view of the memory-mapped content of a big static entry, without
+    its trailing whitespace, or None for the other entries
+
+    :param path: File's path
+    :type path: str
+    :rtype: Optional[memoryview]
+    """
+
+    import mmap
+
+    if path.endswith('.' + index.plugin_extension):
+        return None
+
+    packed = pack.read(path)
+    if packed is not None:
+        if len(packed) <= stream_threshold or packed[:2] == b'#!':
+            return None
+        return runner.trim_view(packed)
+
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= stream_threshold:
+            return None
+        content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if content[:2] == b'#!':
+        content.close()
+        return None
+
+    # The mapping is unmapped when the last view is released
+    return runner.trim_view(content)
+
+
+def read_entry_data(
+    path: str,
+    use_cache: bool = True,
+    open_sink: Optional[Callable[[], Any]] = None
+) -> Optional[Union[str, memoryview]]:
+    """read_entry_data.
+
+    Return what to paste for an entry: a view of the file for the big static
+    entries, which are never decoded nor copied, the output of
+    fileInterpreter for the others
+
+    :param path: File's path
+    :type path: str
+    :param use_cache: Reuse a cached or prefetched output of an executable
+        entry
+    :type use_cache: bool
+    :param open_sink: Return where to write the output of an executable entry
+        as it arrives
+    :type open_sink: Optional[Callable[[], Any]]
+    :rtype: Optional[Union[str, memoryview]]
+    :return: What to paste, or None if it was written to the sink
+    """
+
+    data = map_entry(path)
+    if data is None:
+        return fileInterpreter(path, use_cache, open_sink)
+    return data
+
+
+def paste_entry(path: str,
+                action: Action,
+                active_window: str,
+                use_cache: bool = True) -> None:
+    """paste_entry.
+
+    Paste an entry. When the action allows it, the output of an executable
+    entry is copied or typed as it arrives instead of being kept in memory
+
+    :param path: File's path
+    :type path: str
+    :param action: The action to perform (paste / type ...)
+    :type action: Action
+    :param active_window: ID of the active window
+    :type active_window: str
+    :param use_cache: Reuse a cached or prefetched output of an executable
+        entry
+    :type use_cache: bool
+    :raises TimeoutExpired: if an executable entry runs for too long
+    :rtype: None
+    """
+
+    open_sink: Optional[Callable[[], Any]] = None
+    if action == Action.COPY_ONLY:
+        open_sink = partial(clipboard.get_backend().writer, 'CLIPBOARD')
+    elif action == Action.TYPE and keyboard.clipboard_threshold == 0:
+        open_sink = partial(keyboard.TypingSession, active_window)
+
+    with trace.stage('read'):
+        data = read_entry_data(path, use_cache, open_sink)
+    if data is not None:
+        with trace.stage('paste'):
+            default_handle(data, action, active_window)
+
+
+def read_entries_data(paths: List[str],
+                      use_cache: bool = True) -> List[Union[str, memoryview]]:
+    """read_entries_data.
+
+    Return what to paste for several entries, in the same order. The
+    executable entries run concurrently
+
+    :param paths: Files' paths
+    :type paths: List[str]
+    :param use_cache: Reuse the cached or prefetched outputs of the
+        executable entries
+    :type use_cache: bool
+    :raises TimeoutExpired: if an executable entry runs for too long
+    :rtype: List[Union[str, memoryview]]
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read(path: str) -> Union[str, memoryview]:
+        data = read_entry_data(path, use_cache)
+        assert data is not None
+        return data
+
+    if len(paths) < 2:
+        return [read(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        return list(executor.map(read, paths))
+
+
+def paste_entries(paths: List[str],
+                  action: Action,
+                  active_window: str,
+                  separator: str = '\n',
+                  use_cache: bool = True) -> None:
+    """paste_entries.
+
+    Paste several entries at once, joined by a separator, so that they are
+    inserted with a single clipboard save, paste and restore
+
+    :param paths: Files' paths, in the order of the paste
+    :type paths: List[str]
+    :param action: The action to perform (paste / type ...)
+    :type action: Action
+    :param active_window: ID of the active window
+    :type active_window: str
+    :param separator: Inserted between two entries
+    :type separator: str
+    :param use_cache: Reuse the cached or prefetched outputs of the
+        executable entries
+    :type use_cache: bool
+    :raises TimeoutExpired: if an executable entry runs for too long
+    :rtype: None
+    """
+
+    with trace.stage('read'):
+        texts = [
+            data if isinstance(data, str) else str(data, 'utf-8', 'replace')
+            for data in read_entries_data(paths, use_cache)
+        ]
+    with trace.stage('paste'):
+        default_handle(separator.join(texts), action, active_window)
+
+
+def paste_clips(paths: List[str],
+                action: Action,
+                active_window: str,
+                separator: str = '\n') -> None:
+    """paste_clips.
+
+    Paste contents of the clipboard history, joined by a separator. They are
+    pasted as they were copied, never run
+
+    :param paths: Paths of the stored contents, in the order of the paste
+    :type paths: List[str]
+    :param action: The action to perform (paste / type ...)
+    :type action: Action
+    :param active_window: ID of the active window
+    :type active_window: str
+    :param separator: Inserted between two contents
+    :type separator: str
+    :rtype: None
+    """
+
+    with trace.stage('read'):
+        texts = [history.read(path) for path in paths]
+    with trace.stage('paste'):
+        default_handle(separator.join(texts), action, active_window)
+
+
+def prefetch_folder(folder_path: str) -> None:
+    """prefetch_folder.
+
+    Start running the executable entries of a folder with a ``prefetch``
+    option and the most frecently used ones, unless their output is already
+    cached
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :rtype: None
+    """
+
+    entries: Dict[str, List[str]] = {}
+    frecent = set()
+    if usage.enabled:
+        scores = usage.get_scores(folder_path)
+        frecent = set(sorted(scores, key=scores.__getitem__,
+                             reverse=True)[:prefetch_frecent])
+
+    for entry in index.get_folder_index(folder_path,
+                                        paste_icon_dict).get_entries():
+        path = os.path.join(folder_path, entry.filename)
+        if not entry.is_exec or ('prefetch' not in entry.options
+                                 and path not in frecent):
+            continue
+        if plugins.is_plugin(entry.filename, entry.options, True):
+            # Rendered in no time once picked
+            continue
+
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except OSError:
+            continue
+
+        args = get_exec_command(path, content)
+        if (get_exec_ttl(content) > 0 and exec_cache.get(
+                exec_cache.get_key(path, args)) is not None):
+            continue
+        entries[path] = args
+
+    prefetch.start(entries)
+
+
+def start_active_window() -> Callable[[], str]:
+    """start_active_window.
+
+    Start looking up the active window in the background, so that xdotool
+    runs while the menu is built. It must be over before rofi opens, since
+    rofi's window then becomes the active one
+
+    :rtype: Callable[[], str]
+    :return: Wait for the lookup and return the id of the active window
+    """
+
+    with trace.stage('active_window'):
+        process = Popen(['xdotool', 'getactivewindow'],
+                        stdout=PIPE,
+                        stderr=PIPE,
+                        encoding='utf-8')
+    result: List[str] = []
+
+    def wait() -> str:
+        if not result:
+            with trace.stage('active_window'):
+                result.append(process.communicate()[0][:-1])
+        return result[0]
+
+    return wait
+
+
 def get_active_window() -> str:
     """get_active_window.
 
@@ -118,35 +765,136 @@ def get_active_window() -> str:
     :rtype: str
     """
 
-    return run(args=['xdotool', 'getactivewindow'],
-               capture_output=True,
-               encoding='utf-8').stdout[:-1]
+    return start_active_window()()
 
 
-def open_main_rofi_window(rofi_args: List[str], characters: str,
+def open_main_rofi_window(rofi_args: List[str],
+                          characters: Union[str, Iterable[str]],
                           prompt: str) -> Tuple[int, str]:
+    """open_main_rofi_window.
+
+    Show a menu with rofi and return its exit code and output. The rows can
+    be given as a producer, which keeps running while rofi opens: they are
+    written to rofi as they come, and rofi shows the first ones without
+    waiting for the others (-async-pre-read)
+
+    :param rofi_args: More arguments of rofi
+    :type rofi_args: List[str]
+    :param characters: The menu, or an iterable of its rows
+    :type characters: Union[str, Iterable[str]]
+    :param prompt: rofi's prompt
+    :type prompt: str
+    :rtype: Tuple[int, str]
+    """
+
     parameters: List[str] = [
-        'rofi', '-dmenu', '-markup-rows', '-i', '-p', prompt, '-kb-custom-11',
-        'Ctrl+c', '-kb-custom-12', 'Ctrl+t', '-kb-custom-13', 'Alt+p',
-        "-kb-custom-14", "Alt+e", *rofi_args
+        'rofi', '-dmenu', '-markup-rows', '-i', '-p', prompt,
+        *rofi_keybindings
     ]
 
     #parameters.extend(['-mesg', "Type :edit to edit your config file"])
 
-    rofi: CompletedProcess = run(parameters,
-                                 input=characters,
-                                 capture_output=True,
-                                 encoding='utf-8')
+    if isinstance(characters, str):
+        with trace.stage('rofi'):
+            rofi: CompletedProcess = run([*parameters, *rofi_args],
+                                         input=characters,
+                                         capture_output=True,
+                                         encoding='utf-8')
+        return rofi.returncode, rofi.stdout
+
+    with trace.stage('rofi'):
+        process = Popen(
+            [*parameters, '-async-pre-read',
+             str(async_pre_read), *rofi_args],
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=DEVNULL,
+            encoding='utf-8')
+        assert process.stdin is not None and process.stdout is not None
+        try:
+            write_rows(process.stdin, characters)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        stdout = process.stdout.read()
+        process.stdout.close()
+        returncode = process.wait()
+
+    return returncode, stdout
+
+
+def write_rows(stdin: IO[str], rows: Iterable[str]) -> None:
+    """write_rows.
+
+    Write menu rows to rofi as they are produced. The rows rofi waits for
+    before showing the menu are flushed as soon as they are written, and a
+    thread flushes the others every flush_interval, so that the written rows
+    reach rofi while the producer is blocked. The rest is dropped if rofi
+    exits in the meantime
+
+    :param stdin: rofi's standard input
+    :type stdin: IO[str]
+    :param rows: Menu rows
+    :type rows: Iterable[str]
+    :rtype: None
+    """
 
-    return rofi.returncode, rofi.stdout
+    import threading
+
+    # The rows not written yet: appended by this thread, taken with the lock
+    # held, by it or by the flushing thread
+    pending: List[str] = []
+    lock = threading.Lock()
+    done = threading.Event()
+    unflushed = False
+
+    def write_pending(flush: bool) -> None:
+        nonlocal unflushed
+        count = len(pending)
+        if count:
+            stdin.write('\n'.join(pending[:count]) + '\n')
+            del pending[:count]
+            unflushed = True
+        if flush and unflushed:
+            stdin.flush()
+            unflushed = False
+
+    def flush_pending() -> None:
+        while not done.wait(flush_interval):
+            with lock:
+                try:
+                    write_pending(flush=True)
+                except (BrokenPipeError, ValueError):
+                    return
+
+    flusher = threading.Thread(target=flush_pending, daemon=True)
+    flusher.start()
+    try:
+        for count, row in enumerate(rows, 1):
+            pending.append(row)
+            if count == async_pre_read or len(pending) >= write_chunk:
+                with lock:
+                    write_pending(flush=count == async_pre_read)
+        with lock:
+            write_pending(flush=False)
+    except BrokenPipeError:
+        pass
+    finally:
+        done.set()
+        flusher.join()
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
 
 
-def default_handle(characters: str, action: Action,
+def default_handle(characters: Union[str, memoryview], action: Action,
                    active_window: str) -> None:
     """default_handle.
 
     :param characters: The caracters to paste
-    :type characters: str
+    :type characters: Union[str, memoryview]
     :param action: The action to perform (paste / type ...)
     :type action: Action
     :param active_window: ID of the active window
@@ -164,71 +912,54 @@ def default_handle(characters: str, action: Action,
         type_characters(characters, active_window)
 
 
-def copy_characters_to_clipboard(characters: str) -> None:
+def copy_characters_to_clipboard(characters: Union[str, memoryview]) -> None:
     """copy_characters_to_clipboard.
 
     Copy the characters to the clipboard
 
     :param characters: Characters to copy
-    :type characters: str
+    :type characters: Union[str, memoryview]
     :rtype: None
     """
 
-    run(['xsel', '-i', '-b'], input=characters, encoding='utf-8')
+    clipboard.get_backend().set(characters, 'CLIPBOARD')
 
 
-def copy_paste_characters(characters: str, active_window: str) -> None:
+def copy_paste_characters(characters: Union[str, memoryview],
+                          active_window: str) -> None:
     """copy_paste_characters.
 
-    Insert characters by copying it and pasting it to the active window
+    Insert characters by copying it and pasting it to the active window, then
+    restore the clipboard
 
     :param characters: Characters to paste
-    :type characters: str
+    :type characters: Union[str, memoryview]
     :param active_window: ID of the active window
     :type active_window: str
     :rtype: None
     """
 
-    old_clipboard_content: str = run(
-        args=['xsel', '-o', '-b'], capture_output=True).stdout.decode("utf-8")
-    old_primary_content: str = run(args=['xsel', '-o', '-p'],
-                                   capture_output=True).stdout.decode("utf-8")
-
-    run(args=['xsel', '-i', '-b'], input=characters, encoding='utf-8')
-    run(args=['xsel', '-i', '-p'], input=characters, encoding='utf-8')
-
-    run([
-        'xdotool',
-        'windowfocus',
-        '--sync',
-        active_window,
-        'key',
-        '--clearmodifiers',
-        'Shift+Insert',
-        'sleep',
-        '0.05',
-    ])
-
-    run(args=['xsel', '-i', '-b'],
-        input=old_clipboard_content,
-        encoding='utf-8')
-    run(args=['xsel', '-i', '-p'], input=old_primary_content, encoding='utf-8')
+    clipboard.get_backend().paste(characters, active_window)
 
 
-def type_characters(characters: str, active_window: str) -> None:
+def type_characters(characters: Union[str, memoryview],
+                    active_window: str) -> None:
     """type_characters.
 
-    Type the characters in the active window
+    Type the characters in the active window. Long texts are inserted through
+    the clipboard instead, since typing them would take too long
 
     :param characters: Characters to type
-    :type characters: str
+    :type characters: Union[str, memoryview]
     :param active_window: ID of the active window
     :type active_window: str
     :rtype: None
     """
 
-    run(['xdotool', 'type', '--window', active_window, characters],
-        encoding="utf-8")
+    if 0 < keyboard.clipboard_threshold < len(characters):
+        copy_paste_characters(characters, active_window)
+    else:
+        keyboard.type_text(characters, active_window)
 
 
 def show_message(message: str) -> None:
@@ -246,6 +977,7 @@ def edit_file(path: str, editor: str = '', xdg_open: bool = False):
 
     if editor == "":
         if xdg_open:
+            import click
             click.launch(url=path)
         else:
             show_message("ERROR: please add your editor in the config file")
@@ -267,6 +999,8 @@ def edit_file(path: str, editor: str = '', xdg_open: bool = False):
             s = [x for y in splitted for x in y]
 
             run(args=[*s], encoding='utf-8')
+            index.invalidate(path)
+            pack.invalidate(path)
         except:
             show_message("ERROR: error opening editor")
     else:
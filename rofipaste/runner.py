@@ -0,0 +1,234 @@
+"""Runner of the executable entries.
+
+An entry runs in its own process group, with a timeout: when it expires, the
+whole group is killed. Its output is read as it arrives and either written to
+a sink (the clipboard or a typing session) or kept, in a temporary file when
+it is big.
+"""
+from __future__ import annotations
+
+import os
+import select
+import signal
+import time
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
+from rofipaste import trace
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import IO, List, Optional, Protocol, Union
+
+    class Sink(Protocol):
+
+        def write(self, data: bytes) -> object:
+            ...
+
+# Time an executable entry can run, in seconds
+default_timeout: float = 30.0
+# Outputs bigger than this, in bytes, are kept in a temporary file
+spool_threshold: int = 1024 * 1024
+read_size: int = 64 * 1024
+whitespace: bytes = b' \t\n\r\x0b\x0c'
+
+
+def trim_view(content) -> memoryview:
+    """trim_view.
+
+    Return a view of a buffer without its trailing whitespace, without
+    copying it
+
+    :param content: A buffer, a mmap for instance
+    :rtype: memoryview
+    """
+
+    end = len(content)
+    while end and content[end - 1] in whitespace:
+        end -= 1
+    return memoryview(content)[:end]
+
+
+class Trimmer:
+    """Trimmer.
+
+    Forward the output to a sink, holding the whitespace back until something
+    else follows it, so that the trailing whitespace is never written
+    """
+
+    def __init__(self, sink: Sink) -> None:
+        self.sink = sink
+        self.pending = b''
+
+    def write(self, chunk: bytes) -> None:
+        stripped = chunk.rstrip(whitespace)
+        if stripped:
+            self.sink.write(self.pending + stripped if self.pending else
+                            stripped)
+            self.pending = chunk[len(stripped):]
+        else:
+            self.pending += chunk
+
+
+class Spool:
+    """Spool.
+
+    Keep an output in memory, or in a temporary file past spool_threshold
+    """
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.file: Optional[IO[bytes]] = None
+
+    def write(self, data: bytes) -> None:
+        if self.file is not None:
+            self.file.write(data)
+            return
+        self.buffer += data
+        if len(self.buffer) > spool_threshold:
+            import tempfile
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+
+    def result(self) -> Union[str, memoryview]:
+        """result.
+
+        Return the output: a str, or a view of the mapped temporary file
+
+        :rtype: Union[str, memoryview]
+        """
+
+        if self.file is None:
+            return self.buffer.decode('utf-8', 'replace').rstrip()
+
+        import mmap
+        self.file.flush()
+        # The mapping outlives the file, which is already unlinked
+        content = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file.close()
+        return trim_view(content)
+
+
+def get_command(path: str, content: str) -> List[str]:
+    """get_command.
+
+    Return the command line running an executable entry: its shebang, split
+    like a shell would, and its path
+
+    :param path: File's path
+    :type path: str
+    :param content: File's content
+    :type content: str
+    :rtype: List[str]
+    """
+
+    import shlex
+
+    shebang: str = content.split('\n', 1)[0][2:]
+    try:
+        return [*shlex.split(shebang), path]
+    except ValueError:
+        # Unbalanced quotes, which the kernel would not care about
+        return [*shebang.split(), path]
+
+
+class Execution:
+    """Execution.
+
+    An executable entry running in its own process group
+    """
+
+    def __init__(self, args: List[str], stderr: Optional[int] = None) -> None:
+        self.args = args
+        self.process = Popen(args,
+                             stdin=DEVNULL,
+                             stdout=PIPE,
+                             stderr=stderr,
+                             start_new_session=True)
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def stream(self, sink: Sink, timeout: Optional[float] = None) -> None:
+        """stream.
+
+        Write the output to a sink as it arrives, without its trailing
+        whitespace. The process group is killed if it runs longer than the
+        timeout
+
+        :param sink: Object with a write method, taking bytes
+        :type sink: Sink
+        :param timeout: Maximum running time in seconds, defaults to
+            default_timeout
+        :type timeout: Optional[float]
+        :raises TimeoutExpired: if the entry did not finish in time
+        :rtype: None
+        """
+
+        if timeout is None:
+            timeout = default_timeout
+        assert self.process.stdout is not None
+        fd = self.process.stdout.fileno()
+        trimmer = Trimmer(sink)
+        deadline = time.monotonic() + timeout
+
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutExpired(self.args, timeout)
+                if not select.select([fd], [], [], remaining)[0]:
+                    continue
+                chunk = os.read(fd, read_size)
+                if not chunk:
+                    break
+                trimmer.write(chunk)
+            self.process.wait(max(deadline - time.monotonic(), 0))
+        except BaseException:
+            self.kill()
+            self.process.wait()
+            raise
+        finally:
+            self.process.stdout.close()
+
+    def output(self,
+               timeout: Optional[float] = None) -> Union[str, memoryview]:
+        """output.
+
+        Wait for the end of the entry and return its output
+
+        :param timeout: Maximum running time in seconds, defaults to
+            default_timeout
+        :type timeout: Optional[float]
+        :raises TimeoutExpired: if the entry did not finish in time
+        :rtype: Union[str, memoryview]
+        """
+
+        spool = Spool()
+        self.stream(spool, timeout)
+        return spool.result()
+
+
+def execute(args: List[str],
+            sink: Optional[Sink] = None) -> Optional[Union[str, memoryview]]:
+    """execute.
+
+    Run an executable entry
+
+    :param args: Command line running the entry
+    :type args: List[str]
+    :param sink: Where to write the output as it arrives, if any
+    :type sink: Optional[Sink]
+    :raises TimeoutExpired: if the entry did not finish in time
+    :rtype: Optional[Union[str, memoryview]]
+    :return: The output, or None if it was written to the sink
+    """
+
+    with trace.stage('exec'):
+        execution = Execution(args)
+        if sink is None:
+            return execution.output()
+        execution.stream(sink)
+        return None
@@ -0,0 +1,197 @@
+"""Single window navigation with rofi's script mode.
+
+Instead of launching ``rofi -dmenu`` for each folder, rofipaste launches rofi
+once with this module as a script mode. rofi runs the module each time a row
+is picked: it prints the next folder in the same window, or writes the picked
+entry to a result file and closes the window. The paste itself is done by the
+rofipaste process which launched rofi.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import shlex
+import tempfile
+from subprocess import run
+from rofipaste import rofipaste, history, pack, usage
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional
+
+mode_name: str = 'rofipaste'
+
+
+def row(text: str, info: str) -> str:
+    return f'{text}\0info\x1f{info}\n'
+
+
+def folder_rows(folder_path: str, base_folder: str, flat: bool = False) -> str:
+    """folder_rows.
+
+    Return the rows of a folder, in the same order as read_folder_content
+    (or read_tree_content for the flat menu).
+    The info of each row tells what it is: ``f:<file>``, ``d:<folder>``,
+    ``u:`` (parent folder), ``c:`` (configuration file), ``h:`` (clipboard
+    history) or ``k:<content>`` (content of the clipboard history)
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param base_folder: Top paste folder
+    :type base_folder: str
+    :param flat: List the entries of all the subfolders
+    :type flat: bool
+    :rtype: str
+    """
+
+    kinds = {
+        rofipaste.RowKind.ENTRY: 'f',
+        rofipaste.RowKind.FOLDER: 'd',
+        rofipaste.RowKind.PARENT: 'u',
+        rofipaste.RowKind.CONFIG: 'c',
+        rofipaste.RowKind.HISTORY: 'h',
+        rofipaste.RowKind.CLIP: 'k',
+    }
+    lines: List[str] = []
+    for menu_row in rofipaste.iter_menu_rows(folder_path, base_folder, flat):
+        # The entries, the folders and the contents by their path relative
+        # to folder_path
+        name = ''
+        if menu_row.kind in (rofipaste.RowKind.ENTRY, rofipaste.RowKind.FOLDER,
+                             rofipaste.RowKind.CLIP):
+            name = menu_row.path[len(folder_path) + 1:]
+        lines.append(row(menu_row.text, f'{kinds[menu_row.kind]}:{name}'))
+    return ''.join(lines)
+
+
+def write_result(result: Dict[str, Any]) -> None:
+    with open(os.environ['ROFIPASTE_RESULT'], 'w') as result_file:
+        json.dump(result, result_file)
+
+
+def main() -> int:
+    """main.
+
+    Entry point of the script mode, called by rofi
+
+    :rtype: int
+    """
+
+    base_folder = os.environ['ROFIPASTE_ROOT']
+    usage.enabled = os.environ.get('ROFIPASTE_SORT') != 'none'
+    if os.environ.get('ROFIPASTE_PACK') != '0':
+        pack.load(base_folder, rofipaste.paste_icon_dict)
+    folder_path = os.environ.get('ROFI_DATA') or base_folder
+    retv = int(os.environ.get('ROFI_RETV', '0'))
+    selected = sys.argv[1] if len(sys.argv) > 1 else ''
+
+    # 10 to 19 are Alt+1 to Alt+0, which paste a recent entry
+    if 10 <= retv <= 19:
+        write_result({'kind': 'entry', 'path': '', 'returncode': retv})
+        return 0
+
+    # 1 is a picked row, 20 to 28 a picked row with a custom keybinding
+    if retv == 1 or retv >= 20:
+        kind, _, name = os.environ.get('ROFI_INFO', '').partition(':')
+        if kind == 'd':
+            folder_path = os.path.join(folder_path, name)
+        elif kind == 'u':
+            folder_path = (base_folder
+                           if folder_path == history.history_folder else
+                           os.path.dirname(folder_path))
+        elif kind == 'h':
+            folder_path = history.history_folder
+        elif kind == 'k':
+            write_result({
+                'kind': 'clip',
+                'path': os.path.join(history.history_folder, name),
+                'returncode': retv if retv >= 10 else 0
+            })
+            return 0
+        elif kind == 'f':
+            write_result({
+                'kind': 'entry',
+                'path': os.path.join(folder_path, name),
+                'returncode': retv if retv >= 10 else 0
+            })
+            return 0
+        elif kind == 'c':
+            write_result({'kind': 'config'})
+            return 0
+
+    # 2 is a custom text typed by the user
+    elif retv == 2 and selected[:1] == rofipaste.command_prefix:
+        write_result({'kind': 'command', 'command': selected})
+        return 0
+
+    sys.stdout.write(
+        f"\0prompt\x1f{os.environ.get('ROFIPASTE_PROMPT', '')}\n"
+        "\0markup-rows\x1ftrue\n"
+        "\0use-hot-keys\x1ftrue\n"
+        f"\0data\x1f{folder_path}\n")
+    sys.stdout.write(
+        folder_rows(folder_path, base_folder,
+                    os.environ.get('ROFIPASTE_FLAT') == '1'))
+    return 0
+
+
+def open_menu(rofi_args: List[str],
+              prompt: str,
+              base_folder: str,
+              flat: bool = False) -> Optional[Dict[str, Any]]:
+    """open_menu.
+
+    Open the single window menu and return what was picked
+
+    :param rofi_args: Additional arguments of rofi
+    :type rofi_args: List[str]
+    :param prompt: rofi's prompt
+    :type prompt: str
+    :param base_folder: Top paste folder
+    :type base_folder: str
+    :param flat: List the entries of all the subfolders
+    :type flat: bool
+    :rtype: Optional[Dict[str, Any]]
+    :return: The picked entry, command or configuration file, None if the
+        menu was closed
+    """
+
+    fd, result_path = tempfile.mkstemp(prefix='rofipaste-', suffix='.json')
+    os.close(fd)
+
+    package_folder = os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))
+    env = dict(os.environ,
+               ROFIPASTE_ROOT=base_folder,
+               ROFIPASTE_RESULT=result_path,
+               ROFIPASTE_PROMPT=prompt,
+               ROFIPASTE_FLAT='1' if flat else '0',
+               ROFIPASTE_SORT='frecency' if usage.enabled else 'none',
+               ROFIPASTE_PACK='1' if pack.enabled else '0')
+    # The script must import this rofipaste, even when it is not installed
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [package_folder,
+                      os.environ.get('PYTHONPATH')]))
+    script = ' '.join(
+        shlex.quote(arg)
+        for arg in [sys.executable, '-m', 'rofipaste.script_mode'])
+
+    try:
+        run([
+            'rofi', '-show', mode_name, '-modi', f'{mode_name}:{script}', '-i',
+            *rofipaste.rofi_keybindings, *rofi_args
+        ],
+            env=env)
+        with open(result_path, 'r') as result_file:
+            content = result_file.read()
+    finally:
+        os.unlink(result_path)
+
+    if not content:
+        return None
+    return json.loads(content)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Full-text search over the contents of the static paste entries.
+
+The contents are kept in an SQLite FTS5 table, with the trigram tokenizer
+when SQLite has it (3.34 or later), so that any part of a word matches. The
+index is brought up to date before each search by comparing the size and
+mtime of the entries, which the folder indexes already know, with the
+indexed ones: only the new and modified files are read again.
+
+The executable entries are not indexed, since their output changes, nor the
+entries bigger than max_size.
+"""
+from __future__ import annotations
+
+import os
+from rofipaste import index, pack
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Tuple
+
+database_file: str = os.path.join(index.cache_folder, 'search.sqlite')
+# Bigger entries are not indexed, in bytes
+max_size: int = 1024 * 1024
+# Maximum number of results of a search
+max_results: int = 200
+# Length of the snippets: characters with the trigram tokenizer, words
+# without it
+snippet_characters: int = 60
+snippet_words: int = 10
+
+# Markers of the matches in the snippets, replaced once they are escaped
+match_start: str = '\x02'
+match_end: str = '\x03'
+
+
+def connect():
+    import sqlite3
+
+    os.makedirs(os.path.dirname(database_file), exist_ok=True)
+    connection = sqlite3.connect(database_file, timeout=1)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS files ('
+                       'id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, '
+                       'size INTEGER NOT NULL, mtime INTEGER NOT NULL)')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS contents '
+                           "USING fts5(body, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        # No trigram tokenizer: whole words and prefixes only
+        connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS contents '
+                           'USING fts5(body)')
+    return connection
+
+
+def uses_trigrams(connection) -> bool:
+    sql = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'contents'").fetchone()[0]
+    return 'trigram' in sql
+
+
+def read_content(path: str) -> str:
+    packed = pack.read(path)
+    if packed is not None:
+        return str(packed, 'utf-8', 'replace')
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', 'replace')
+
+
+def update(root: str, entries: Dict[str, index.Entry]) -> int:
+    """update.
+
+    Bring the index of a paste folder up to date
+
+    :param root: Paste folder
+    :type root: str
+    :param entries: All the entries of the paste folder, by path
+    :type entries: Dict[str, index.Entry]
+    :rtype: int
+    :return: Number of files read
+    """
+
+    import sqlite3
+
+    read = 0
+    try:
+        connection = connect()
+        with connection:
+            # All the paths starting with "<root>/"
+            indexed = {
+                path: (id_, size, mtime)
+                for id_, path, size, mtime in connection.execute(
+                    'SELECT id, path, size, mtime FROM files '
+                    'WHERE path > ? AND path < ?', (root + '/', root + '0'))
+            }
+
+            for path, entry in entries.items():
+                if entry.is_dir or entry.is_exec or entry.size > max_size:
+                    continue
+                old = indexed.pop(path, None)
+                if old is not None and old[1:] == (entry.size, entry.mtime):
+                    continue
+                try:
+                    content = read_content(path)
+                except OSError:
+                    continue
+                read += 1
+
+                if old is not None:
+                    connection.execute(
+                        'UPDATE files SET size = ?, mtime = ? WHERE id = ?',
+                        (entry.size, entry.mtime, old[0]))
+                    connection.execute(
+                        'UPDATE contents SET body = ? WHERE rowid = ?',
+                        (content, old[0]))
+                else:
+                    id_ = connection.execute(
+                        'INSERT INTO files (path, size, mtime) '
+                        'VALUES (?, ?, ?)',
+                        (path, entry.size, entry.mtime)).lastrowid
+                    connection.execute(
+                        'INSERT INTO contents (rowid, body) VALUES (?, ?)',
+                        (id_, content))
+
+            # Removed, now executable or too big
+            for id_, _, _ in indexed.values():
+                connection.execute('DELETE FROM files WHERE id = ?', (id_, ))
+                connection.execute('DELETE FROM contents WHERE rowid = ?',
+                                   (id_, ))
+        connection.close()
+    except sqlite3.Error:
+        pass
+    return read
+
+
+def build_query(terms: List[str], trigrams: bool) -> Tuple[str, List[str]]:
+    """build_query.
+
+    Return the condition matching the contents with all the terms, and its
+    parameters. The trigram index cannot look up terms shorter than three
+    characters, which are searched in the contents matched by the others
+
+    :param terms: Searched terms
+    :type terms: List[str]
+    :param trigrams: The index uses the trigram tokenizer
+    :type trigrams: bool
+    :rtype: Tuple[str, List[str]]
+    """
+
+    phrases = []
+    conditions = []
+    parameters = []
+    for term in terms:
+        if trigrams and len(term) < 3:
+            conditions.append('instr(lower(contents.body), ?) > 0')
+            parameters.append(term.lower())
+        else:
+            phrase = '"' + term.replace('"', '""') + '"'
+            phrases.append(phrase if trigrams else phrase + '*')
+
+    if phrases:
+        conditions.insert(0, 'contents MATCH ?')
+        parameters.insert(0, ' AND '.join(phrases))
+    return ' AND '.join(conditions), parameters
+
+
+def escape_snippet(snippet: str) -> str:
+    """escape_snippet.
+
+    Return a snippet as pango markup, with the matches in bold, on one line
+
+    :param snippet: Snippet with the matches between markers
+    :type snippet: str
+    :rtype: str
+    """
+
+    from html import escape
+
+    snippet = ' '.join(snippet.split())
+    return escape(snippet, quote=False).replace(match_start, '<b>').replace(
+        match_end, '</b>')
+
+
+def find(root: str, terms: List[str]) -> List[Tuple[str, str]]:
+    """find.
+
+    Return the indexed entries of a paste folder containing all the terms,
+    case insensitively, the best matches first
+
+    :param root: Paste folder
+    :type root: str
+    :param terms: Searched terms
+    :type terms: List[str]
+    :rtype: List[Tuple[str, str]]
+    :return: The paths of the entries, with a snippet of their content as
+        pango markup
+    """
+
+    import sqlite3
+
+    terms = [term for term in terms if term]
+    if not terms or not os.path.exists(database_file):
+        return []
+
+    try:
+        connection = connect()
+        trigrams = uses_trigrams(connection)
+        condition, parameters = build_query(terms, trigrams)
+        if 'MATCH' in condition:
+            length = snippet_characters if trigrams else snippet_words
+            snippet = (f"snippet(contents, 0, '{match_start}', "
+                       f"'{match_end}', '…', {length})")
+            order = 'rank'
+        else:
+            snippet = 'substr(contents.body, 1, 80)'
+            order = 'files.path'
+        rows = connection.execute(
+            f'SELECT files.path, {snippet} FROM contents '
+            'JOIN files ON files.id = contents.rowid '
+            f'WHERE {condition} AND files.path > ? AND files.path < ? '
+            f'ORDER BY {order} LIMIT ?',
+            (*parameters, root + '/', root + '0', max_results)).fetchall()
+        connection.close()
+    except sqlite3.Error:
+        return []
+
+    return [(path, escape_snippet(snippet)) for path, snippet in rows]
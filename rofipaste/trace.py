@@ -0,0 +1,209 @@
+"""Opt-in tracing of the time spent in each stage of a rofipaste run.
+
+Enabled with ``--trace``, ``trace=True`` in the config file or the
+ROFIPASTE_TRACE=1 environment variable. Each run appends a JSON line to the
+trace file, with the total time of each of its stages in milliseconds, and
+``rofipaste stats`` summarizes the recent runs.
+"""
+from __future__ import annotations
+
+import os
+import time
+from rofipaste import config
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+
+enabled_by_environment: bool = os.environ.get('ROFIPASTE_TRACE',
+                                              '') not in ('', '0')
+enabled: bool = enabled_by_environment
+trace_file: str = os.path.join(config.xdg_state_home, 'rofipaste',
+                               'trace.jsonl')
+# The trace file is rewritten with its last lines once it gets bigger
+max_size: int = 1024 * 1024
+
+# Milliseconds spent in each stage of the current run
+stages: Dict[str, float] = {}
+started: float = time.monotonic()
+# The first run of a process includes the interpreter startup
+first_run: bool = True
+
+
+class Stage:
+    """Stage.
+
+    Context manager adding the time spent in its block to a stage. A stage
+    can be entered several times in a run, e.g. once per xsel call
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> Stage:
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        add(self.name, time.monotonic() - self.start)
+
+
+def stage(name: str) -> Stage:
+    return Stage(name)
+
+
+def add(name: str, seconds: float) -> None:
+    stages[name] = stages.get(name, 0.0) + seconds * 1000
+
+
+def process_age() -> Optional[float]:
+    """process_age.
+
+    Return the time since this process was started, in seconds, with the
+    resolution of the kernel's clock ticks (usually 10 ms)
+
+    :rtype: Optional[float]
+    """
+
+    try:
+        with open('/proc/self/stat', 'r') as stat:
+            # The fields after the command name, which can contain spaces
+            fields = stat.read().rsplit(')', 1)[1].split()
+        start_time = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_time
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def begin() -> None:
+    """begin.
+
+    Start tracing a run
+
+    :rtype: None
+    """
+
+    global started, first_run
+    stages.clear()
+    started = time.monotonic()
+    if first_run:
+        first_run = False
+        age = process_age()
+        if age is not None:
+            # Everything before begin: interpreter startup and imports
+            add('startup', age)
+
+
+def end(argv: List[str]) -> None:
+    """end.
+
+    Append the stages of the run to the trace file, if tracing is enabled
+
+    :param argv: Arguments of the run
+    :type argv: List[str]
+    :rtype: None
+    """
+
+    if not enabled:
+        return
+
+    import json
+
+    add('total', time.monotonic() - started)
+    record = {
+        'time': round(time.time(), 3),
+        'argv': argv,
+        'stages': {name: round(ms, 3)
+                   for name, ms in stages.items()},
+    }
+    try:
+        os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+        with open(trace_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        if os.path.getsize(trace_file) > max_size:
+            truncate()
+    except OSError:
+        pass
+
+
+def truncate() -> None:
+    with open(trace_file, 'r') as f:
+        lines = f.readlines()
+    temporary = trace_file + '.tmp'
+    with open(temporary, 'w') as f:
+        f.writelines(lines[len(lines) // 2:])
+    os.replace(temporary, trace_file)
+
+
+def read(last: int) -> List[Dict[str, float]]:
+    """read.
+
+    Return the stages of the last runs
+
+    :param last: Number of runs
+    :type last: int
+    :rtype: List[Dict[str, float]]
+    """
+
+    import json
+
+    runs = []
+    try:
+        with open(trace_file, 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    for line in lines[-last:]:
+        try:
+            runs.append(json.loads(line)['stages'])
+        except (ValueError, KeyError):
+            continue
+    return runs
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """percentile.
+
+    Return a percentile of values, with the nearest-rank method
+
+    :param values: Sorted values
+    :type values: List[float]
+    :param percent: Between 0 and 100
+    :type percent: float
+    :rtype: float
+    """
+
+    rank = max(int(-(-percent * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+def report(runs: List[Dict[str, float]]) -> str:
+    """report.
+
+    Return a table with the p50, p95 and p99 of each stage
+
+    :param runs: Stages of the runs
+    :type runs: List[Dict[str, float]]
+    :rtype: str
+    """
+
+    timings: Dict[str, List[float]] = {}
+    for run in runs:
+        for name, ms in run.items():
+            timings.setdefault(name, []).append(ms)
+
+    lines = [
+        f"{'stage':<16}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    ]
+    # The total last, the other stages by decreasing median
+    names = sorted((name for name in timings if name != 'total'),
+                   key=lambda name: -percentile(sorted(timings[name]), 50))
+    if 'total' in timings:
+        names.append('total')
+    for name in names:
+        values = sorted(timings[name])
+        lines.append(f'{name:<16}{len(values):>6}' + ''.join(
+            f'{percentile(values, percent):>10.1f}'
+            for percent in (50, 95, 99)))
+    return '\n'.join(lines)
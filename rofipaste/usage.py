@@ -0,0 +1,221 @@
+"""Usage store and frecency ranking of the paste entries.
+
+Each entry has a single row in a small SQLite database. Its score is the
+logarithm of a sum of exponentially decaying uses, relative to a fixed epoch,
+so that recording a use updates one row and comparing two entries never needs
+their history:
+
+    score = log2(sum(2 ** ((use_time - epoch) / half_life)))
+"""
+from __future__ import annotations
+
+import os
+import math
+import time
+import threading
+from rofipaste import config
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import (Any, Callable, Dict, Iterable, Iterator, List,
+                        Optional)
+
+# Disabled with --sort none
+enabled: bool = True
+database_file: str = os.path.join(config.xdg_data_home, 'rofipaste',
+                                  'usage.sqlite')
+# A use counts half as much after this many seconds
+half_life: float = 7 * 24 * 3600
+# Arbitrary fixed origin of the scores, to keep them small
+epoch: float = 1600000000
+# Rows kept in the database, the lowest scores are removed above it
+max_rows: int = 10000
+# The lowest scores are only removed once every this many new rows
+evict_every: int = 100
+# Items held by rank_stream before it checks that the used entries it still
+# waits for exist
+check_after: int = 256
+
+
+def connect():
+    import sqlite3
+
+    os.makedirs(os.path.dirname(database_file), exist_ok=True)
+    connection = sqlite3.connect(database_file, timeout=1)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS usage ('
+                       'path TEXT PRIMARY KEY, folder TEXT NOT NULL, '
+                       'score REAL NOT NULL, count INTEGER NOT NULL, '
+                       'last_used REAL NOT NULL)')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS usage_folder ON usage (folder)')
+    return connection
+
+
+def add_use(score: Optional[float], use_time: float) -> float:
+    """add_use.
+
+    Return a score with one more use
+
+    :param score: Previous score, None for a first use
+    :type score: Optional[float]
+    :param use_time: Time of the use, in seconds since the Unix epoch
+    :type use_time: float
+    :rtype: float
+    """
+
+    use = (use_time - epoch) / half_life
+    if score is None:
+        return use
+    high, low = max(score, use), min(score, use)
+    return high + math.log2(1 + 2**(low - high))
+
+
+def record(path: str, use_time: Optional[float] = None) -> None:
+    """record.
+
+    Record a use of an entry
+
+    :param path: Entry's path
+    :type path: str
+    :param use_time: Time of the use, defaults to now
+    :type use_time: Optional[float]
+    :rtype: None
+    """
+
+    import sqlite3
+
+    if use_time is None:
+        use_time = time.time()
+
+    try:
+        connection = connect()
+        with connection:
+            row = connection.execute('SELECT score FROM usage WHERE path = ?',
+                                     (path, )).fetchone()
+            score = add_use(row[0] if row else None, use_time)
+            cursor = connection.execute(
+                'INSERT INTO usage VALUES (?, ?, ?, 1, ?) '
+                'ON CONFLICT (path) DO UPDATE SET score = excluded.score, '
+                'count = count + 1, last_used = excluded.last_used',
+                (path, os.path.dirname(path), score, use_time))
+            # The rowids of the new rows keep increasing, whichever process
+            # inserts them
+            if row is None and cursor.lastrowid % evict_every == 0:
+                connection.execute(
+                    'DELETE FROM usage WHERE path IN (SELECT path FROM usage '
+                    'ORDER BY score DESC LIMIT -1 OFFSET ?)', (max_rows, ))
+        connection.close()
+    except sqlite3.Error:
+        pass
+
+
+def record_in_background(path: str) -> threading.Thread:
+    """record_in_background.
+
+    Record a use of an entry without delaying the caller. A short-lived
+    process still waits for the thread before exiting, after the paste
+
+    :param path: Entry's path
+    :type path: str
+    :rtype: threading.Thread
+    """
+
+    thread = threading.Thread(target=record, args=(path, ))
+    thread.start()
+    return thread
+
+
+def get_scores(folder_path: str, recursive: bool = False) -> Dict[str, float]:
+    """get_scores.
+
+    Return the scores of the used entries of a folder
+
+    :param folder_path: Folder's path
+    :type folder_path: str
+    :param recursive: Include the entries of the subfolders
+    :type recursive: bool
+    :rtype: Dict[str, float]
+    """
+
+    import sqlite3
+
+    if not os.path.exists(database_file):
+        return {}
+
+    try:
+        connection = connect()
+        if recursive:
+            # All the paths starting with "<folder>/"
+            rows = connection.execute(
+                'SELECT path, score FROM usage WHERE path > ? AND path < ?',
+                (folder_path + '/', folder_path + '0')).fetchall()
+        else:
+            rows = connection.execute(
+                'SELECT path, score FROM usage WHERE folder = ?',
+                (folder_path, )).fetchall()
+        connection.close()
+    except sqlite3.Error:
+        return {}
+
+    return dict(rows)
+
+
+def rank(items: List[Any], get_path: Callable[[Any], str],
+         scores: Dict[str, float]) -> None:
+    """rank.
+
+    Sort items by decreasing score of their path, in place. The unused ones
+    keep their order, at the end
+
+    :param items: Items to sort
+    :type items: List[Any]
+    :param get_path: Return the path of an item
+    :type get_path: Callable[[Any], str]
+    :param scores: Scores returned by get_scores
+    :type scores: Dict[str, float]
+    :rtype: None
+    """
+
+    if scores:
+        items.sort(key=lambda item: scores.get(get_path(item), -math.inf),
+                   reverse=True)
+
+
+def rank_stream(items: Iterable[Any], get_path: Callable[[Any], str],
+                scores: Dict[str, float]) -> Iterator[Any]:
+    """rank_stream.
+
+    Like rank, for items which arrive one by one. The used items must come
+    first, so the items are held back until all the used entries which still
+    exist arrived; the following ones are passed on as they arrive. Only the
+    used entries which did not arrive after check_after items are checked
+
+    :param items: Items to sort
+    :type items: Iterable[Any]
+    :param get_path: Return the path of an item
+    :type get_path: Callable[[Any], str]
+    :param scores: Scores returned by get_scores
+    :type scores: Dict[str, float]
+    :rtype: Iterator[Any]
+    """
+
+    pending = set(scores)
+    held: List[Any] = []
+    for item in items:
+        if not pending:
+            yield item
+            continue
+        held.append(item)
+        pending.discard(get_path(item))
+        if len(held) == check_after:
+            # Removed or moved since they were used
+            pending = {path for path in pending if os.path.isfile(path)}
+        if not pending:
+            rank(held, get_path, scores)
+            yield from held
+            held = []
+
+    rank(held, get_path, scores)
+    yield from held
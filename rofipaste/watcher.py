@@ -0,0 +1,295 @@
+"""Live refresh of the folder indexes with Linux inotify."""
+from __future__ import annotations
+
+import os
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+from rofipaste import index
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, Set, Tuple
+
+IN_MODIFY: int = 0x00000002
+IN_ATTRIB: int = 0x00000004
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_FROM: int = 0x00000040
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_DELETE: int = 0x00000200
+IN_DELETE_SELF: int = 0x00000400
+IN_MOVE_SELF: int = 0x00000800
+IN_Q_OVERFLOW: int = 0x00004000
+IN_IGNORED: int = 0x00008000
+IN_ONLYDIR: int = 0x01000000
+IN_ISDIR: int = 0x40000000
+
+watch_mask: int = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+                   | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+                   | IN_ONLYDIR)
+
+event_struct = struct.Struct('iIII')
+
+
+class Inotify:
+    """Inotify.
+
+    Minimal ctypes binding of the inotify API
+    """
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd: int = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                         ctypes.c_uint32(mask))
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """read_events.
+
+        Yield the (wd, mask, cookie, name) of the pending events
+        """
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_struct.unpack_from(data, offset)
+            offset += event_struct.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield wd, mask, cookie, os.fsdecode(name)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Watcher:
+    """Watcher.
+
+    Keep the indexes of a paste folder and all its subfolders up to date.
+    Folders which cannot be watched (inotify missing or out of watches) are
+    polled for mtime changes instead
+    """
+
+    def __init__(self,
+                 root: str,
+                 icons: Dict[str, str],
+                 poll_interval: float = 2.0) -> None:
+        self.root = root
+        self.icons = icons
+        self.poll_interval = poll_interval
+        self.watches: Dict[int, str] = {}
+        self.polled: Set[str] = set()
+        self.inotify: Optional[Inotify]
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError):
+            self.inotify = None
+
+    def watch_tree(self, top: str) -> None:
+        """watch_tree.
+
+        Watch a folder and all its subfolders and index them
+
+        :param top: Folder's path
+        :type top: str
+        :rtype: None
+        """
+
+        for folder_path, dirnames, _ in os.walk(top):
+            folder_index = index.get_folder_index(folder_path, self.icons)
+
+            wd = None
+            if self.inotify is not None:
+                try:
+                    wd = self.inotify.add_watch(folder_path, watch_mask)
+                except OSError as e:
+                    if e.errno not in (errno.ENOSPC, errno.ENOENT):
+                        raise
+
+            with index.lock:
+                if wd is None:
+                    self.polled.add(folder_path)
+                    continue
+                self.watches[wd] = folder_path
+                # Events may have been missed between the scan and the watch
+                if folder_index.refresh():
+                    folder_index.dirty = True
+                folder_index.watched = True
+
+    def unwatch_tree(self, top: str) -> None:
+        """unwatch_tree.
+
+        Stop watching a folder which was removed or moved out of the tree
+
+        :param top: Folder's path
+        :type top: str
+        :rtype: None
+        """
+
+        prefix = top + os.sep
+        with index.lock:
+            for wd, folder_path in list(self.watches.items()):
+                if folder_path == top or folder_path.startswith(prefix):
+                    del self.watches[wd]
+                    if self.inotify is not None:
+                        self.inotify.rm_watch(wd)
+            for folder_path in list(index._indexes):
+                if folder_path == top or folder_path.startswith(prefix):
+                    del index._indexes[folder_path]
+            self.polled = {
+                folder_path
+                for folder_path in self.polled
+                if folder_path != top and not folder_path.startswith(prefix)
+            }
+
+    def handle_events(self) -> None:
+        """handle_events.
+
+        Apply the pending inotify events to the indexes
+
+        :rtype: None
+        """
+
+        assert self.inotify is not None
+        updated: Set[Tuple[str, str]] = set()
+        new_trees: Set[str] = set()
+
+        for wd, mask, _, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self.resync()
+                continue
+
+            folder_path = self.watches.get(wd)
+            if folder_path is None:
+                continue
+
+            if mask & IN_IGNORED:
+                with index.lock:
+                    self.watches.pop(wd, None)
+                continue
+
+            if not name:
+                continue
+            path = os.path.join(folder_path, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.unwatch_tree(path)
+                    new_trees.discard(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    new_trees.add(path)
+
+            updated.add((folder_path, name))
+
+        with index.lock:
+            for folder_path, name in updated:
+                folder_index = index._indexes.get(folder_path)
+                if folder_index is not None:
+                    folder_index.update(name)
+
+        for path in new_trees:
+            self.watch_tree(path)
+
+    def resync(self) -> None:
+        """resync.
+
+        Rescan every watched folder, when inotify dropped some events
+
+        :rtype: None
+        """
+
+        # Watching an already watched folder returns the same watch, so this
+        # only rescans the folders and picks up the ones created meanwhile
+        self.watch_tree(self.root)
+
+    def poll(self) -> None:
+        """poll.
+
+        Refresh the indexes of the folders which could not be watched, and
+        watch the folders created in them
+
+        :rtype: None
+        """
+
+        for folder_path in list(self.polled):
+            if not os.path.isdir(folder_path):
+                self.unwatch_tree(folder_path)
+                continue
+            mtime = index.load_folder_index(folder_path, self.icons).mtime
+            if index.get_folder_index(folder_path, self.icons).mtime != mtime:
+                self.watch_new_folders(folder_path)
+
+    def watch_new_folders(self, folder_path: str) -> None:
+        """watch_new_folders.
+
+        Watch the subfolders of a folder which are neither watched nor polled
+        yet
+
+        :param folder_path: Folder's path
+        :type folder_path: str
+        :rtype: None
+        """
+
+        with index.lock:
+            known = set(self.watches.values()) | self.polled
+        new_folders: List[str] = []
+        try:
+            with os.scandir(folder_path) as it:
+                for entry in it:
+                    if (entry.is_dir(follow_symlinks=False)
+                            and entry.path not in known):
+                        new_folders.append(entry.path)
+        except OSError:
+            return
+        for path in new_folders:
+            self.watch_tree(path)
+
+    def run(self) -> None:
+        self.watch_tree(self.root)
+
+        while True:
+            if self.inotify is None:
+                readable = False
+                select.select([], [], [], self.poll_interval)
+            else:
+                readable = bool(
+                    select.select([self.inotify.fd], [], [],
+                                  self.poll_interval)[0])
+
+            if readable:
+                self.handle_events()
+            if self.polled:
+                self.poll()
+
+    def start(self) -> threading.Thread:
+        """start.
+
+        Run the watcher in a background thread
+
+        :rtype: threading.Thread
+        """
+
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
@@ -9,7 +9,7 @@ with open('README.rst') as readme_file:
 with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
-requirements = ['Click>=7.0', 'click_config_file>=0.6.0', 'pyxdg>=0.26']
+requirements = ['Click>=7.0', 'click_config_file>=0.6.0']
 
 setup_requirements = [
     'pytest-runner',
@@ -35,9 +35,13 @@ setup(
     entry_points={
         'console_scripts': [
             'rofipaste=rofipaste.cli:main',
+            'rofipaste-client=rofipaste.daemon:client_main',
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'xlib': ['python-xlib>=0.26'],
+    },
     license="GNU General Public License v3",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -0,0 +1,23 @@
+"""Isolation of the state of rofipaste, shared by the tests and benchmarks."""
+
+
+def isolate(monkeypatch, folder):
+    """Keep the caches, the stores and the config file in a folder."""
+    from rofipaste import (config, exec_cache, history, index, keyboard,
+                           pack, plugins, recent, rofipaste, search, usage)
+    monkeypatch.setattr(index, 'cache_folder', str(folder / 'cache'))
+    monkeypatch.setattr(index, '_indexes', {})
+    monkeypatch.setattr(index, 'bundle', None)
+    monkeypatch.setattr(pack, 'packs_folder', str(folder / 'packs'))
+    monkeypatch.setattr(pack, 'current', None)
+    monkeypatch.setattr(exec_cache, 'cache_folder', str(folder / 'exec'))
+    monkeypatch.setattr(usage, 'database_file', str(folder / 'usage.sqlite'))
+    monkeypatch.setattr(recent, 'ring_file', str(folder / 'recent'))
+    monkeypatch.setattr(search, 'database_file',
+                        str(folder / 'search.sqlite'))
+    monkeypatch.setattr(plugins, 'code_folder', str(folder / 'plugins'))
+    monkeypatch.setattr(plugins, '_modules', {})
+    monkeypatch.setattr(history, 'history_folder', str(folder / 'history'))
+    monkeypatch.setattr(keyboard, 'stats_file', str(folder / 'typing.log'))
+    monkeypatch.setattr(config, 'config_file_name', str(folder / 'config'))
+    monkeypatch.setattr(rofipaste, 'config_file_name', str(folder / 'config'))
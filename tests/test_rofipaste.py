@@ -2,12 +2,18 @@
 
 """Tests for `rofipaste` package."""
 
+import os
+import sys
+import time
 import pytest
 
 from click.testing import CliRunner
 
 from rofipaste import rofipaste
 from rofipaste import cli
+from rofipaste import config
+
+from tests.isolation import isolate
 
 
 @pytest.fixture
@@ -35,3 +41,978 @@ def test_content(response):
 #    help_result = runner.invoke(cli.main, ['--help'])
 #    assert help_result.exit_code == 0
 #    assert '--help  Show this message and exit.' in help_result.output
+
+
+@pytest.fixture
+def paste_folder(tmp_path, monkeypatch):
+    """A paste folder, with the state of rofipaste kept in tmp_path."""
+    isolate(monkeypatch, tmp_path)
+    folder = tmp_path / 'pastes'
+    folder.mkdir()
+    (folder / 'hello.py').write_text('print("hello")\n')
+    (folder / 'date').write_text('#!/bin/sh\ndate\n')
+    (folder / 'sub').mkdir()
+    return folder
+
+
+def test_read_folder_content(paste_folder):
+    content = rofipaste.read_folder_content(str(paste_folder))
+    lines = content.splitlines()
+    assert f'{rofipaste.paste_icon_dict["py"]} hello' in lines
+    assert f'{rofipaste.paste_icon_dict[""]} date (exec)' in lines
+    assert lines[-2:] == [
+        f'{rofipaste.folder_icon} sub',
+        f'{rofipaste.edit_config_icon} Edit configuration file'
+    ]
+
+
+def test_folder_index_refresh(paste_folder):
+    from rofipaste import index
+    folder_index = index.get_folder_index(str(paste_folder),
+                                          rofipaste.paste_icon_dict)
+    assert os.path.isfile(folder_index.cache_file)
+    assert not folder_index.refresh()
+
+    (paste_folder / 'hello.py').write_text('#!/usr/bin/env python3\n1\n')
+    assert folder_index.refresh()
+    assert folder_index.entries['hello.py'].is_exec
+
+    reloaded = index.FolderIndex(str(paste_folder), rofipaste.paste_icon_dict)
+    reloaded.load()
+    assert [e.filename for e in reloaded.get_entries()] == folder_index.order
+
+
+def test_daemon_trigger(tmp_path, monkeypatch):
+    import threading
+    from rofipaste import daemon
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert daemon.trigger([]) is None
+
+    received = []
+
+    def handler(argv):
+        received.append(argv)
+        return 3
+
+    threading.Thread(target=daemon.serve, args=(handler, ),
+                     daemon=True).start()
+    returncode = None
+    for _ in range(100):
+        returncode = daemon.trigger(['-c'])
+        if returncode is not None:
+            break
+        time.sleep(0.01)
+
+    assert returncode == 3
+    assert received == [['-c']]
+
+    # The subcommands run in the client, which needs no daemon for them
+    assert daemon.local_commands == set(cli.subcommands)
+    monkeypatch.setattr(
+        'sys.argv', ['rofipaste-client', 'list', '-f',
+                     str(tmp_path / 'pastes')])
+    with pytest.raises(SystemExit):
+        daemon.client_main()
+    assert received == [['-c']]
+
+
+def test_daemon_handle_trigger(paste_folder, tmp_path, monkeypatch):
+    from rofipaste import daemon, trace
+    opened = []
+
+    def serve(handler):
+        raise AssertionError('a trigger started the daemon again')
+
+    monkeypatch.setattr(daemon, 'serve', serve)
+    monkeypatch.setattr(cli, 'serving', True)
+    monkeypatch.setattr(trace, 'enabled', False)
+    monkeypatch.setattr(trace, 'trace_file', str(tmp_path / 'trace.jsonl'))
+    monkeypatch.setattr(rofipaste, 'start_active_window',
+                        lambda: lambda: '42')
+    monkeypatch.setattr(rofipaste, 'open_main_rofi_window',
+                        lambda args, content, prompt: opened.append(args)
+                        or (1, ''))
+    (tmp_path / 'config').write_text('daemon=True\n')
+
+    assert cli.handle_trigger(['-f', str(paste_folder), '--trace']) == 0
+    assert trace.enabled
+    # The settings of a trigger do not leak into the next one
+    assert cli.handle_trigger(['-f', str(paste_folder)]) == 0
+    assert not trace.enabled
+    assert len(opened) == 2
+
+
+def test_watcher_events(paste_folder):
+    from rofipaste import index
+    from rofipaste.watcher import Watcher
+    watcher = Watcher(str(paste_folder), rofipaste.paste_icon_dict)
+    if watcher.inotify is None:
+        pytest.skip('inotify is not available')
+    watcher.watch_tree(watcher.root)
+    folder_index = index.get_folder_index(str(paste_folder),
+                                          rofipaste.paste_icon_dict)
+    assert folder_index.watched
+
+    (paste_folder / 'hello.py').write_text('#!/bin/sh\necho hello\n')
+    (paste_folder / 'date').unlink()
+    (paste_folder / 'sub' / 'deep').mkdir()
+    (paste_folder / 'sub' / 'deep' / 'new.sh').write_text('ls\n')
+    watcher.handle_events()
+    watcher.handle_events()
+
+    assert folder_index.entries['hello.py'].is_exec
+    assert 'date' not in folder_index.entries
+    deep_index = index.get_folder_index(str(paste_folder / 'sub' / 'deep'),
+                                        rofipaste.paste_icon_dict)
+    assert deep_index.watched
+    assert [e.filename for e in deep_index.get_entries()] == ['new.sh']
+
+
+def test_watcher_poll(paste_folder):
+    from rofipaste import index
+    from rofipaste.watcher import Watcher
+    watcher = Watcher(str(paste_folder), rofipaste.paste_icon_dict)
+    # As if inotify was missing or out of watches
+    watcher.inotify = None
+    watcher.watch_tree(watcher.root)
+    assert watcher.polled == {str(paste_folder), str(paste_folder / 'sub')}
+
+    (paste_folder / 'sub' / 'deep').mkdir()
+    (paste_folder / 'sub' / 'deep' / 'new.sh').write_text('ls\n')
+    watcher.poll()
+
+    deep = str(paste_folder / 'sub' / 'deep')
+    assert deep in watcher.polled
+    deep_index = index.get_folder_index(deep, rofipaste.paste_icon_dict)
+    assert [e.filename for e in deep_index.get_entries()] == ['new.sh']
+
+
+def test_parse_config():
+    from rofipaste import config
+    assert config.parse_config(config.default_config) == {}
+    assert config.parse_config(
+        'copy_only=True   # comment\n'
+        'prompt = "Paste # ❤ "  # comment\n'
+        "editor='termite -e \"nvim $FILE\"'\n") == {
+            'copy_only': True,
+            'prompt': 'Paste # ❤ ',
+            'editor': 'termite -e "nvim $FILE"'
+        }
+    with pytest.raises(ValueError):
+        config.parse_config('[section]\n')
+
+
+def test_parse_arguments():
+    assert cli.parse_arguments([]) == {}
+    assert cli.parse_arguments(['-c', '--prompt', 'p', '--files=f']) == {
+        'copy_only': True,
+        'prompt': 'p',
+        'files': 'f'
+    }
+    assert cli.parse_arguments(['--help']) is None
+    assert cli.parse_arguments(['--prompt']) is None
+
+
+def test_config_values(tmp_path, monkeypatch):
+    # The config values are converted like the command line ones
+    options = dict((cli.option_name(declarations), attrs)
+                   for declarations, attrs in cli.options)
+    assert cli.convert_value(options['clipboard_threshold'], '100') == 100
+    assert cli.convert_value(options['exec_timeout'], 60) == 60.0
+    assert cli.convert_value(options['copy_only'], 'False') is False
+    assert cli.convert_value(options['copy_only'], True) is True
+    assert cli.convert_value(options['prompt'], 'p') == 'p'
+    for name, value in (('copy_only', 'maybe'), ('type_delay', 'fast'),
+                        ('type_delay', True), ('prompt', None)):
+        with pytest.raises(ValueError):
+            cli.convert_value(options[name], value)
+
+    received = {}
+    monkeypatch.setattr(cli, 'run', lambda **params: received.update(params))
+    monkeypatch.setattr(config, 'config_file_name', str(tmp_path / 'config'))
+    (tmp_path / 'config').write_text('clipboard_threshold="100"\n'
+                                     'copy_only="False"\n')
+    cli.main([], standalone_mode=False)
+    assert received['clipboard_threshold'] == 100
+    assert received['copy_only'] is False
+
+
+def test_command_line_help():
+    runner = CliRunner()
+    help_result = runner.invoke(cli.get_command(), ['--help'])
+    assert help_result.exit_code == 0
+    assert '--insert-with-clipboard' in help_result.output
+
+
+def test_exec_cache(tmp_path, monkeypatch):
+    from rofipaste import exec_cache, index
+    monkeypatch.setattr(exec_cache, 'cache_folder', str(tmp_path / 'exec'))
+    entry = tmp_path / 'counter'
+    counter = tmp_path / 'count'
+    entry.write_text('#!/bin/sh\n# rofipaste: ttl=300\n'
+                     f'echo x >> {counter}; wc -l < {counter}\n')
+
+    assert index.get_entry_options(entry.read_text()) == {'ttl': '300'}
+    assert rofipaste.fileInterpreter(str(entry)) == '1'
+    assert rofipaste.fileInterpreter(str(entry)) == '1'
+    assert rofipaste.fileInterpreter(str(entry), use_cache=False) == '2'
+
+    # Private, and read back as it was written
+    exec_cache.put('crlf', 'token\r\n', 300)
+    assert exec_cache.get('crlf') == 'token\r\n'
+    assert os.stat(exec_cache.cache_folder).st_mode & 0o777 == 0o700
+    path = os.path.join(exec_cache.cache_folder, 'crlf')
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    monkeypatch.setattr(exec_cache, 'max_size', 0)
+    exec_cache.put('other', 'output', 300)
+    assert os.listdir(exec_cache.cache_folder) == []
+
+
+def test_prefetch(paste_folder, monkeypatch):
+    from subprocess import TimeoutExpired
+    from rofipaste import prefetch, runner
+    fast = paste_folder / 'fast'
+    fast.write_text('#!/bin/sh\n# rofipaste: prefetch\necho prefetched\n')
+    (paste_folder / 'slow').write_text(
+        '#!/bin/sh\n# rofipaste: prefetch\nsleep 30\n')
+
+    rofipaste.prefetch_folder(str(paste_folder))
+    assert {path for path, _ in prefetch.current.futures} == {
+        str(fast), str(paste_folder / 'slow')
+    }
+    assert rofipaste.fileInterpreter(str(fast)) == 'prefetched'
+
+    # An entry edited since its prefetch is run again
+    rofipaste.prefetch_folder(str(paste_folder))
+    fast.write_text('#!/bin/sh\n# rofipaste: prefetch\necho edited\n')
+    os.utime(fast, ns=(0, 0))
+    assert rofipaste.fileInterpreter(str(fast)) == 'edited'
+
+    start = time.monotonic()
+    prefetch.discard()
+    assert prefetch.current is None
+    assert prefetch.take(str(paste_folder / 'slow')) is None
+    assert time.monotonic() - start < 5
+
+    # A prefetched entry which times out is not run again
+    monkeypatch.setattr(runner, 'default_timeout', 0.2)
+    rofipaste.prefetch_folder(str(paste_folder))
+    monkeypatch.setattr(runner, 'execute', None)
+    with pytest.raises(TimeoutExpired):
+        rofipaste.fileInterpreter(str(paste_folder / 'slow'))
+    prefetch.discard()
+
+
+def test_clipboard_backend_fallback(monkeypatch):
+    from rofipaste import clipboard
+    monkeypatch.setattr(clipboard, '_backend', None)
+    monkeypatch.delenv('DISPLAY', raising=False)
+    assert clipboard.get_backend().name == 'xsel'
+
+
+def test_xlib_backend(monkeypatch):
+    from rofipaste import clipboard
+
+    class SelectionOwner:
+        """Owns the selections without an X server."""
+
+        max_size = 100
+
+        def __init__(self):
+            self.contents = {'CLIPBOARD': b'old'}
+            self.served = 0
+            self.serve = True
+            self.released = []
+
+        def own(self, selection, data):
+            self.contents[selection] = data
+            return True
+
+        def release(self, selection):
+            self.contents.pop(selection, None)
+            self.released.append(selection)
+
+        def convert(self, selection):
+            if selection == 'INCR':
+                return None
+            return self.contents.get(selection, b'').decode('utf-8')
+
+        def process_events(self, timeout):
+            # The target window reads the selection
+            if self.serve:
+                self.served += 1
+            time.sleep(timeout)
+
+    xsel = []
+
+    def xsel_set(self, characters, selection):
+        # xsel takes the selection over
+        self.owner.contents.pop(selection, None)
+        xsel.append((characters, selection))
+
+    monkeypatch.setattr(clipboard, 'SelectionOwner', SelectionOwner)
+    monkeypatch.setattr(clipboard.XselBackend, 'get',
+                        lambda self, selection: xsel.append(('get', selection))
+                        or 'xsel')
+    monkeypatch.setattr(clipboard.XselBackend, 'set', xsel_set)
+    monkeypatch.setattr(clipboard, 'paste_command', lambda window: ['true'])
+    backend = clipboard.XlibBackend()
+    owner = backend.owner
+
+    # Read in-process, through xsel when it needs the INCR protocol
+    assert backend.get('CLIPBOARD') == 'old'
+    assert backend.get('INCR') == 'xsel'
+    assert xsel == [('get', 'INCR')]
+
+    # Restored once the target window read the pasted selection
+    backend.paste('pasted', '42')
+    assert owner.served == 1
+    assert owner.released == ['PRIMARY']
+    # The old clipboard outlives a short-lived process: handed to xsel
+    assert xsel[1:] == [('old', 'CLIPBOARD')]
+
+    # Restored after paste_timeout when the selection is never read
+    monkeypatch.setattr(clipboard, 'paste_timeout', 0.1)
+    owner.serve = False
+    start = time.monotonic()
+    backend.paste('pasted', '42')
+    assert time.monotonic() - start < 5
+    assert owner.served == 1
+    assert owner.released == ['PRIMARY', 'CLIPBOARD', 'PRIMARY']
+
+    # Too big for a single X request: pasted with xsel
+    monkeypatch.setattr(clipboard.XselBackend, 'paste',
+                        lambda self, characters, window: xsel.append(
+                            (characters, window)))
+    backend.paste('x' * 101, '42')
+    assert xsel[2:] == [('x' * 101, '42')]
+
+    # Owned in-process by the daemon only
+    backend.set('copied', 'PRIMARY')
+    assert xsel[3:] == [('copied', 'PRIMARY')]
+    monkeypatch.setattr(clipboard, 'persistent', True)
+    monkeypatch.setattr(backend, '_serve_forever', lambda: None)
+    backend.set('copied', 'PRIMARY')
+    assert xsel[4:] == []
+    assert owner.contents['PRIMARY'] == b'copied'
+
+
+def test_typing_session(tmp_path, monkeypatch):
+    from rofipaste import keyboard
+    bin_folder = tmp_path / 'bin'
+    bin_folder.mkdir()
+    xdotool = bin_folder / 'xdotool'
+    xdotool.write_text(f'#!/bin/sh\necho "$@" > {tmp_path}/args\n'
+                       f'cat > {tmp_path}/typed\n')
+    xdotool.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_folder}:{os.environ["PATH"]}')
+    monkeypatch.setattr(keyboard, 'stats_file', str(tmp_path / 'typing.log'))
+    monkeypatch.setattr(keyboard, 'chunk_size', 3)
+
+    assert keyboard.type_text('héllo wörld', '42') > 0
+    assert (tmp_path / 'typed').read_text() == 'héllo wörld'
+    assert (tmp_path / 'args').read_text().split() == [
+        'type', '--window', '42', '--delay', '12', '--file', '-'
+    ]
+    assert 'characters=11' in (tmp_path / 'typing.log').read_text()
+
+
+def test_script_mode(paste_folder, tmp_path, monkeypatch, capsys):
+    import json
+    from rofipaste import script_mode
+    result = tmp_path / 'result.json'
+    monkeypatch.setenv('ROFIPASTE_ROOT', str(paste_folder))
+    monkeypatch.setenv('ROFIPASTE_RESULT', str(result))
+    monkeypatch.setenv('ROFI_RETV', '0')
+    monkeypatch.delenv('ROFI_DATA', raising=False)
+    monkeypatch.setattr('sys.argv', ['script_mode'])
+
+    script_mode.main()
+    output = capsys.readouterr().out
+    assert f'\0data\x1f{paste_folder}\n' in output
+    assert f'{rofipaste.folder_icon} sub\0info\x1fd:sub\n' in output
+
+    monkeypatch.setenv('ROFI_RETV', '1')
+    monkeypatch.setenv('ROFI_INFO', 'd:sub')
+    script_mode.main()
+    output = capsys.readouterr().out
+    assert f'\0data\x1f{paste_folder / "sub"}\n' in output
+    assert f'{rofipaste.undo_icon} ..\0info\x1fu:\n' in output
+    assert not result.exists()
+
+    monkeypatch.setenv('ROFI_RETV', '20')
+    monkeypatch.setenv('ROFI_INFO', 'f:hello.py')
+    script_mode.main()
+    assert capsys.readouterr().out == ''
+    assert json.loads(result.read_text()) == {
+        'kind': 'entry',
+        'path': str(paste_folder / 'hello.py'),
+        'returncode': 20
+    }
+
+    monkeypatch.setenv('ROFI_RETV', '11')
+    script_mode.main()
+    assert json.loads(result.read_text())['returncode'] == 11
+
+
+def test_read_tree_content(paste_folder):
+    (paste_folder / 'sub' / 'deep').mkdir()
+    (paste_folder / 'sub' / 'deep' / 'query.sh').write_text('ls\n')
+    (paste_folder / 'sub' / 'loop').symlink_to(paste_folder)
+
+    lines = rofipaste.read_tree_content(str(paste_folder)).splitlines()
+    assert sorted(lines[:2]) == sorted([
+        f'{rofipaste.paste_icon_dict["py"]} hello',
+        f'{rofipaste.paste_icon_dict[""]} date (exec)'
+    ])
+    assert lines[2:] == [
+        f'{rofipaste.paste_icon_dict["sh"]} sub/deep/query',
+        f'{rofipaste.edit_config_icon} Edit configuration file'
+    ]
+
+
+def test_usage_ranking(paste_folder, monkeypatch):
+    from rofipaste import usage
+    now = time.time()
+    assert usage.add_use(usage.add_use(None, now), now) == pytest.approx(
+        usage.add_use(None, now) + 1)
+    assert usage.add_use(None, now) > usage.add_use(None,
+                                                    now - usage.half_life)
+
+    usage.record(str(paste_folder / 'hello.py'), now)
+    usage.record(str(paste_folder / 'date'), now)
+    usage.record(str(paste_folder / 'date'), now)
+    scores = usage.get_scores(str(paste_folder))
+    assert scores[str(paste_folder / 'date')] > scores[str(paste_folder /
+                                                           'hello.py')]
+
+    lines = rofipaste.read_folder_content(str(paste_folder)).splitlines()
+    assert lines[:2] == [
+        f'{rofipaste.paste_icon_dict[""]} date (exec)',
+        f'{rofipaste.paste_icon_dict["py"]} hello'
+    ]
+
+    items = ['c', 'a', 'b', 'd']
+    usage.rank(items, lambda item: item, {'b': 2.0, 'd': 1.0})
+    assert items == ['b', 'd', 'c', 'a']
+
+    # A removed entry holds the items back until check_after of them arrived
+    monkeypatch.setattr(usage, 'check_after', 4)
+    scores = {'b': 2.0, 'd': 1.0, str(paste_folder / 'removed'): 3.0}
+    arrived = []
+
+    def stream():
+        for item in ['c', 'a', 'b', 'd', 'e']:
+            arrived.append(item)
+            yield item
+
+    ranked = usage.rank_stream(stream(), lambda item: item, scores)
+    assert next(ranked) == 'b'
+    assert arrived == ['c', 'a', 'b', 'd']
+    assert list(ranked) == ['d', 'c', 'a', 'e']
+
+    # The lowest scores are removed once every evict_every new rows
+    monkeypatch.setattr(usage, 'max_rows', 2)
+    monkeypatch.setattr(usage, 'evict_every', 4)
+    usage.record(str(paste_folder / 'old'), now - usage.half_life)
+    assert len(usage.get_scores(str(paste_folder))) == 3
+    usage.record(str(paste_folder / 'new'), now + 1)
+    assert set(usage.get_scores(str(paste_folder))) == {
+        str(paste_folder / 'date'), str(paste_folder / 'new')
+    }
+
+
+def test_recent_ring(paste_folder, monkeypatch):
+    from rofipaste import recent
+    monkeypatch.setattr(recent, 'slots', 3)
+    hello, date = str(paste_folder / 'hello.py'), str(paste_folder / 'date')
+    assert recent.get(0) is None
+
+    recent.push(hello)
+    recent.push(date)
+    assert recent.get(0) == (date, None)
+    assert recent.get(1) == (hello, 'print("hello")')
+    assert recent.get(2) is None
+
+    recent.push(hello)
+    assert recent.get(0) == (hello, 'print("hello")')
+    assert recent.get(1) == (date, None)
+
+    for name in ('a', 'b', 'c'):
+        (paste_folder / name).write_text(name)
+        recent.push(str(paste_folder / name))
+    assert [recent.get(i)[0] for i in range(3)] == [
+        str(paste_folder / name) for name in ('c', 'b', 'a')
+    ]
+    assert recent.get(3) is None
+
+    (paste_folder / 'c').write_text('changed')
+    assert recent.get(0) == (str(paste_folder / 'c'), None)
+
+
+def test_stream_big_entry(paste_folder, tmp_path, monkeypatch):
+    from rofipaste import clipboard
+    bin_folder = tmp_path / 'bin'
+    bin_folder.mkdir()
+    xsel = bin_folder / 'xsel'
+    xsel.write_text(f'#!/bin/sh\ncat > {tmp_path}/copied\n')
+    xsel.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_folder}:{os.environ["PATH"]}')
+    monkeypatch.setattr(rofipaste, 'stream_threshold', 16)
+    monkeypatch.setattr(clipboard, 'stream_chunk_size', 5)
+
+    big = paste_folder / 'big.txt'
+    big.write_text('ligne héhé\n' * 10 + ' \n\n')
+    data = rofipaste.read_entry_data(str(big))
+    assert isinstance(data, memoryview)
+    assert bytes(data) == ('ligne héhé\n' * 10).rstrip().encode('utf-8')
+
+    hello = str(paste_folder / 'hello.py')
+    assert isinstance(rofipaste.read_entry_data(hello), str)
+    (paste_folder / 'date').write_text('#!/bin/sh\necho' + ' ' * 20 + 'date\n')
+    assert rofipaste.read_entry_data(str(paste_folder / 'date')) == 'date'
+
+    clipboard.XselBackend().set(data)
+    assert (tmp_path / 'copied').read_bytes() == bytes(data)
+
+
+def test_runner(tmp_path, monkeypatch):
+    from subprocess import TimeoutExpired
+    from rofipaste import runner
+    assert runner.get_command('/e', '#!/usr/bin/env python3 -u\nprint()') == [
+        '/usr/bin/env', 'python3', '-u', '/e'
+    ]
+
+    entry = tmp_path / 'entry'
+    entry.write_text('#!/bin/sh -e\nprintf "a  "\nsleep 0.1\n'
+                     'printf "b \\n\\n"\n')
+    args = runner.get_command(str(entry), entry.read_text())
+    chunks = []
+
+    class Sink:
+
+        def write(self, data):
+            chunks.append(bytes(data))
+
+    assert runner.execute(args, Sink()) is None
+    assert b''.join(chunks) == b'a  b'
+    assert runner.execute(args) == 'a  b'
+
+    monkeypatch.setattr(runner, 'spool_threshold', 2)
+    output = runner.execute(args)
+    assert isinstance(output, memoryview) and bytes(output) == b'a  b'
+
+    entry.write_text('#!/bin/sh\nsleep 10 &\nsleep 10\n')
+    monkeypatch.setattr(runner, 'default_timeout', 0.2)
+    start = time.monotonic()
+    with pytest.raises(TimeoutExpired):
+        runner.execute(args)
+    assert time.monotonic() - start < 5
+
+
+def test_trace_stats(tmp_path, monkeypatch, capsys):
+    from rofipaste import trace
+    monkeypatch.setattr(trace, 'trace_file', str(tmp_path / 'trace.jsonl'))
+    monkeypatch.setattr(trace, 'enabled', True)
+    monkeypatch.setattr(trace, 'first_run', False)
+
+    for i in range(1, 101):
+        trace.begin()
+        trace.add('rofi', i / 1000)
+        with trace.stage('xsel'):
+            pass
+        with trace.stage('xsel'):
+            pass
+        trace.end(['-c'])
+
+    runs = trace.read(1000)
+    assert len(runs) == 100
+    assert set(runs[0]) == {'rofi', 'xsel', 'total'}
+    assert trace.percentile(sorted(run['rofi'] for run in runs), 95) == 95
+
+    cli.main(['stats', '--last', '50'], standalone_mode=False)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['stage', 'runs', 'p50', 'ms', 'p95', 'ms',
+                                'p99', 'ms']
+    assert lines[1].split() == ['rofi', '50', '75.0', '98.0', '100.0']
+    assert lines[-1].split()[0] == 'total'
+
+
+def test_pack(paste_folder, capsys):
+    from rofipaste import index, pack
+    folder = str(paste_folder)
+    (paste_folder / 'sub' / 'note.md').write_text('note\n')
+    expected = rofipaste.read_folder_content(folder)
+
+    cli.main(['pack', '-f', folder], standalone_mode=False)
+    assert 'Packed 3 entries' in capsys.readouterr().out
+    index._indexes.clear()
+    bundle = pack.load(folder, rofipaste.paste_icon_dict)
+    assert bundle is not None and index.bundle is bundle
+    assert rofipaste.read_folder_content(folder) == expected
+    assert index.get_folder_index(folder, rofipaste.paste_icon_dict).watched
+
+    # Read from the bundle, not from the file
+    hello = paste_folder / 'hello.py'
+    stat = hello.stat()
+    hello.write_text('print("HELLO")\n')
+    os.utime(hello, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.utime(paste_folder, ns=(stat.st_atime_ns, bundle.folders[''][0]))
+    assert rofipaste.fileInterpreter(str(hello)) == 'print("hello")'
+    assert rofipaste.fileInterpreter(str(paste_folder / 'sub' /
+                                         'note.md')) == 'note'
+
+    # A changed folder is packed again when the bundle is loaded
+    (paste_folder / 'sub' / 'new.txt').write_text('new')
+    pack.current = index.bundle = None
+    index._indexes.clear()
+    bundle = pack.load(folder, rofipaste.paste_icon_dict)
+    assert sorted(bundle.block('sub')) == ['new.txt', 'note.md']
+    assert bytes(bundle.content(str(paste_folder / 'sub' /
+                                    'new.txt'))) == b'new'
+    assert bytes(bundle.content(str(hello))) == b'print("hello")\n'
+
+    # So is a folder whose file was modified in place
+    note = paste_folder / 'sub' / 'note.md'
+    mtime = (paste_folder / 'sub').stat().st_mtime_ns
+    note.write_text('edited\n')
+    os.utime(note, ns=(0, 0))
+    os.utime(paste_folder / 'sub', ns=(0, mtime))
+    pack.current = index.bundle = None
+    index._indexes.clear()
+    bundle = pack.load(folder, rofipaste.paste_icon_dict)
+    assert bytes(bundle.content(str(note))) == b'edited\n'
+
+
+def test_pack_edit_entry(paste_folder, tmp_path, monkeypatch):
+    import click
+    import rofipaste as package
+    from rofipaste import index, pack
+    folder = str(paste_folder)
+    (paste_folder / 'snip.txt').write_text('old\n')
+    cli.main(['pack', '-f', folder], standalone_mode=False)
+    assert package.get('snip', folder) == 'old'
+
+    # Another process, which does not load the bundle
+    pack.current = index.bundle = None
+    index._indexes.clear()
+    editor = tmp_path / 'editor'
+    editor.write_text('#!/bin/sh\necho new > "$1"\n')
+    editor.chmod(0o755)
+    monkeypatch.setattr(click, 'prompt', lambda *args, **kwargs: 'snip.txt')
+    assert cli.main(['--edit-entry', '-f', folder, '-e', str(editor)],
+                    standalone_mode=False) == 0
+
+    pack.current = index.bundle = None
+    index._indexes.clear()
+    assert package.get('snip', folder) == 'new'
+
+
+def test_search(paste_folder, monkeypatch):
+    from rofipaste import search
+    folder = str(paste_folder)
+    (paste_folder / 'sub' / 'letter.md').write_text('Dear Sir,\n<regards>\n')
+    results = rofipaste.search_entries(folder, ['HELLO'])
+    assert [path for path, _, _ in results] == [str(paste_folder / 'hello.py')]
+    assert '<b>hello</b>' in results[0][2]
+    # Short terms and markup in the contents
+    results = rofipaste.search_entries(folder, ['regards', 'ir'])
+    assert results[0][1] == f'{rofipaste.paste_icon_dict[""]} sub/letter.md'
+    assert '&lt;' in results[0][2]
+    # The executable entries are not indexed
+    assert rofipaste.search_entries(folder, ['date']) == []
+
+    # Only the modified entries are read again
+    entries = {
+        os.path.join(folder, prefix, entry.filename): entry
+        for prefix, entry in rofipaste.walk_tree(folder)
+    }
+    assert search.update(folder, entries) == 0
+    (paste_folder / 'hello.py').write_text('print("bye")\n')
+    (paste_folder / 'sub' / 'letter.md').unlink()
+    assert rofipaste.search_entries(folder, ['hello']) == []
+    assert rofipaste.search_entries(folder, ['regards']) == []
+    assert len(rofipaste.search_entries(folder, ['bye'])) == 1
+
+    pasted = []
+    monkeypatch.setattr(rofipaste, 'open_main_rofi_window',
+                        lambda args, content, prompt: (0, '0\n'))
+    monkeypatch.setattr(rofipaste, 'paste_entry',
+                        lambda path, *args: pasted.append(path))
+    assert cli.run_search(folder, ['bye'], rofipaste.Action.TYPE, '42', '',
+                          '', '') == 0
+    assert pasted == [str(paste_folder / 'hello.py')]
+
+
+def test_plugin_entry(paste_folder, monkeypatch):
+    from rofipaste import plugins
+    entry = paste_folder / 'stamp.rpy'
+    entry.write_text('calls = []\n\n\ndef render():\n'
+                     '    calls.append(1)\n    return f"stamp {len(calls)}"\n')
+    content = rofipaste.read_folder_content(str(paste_folder))
+    assert f'{rofipaste.paste_icon_dict[""]} stamp.rpy (exec)' in content
+
+    # The module is kept between two pastes
+    assert rofipaste.fileInterpreter(str(entry)) == 'stamp 1'
+    assert rofipaste.fileInterpreter(str(entry)) == 'stamp 2'
+    # A new process reuses the compiled code
+    monkeypatch.setattr(plugins, '_modules', {})
+    monkeypatch.setattr(plugins, 'compile', None, raising=False)
+    assert rofipaste.fileInterpreter(str(entry)) == 'stamp 1'
+    monkeypatch.delattr(plugins, 'compile')
+
+    entry.write_text('def render():\n    return 42\n')
+    assert rofipaste.fileInterpreter(str(entry)) == '42'
+
+    # An executable entry with the inprocess option is not run
+    (paste_folder / 'host').write_text(
+        '#!/bin/false\n# rofipaste: inprocess\n'
+        'def render():\n    return "in process"\n')
+    assert rofipaste.fileInterpreter(str(paste_folder / 'host')) == \
+        'in process'
+    # Without a shebang, the option does nothing: the entry is static
+    static = paste_folder / 'static.py'
+    static.write_text('# rofipaste: inprocess\ndef render():\n    return 1\n')
+    assert rofipaste.fileInterpreter(str(static)).startswith('# rofipaste')
+    content = rofipaste.read_folder_content(str(paste_folder))
+    assert f'{rofipaste.paste_icon_dict["py"]} static\n' in content
+    assert f'{rofipaste.paste_icon_dict[""]} host (exec)' in content
+
+    entry.write_text('def render():\n    return 1 / 0\n')
+    with pytest.raises(plugins.PluginError, match='ZeroDivisionError'):
+        rofipaste.fileInterpreter(str(entry))
+
+
+def test_multi_select(paste_folder, tmp_path, monkeypatch):
+    # Each of these entries waits for the other one: they only print
+    # "together" if they run concurrently
+    for name, other in (('left', 'right'), ('right', 'left')):
+        (paste_folder / name).write_text(
+            f'#!/bin/sh\ntouch {tmp_path}/{name}\ni=0\n'
+            f'while [ ! -e {tmp_path}/{other} ] && [ $i -lt 50 ]; do\n'
+            '    sleep 0.1; i=$((i + 1))\ndone\n'
+            f'[ -e {tmp_path}/{other} ] && echo together || echo alone\n')
+    (paste_folder / 'sub' / 'note.md').write_text('note\n')
+    calls = []
+
+    def open_main_rofi_window(args, content, prompt):
+        calls.append(args)
+        rows = list(content)
+        # The rows are picked by their index, whatever their text
+        picked = [
+            rows.index(f'{rofipaste.paste_icon_dict["py"]} hello'),
+            rows.index(f'{rofipaste.paste_icon_dict[""]} date (exec)'),
+            rows.index(f'{rofipaste.paste_icon_dict[""]} left (exec)'),
+            rows.index(f'{rofipaste.paste_icon_dict[""]} right (exec)'),
+        ]
+        return 0, ''.join(f'{i} \n' for i in [*picked, picked[-1]])
+
+    monkeypatch.setattr(rofipaste, 'start_active_window',
+                        lambda: lambda: '42')
+    monkeypatch.setattr(rofipaste, 'open_main_rofi_window',
+                        open_main_rofi_window)
+    monkeypatch.setattr(rofipaste, 'default_handle',
+                        lambda data, action, window: calls.append(data))
+
+    assert cli.main(['-f', str(paste_folder), '--multi-select',
+                     '--separator', '\\n--\\n'],
+                    standalone_mode=False) == 0
+    assert '-multi-select' in calls[0]
+    date = calls[1].split('\n--\n')[1]
+    assert calls[1] == (f'print("hello")\n--\n{date}\n--\ntogether\n--\n'
+                        'together\n--\ntogether')
+
+    table = list(rofipaste.iter_tree_rows(str(paste_folder)))
+    note = [row.path for row in table].index(
+        str(paste_folder / 'sub' / 'note.md'))
+    assert table[note].kind == rofipaste.RowKind.ENTRY
+    assert table[-1].kind == rofipaste.RowKind.CONFIG
+    assert cli.get_picked_rows(f'{note} x\n-1 /help\n',
+                               table) == ([table[note]], '/help')
+
+
+def test_api(paste_folder, tmp_path, monkeypatch, capsys):
+    import io
+    import json
+    import rofipaste as package
+    (tmp_path / 'config').write_text(f'files="{paste_folder}"\n')
+    (paste_folder / 'sub' / 'note.md').write_text('note\n')
+
+    assert package.list_entries() == ['date', 'hello.py', 'sub/note.md']
+    assert package.get('hello') == 'print("hello")'
+    assert package.get('sub/note.md') == 'note'
+    assert package.get_many(['hello.py', 'sub/note']) == [
+        'print("hello")', 'note'
+    ]
+    for name in ('nothing', 'sub', '../pastes/hello', '/etc/passwd'):
+        with pytest.raises(package.EntryNotFound):
+            package.get(name)
+
+    cli.main(['list'], standalone_mode=False)
+    assert capsys.readouterr().out == 'date\nhello.py\nsub/note.md\n'
+    cli.main(['get', '-0', 'hello', 'sub/note'], standalone_mode=False)
+    assert capsys.readouterr().out == 'print("hello")\0note\0'
+
+    monkeypatch.setattr(sys, 'stdin',
+                        io.TextIOWrapper(io.BytesIO(b'date\nnothing\n')))
+    cli.main(['get', '--batch', 'hello'], standalone_mode=False)
+    results = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert results[0] == {'name': 'hello', 'text': 'print("hello")'}
+    assert results[1]['name'] == 'date' and results[1]['text']
+    assert results[2] == {'name': 'nothing', 'error': 'not found'}
+
+
+def test_streamed_menu(paste_folder, tmp_path, monkeypatch):
+    from rofipaste import index, usage
+    for i in range(100):
+        (paste_folder / f'entry_{i}.txt').write_text(f'{i}\n')
+    usage.record(str(paste_folder / 'entry_42.txt'))
+
+    # The rows come while the folder is scanned, before it is indexed
+    rows = rofipaste.iter_folder_content(str(paste_folder))
+    first = next(rows)
+    assert first == f'{rofipaste.paste_icon_dict[""]} entry_42.txt'
+    assert index._indexes[str(paste_folder)].entries == {}
+    rest = list(rows)
+    assert rest[-2:] == [
+        f'{rofipaste.folder_icon} sub',
+        f'{rofipaste.edit_config_icon} Edit configuration file'
+    ]
+    assert ''.join(row + '\n' for row in [first, *rest]) == \
+        rofipaste.read_folder_content(str(paste_folder))
+
+    # rofi picks a row and exits before reading the whole menu
+    bin_folder = tmp_path / 'bin'
+    bin_folder.mkdir()
+    rofi = bin_folder / 'rofi'
+    rofi.write_text(f'#!/bin/sh\necho "$*" > {tmp_path}/args\n'
+                    'head -n 2 | tail -n 1\nexit 20\n')
+    rofi.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_folder}:{os.environ["PATH"]}')
+    menu = (f'row {i}' for i in range(1000000))
+    assert rofipaste.open_main_rofi_window(['-theme', 'x'], menu,
+                                           'prompt') == (20, 'row 1\n')
+    assert '-async-pre-read 25 -theme x' in (tmp_path / 'args').read_text()
+
+
+def test_write_rows_flush():
+    import select
+    import threading
+    read_fd, write_fd = os.pipe()
+    stalls = {rofipaste.async_pre_read: threading.Event(),
+              28: threading.Event()}
+
+    def rows():
+        for i in range(30):
+            if i in stalls:
+                # A slow stat on a network file system
+                stalls[i].wait(5)
+            yield f'row {i}'
+
+    def read_until(row):
+        data = b''
+        while f'{row}\n'.encode() not in data:
+            assert select.select([read_fd], [], [], 2)[0], data
+            data += os.read(read_fd, 65536)
+        return data
+
+    writer = threading.Thread(target=rofipaste.write_rows,
+                              args=(os.fdopen(write_fd, 'w'), rows()))
+    writer.start()
+    try:
+        # The rows rofi waits for, then the ones written before a stall,
+        # reach it while the producer is blocked
+        read_until(f'row {rofipaste.async_pre_read - 1}')
+        stalls[rofipaste.async_pre_read].set()
+        read_until('row 27')
+    finally:
+        for stall in stalls.values():
+            stall.set()
+        writer.join()
+        os.close(read_fd)
+
+
+def test_clipboard_history(paste_folder, tmp_path, monkeypatch, capsys):
+    import json
+    from rofipaste import history, script_mode
+    monkeypatch.setattr(history, 'max_size', 100)
+    copies = iter(['first', 'first', '#!/bin/sh\nrm -rf /\n', 'a & b',
+                   'first', 'x' * 101, ''])
+    history.capture(lambda: next(copies), interval=0, count=7)
+
+    # The contents are deduplicated, the most recent first
+    rows = list(rofipaste.iter_history_rows())
+    assert [row.text for row in rows] == [
+        f'{rofipaste.clip_icon} first', f'{rofipaste.clip_icon} a &amp; b',
+        f'{rofipaste.clip_icon} #!/bin/sh rm -rf /'
+    ]
+    assert all(row.kind == rofipaste.RowKind.CLIP for row in rows)
+    # The oldest contents are removed above max_size
+    history.push('y' * 92)
+    assert [history.read(row.path) for row in rofipaste.iter_history_rows()
+            ] == ['y' * 92, 'first']
+
+    # A virtual folder of the top folder only
+    menu = list(rofipaste.iter_menu_rows(str(paste_folder),
+                                         str(paste_folder)))
+    assert menu[-2].kind == rofipaste.RowKind.HISTORY
+    assert rofipaste.RowKind.HISTORY not in [
+        row.kind for row in rofipaste.iter_menu_rows(
+            str(paste_folder / 'sub'), str(paste_folder))
+    ]
+
+    # Picking the folder, then a content, which is pasted as it is
+    pasted = []
+    picks = iter([len(menu) - 2, 1])
+    monkeypatch.setattr(rofipaste, 'start_active_window',
+                        lambda: lambda: '42')
+
+    def open_main_rofi_window(args, content, prompt):
+        list(content)
+        return 0, f'{next(picks)} \n'
+
+    monkeypatch.setattr(rofipaste, 'open_main_rofi_window',
+                        open_main_rofi_window)
+    monkeypatch.setattr(rofipaste, 'default_handle',
+                        lambda data, action, window: pasted.append(data))
+    assert cli.main(['-f', str(paste_folder)], standalone_mode=False) == 0
+    assert pasted == ['y' * 92]
+
+    # In script mode
+    result = tmp_path / 'result.json'
+    monkeypatch.setenv('ROFIPASTE_ROOT', str(paste_folder))
+    monkeypatch.setenv('ROFIPASTE_RESULT', str(result))
+    monkeypatch.setenv('ROFI_RETV', '1')
+    monkeypatch.setenv('ROFI_INFO', 'h:')
+    monkeypatch.delenv('ROFI_DATA', raising=False)
+    monkeypatch.setattr('sys.argv', ['script_mode'])
+    script_mode.main()
+    output = capsys.readouterr().out
+    assert f'\0data\x1f{history.history_folder}\n' in output
+    key = history.get_key(b'first')
+    assert f'{rofipaste.clip_icon} first\0info\x1fk:{key}\n' in output
+    monkeypatch.setenv('ROFI_INFO', f'k:{key}')
+    monkeypatch.setenv('ROFI_DATA', history.history_folder)
+    script_mode.main()
+    assert json.loads(result.read_text()) == {
+        'kind': 'clip',
+        'path': os.path.join(history.history_folder, key),
+        'returncode': 0
+    }
+
+    # A content which is not UTF-8, read with xsel
+    from rofipaste import clipboard
+    import rofipaste as package
+    fakes = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                         'benchmarks', 'fakes')
+    monkeypatch.setenv('PATH', f'{fakes}:{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_X_STATE', str(tmp_path))
+    monkeypatch.setattr(clipboard, 'backend_name', 'xsel')
+    monkeypatch.setattr(clipboard, '_backend', None)
+    (tmp_path / 'clipboard').write_bytes(b'caf\xe9')
+    history.capture(package.get_clipboard_content, count=1)
+    assert history.read(next(rofipaste.iter_history_rows()).path) == \
+        'caf\ufffd'
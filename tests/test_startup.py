@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Startup time regression tests for `rofipaste`.
+
+The budgets can be tuned for slow CI machines with the
+ROFIPASTE_IMPORT_BUDGET_MS and ROFIPASTE_STARTUP_BUDGET_MS environment
+variables.
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which must not be loaded when the menu is opened
+heavy_modules = [
+    'click', 'click_config_file', 'configobj', 'xdg', 'typing', 'ctypes',
+    'pathlib', 'rofipaste.watcher'
+]
+
+import_budget_ms = float(os.environ.get('ROFIPASTE_IMPORT_BUDGET_MS', 100))
+startup_budget_ms = float(os.environ.get('ROFIPASTE_STARTUP_BUDGET_MS', 150))
+
+
+@pytest.fixture
+def env(tmp_path):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root
+    for variable in ('XDG_CONFIG_HOME', 'XDG_DATA_HOME', 'XDG_CACHE_HOME'):
+        env[variable] = str(tmp_path / variable.lower())
+    return env
+
+
+def importtime(env):
+    """Return the cumulative import time in µs of each imported module."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import rofipaste.cli'],
+        env=env,
+        capture_output=True,
+        encoding='utf-8',
+        check=True).stderr
+
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_no_heavy_imports(env):
+    modules = importtime(env)
+    assert 'rofipaste.cli' in modules
+    assert [name for name in heavy_modules if name in modules] == []
+
+
+def test_import_budget(env):
+    # The first run may have to compile the modules
+    cumulative = min(importtime(env)['rofipaste.cli'] for _ in range(3))
+    assert cumulative / 1000 < import_budget_ms
+
+
+def test_startup_budget(env):
+
+    def best_time(code):
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    interpreter = best_time('pass')
+    startup = best_time('from rofipaste.cli import main; main(["--version"])')
+    assert (startup - interpreter) * 1000 < startup_budget_ms